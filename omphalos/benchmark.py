@@ -0,0 +1,775 @@
+#!/usr/bin/env python
+'''
+Micro benchmarks for the omphalos plugins
+
+Usage: benchmark.py <name> [<name> ...]
+'''
+
+import bz2
+import cPickle as pickle
+import gzip
+import io
+import json
+import marshal
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from collections import deque
+
+from collector.aggregate import Aggregate
+from collector.sharded import Sharded
+from collector.slider import Slider
+from collector.snapshot import Snapshotter
+from collector.store import EventStore
+from common.base import Data
+from common.codec import encode_batch, encode_delta
+from common import wire
+from common.symbols import SymbolTable
+from monitor.base import Monitor
+from monitor.parallel import scan
+from monitor.reader import scan_lines
+from monitor.replay import Replay
+from parser.clf import CLFParser
+from transport.delta import DeltaTransport
+from transport.dummy import Dummy
+from transport.queued import Queued
+from transport.spool import Spool
+from transport.tcp import TCPReceiver, TCPSender
+from transport.udp import UDPReceiver, UDPSender
+
+# Number of records pushed through a plugin for every measurement
+RECORDS = 200000
+
+
+def _timeit(func, *args):
+    '''Run a function and return the time taken in seconds'''
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def _records(count, cardinality, offset=0):
+    '''Generate records spread over a given number of unique URIs'''
+    now = datetime.now()
+    return [Data(uri='/%d' % ((offset + idx) % cardinality),
+                 timestamp=now, size='512', status='200', method='GET',
+                 referer='http://example.com/%d' % (idx % 100),
+                 user=None)
+            for idx in xrange(count)]
+
+
+def _clf_lines(count):
+    '''Generate lines in the combined log format'''
+    rand = random.Random(count)
+    start = datetime(2013, 2, 5, 10, 0, 0)
+    agents = ['Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.17',
+              'Mozilla/5.0 (compatible; Googlebot/2.1)',
+              'curl/7.29.0']
+
+    lines = []
+    for idx in xrange(count):
+        timestamp = start + timedelta(seconds=idx / 20)
+        lines.append('10.0.%d.%d - %s [%s +0530] "%s /%s/%d?page=%d '
+                     'HTTP/1.1" %s %s "%s" "%s"' % (
+                         rand.randint(0, 255), rand.randint(0, 255),
+                         rand.choice(['-', '-', 'alice', 'bob']),
+                         timestamp.strftime('%d/%b/%Y:%H:%M:%S'),
+                         rand.choice(['GET', 'GET', 'GET', 'POST']),
+                         rand.choice(['static', 'blog', 'api']),
+                         int(rand.paretovariate(1.2)), rand.randint(1, 5),
+                         rand.choice(['200', '200', '304', '404']),
+                         rand.choice(['-', str(rand.randint(100, 50000))]),
+                         rand.choice(['-', 'http://example.com/']),
+                         rand.choice(agents)))
+    return lines
+
+
+def _refresh(collector):
+    '''Make the queries of a refresh of the console'''
+    collector.get_summary()
+    for dtype in ('status', 'method', 'referer', 'user'):
+        collector.get_top(dtype, 15)
+    for uri, _ in collector.get_top('hits', 15):
+        collector.get_uri_data(uri, 'size')
+
+
+def bench_aggregate():
+    '''
+    Ingest rate of the Aggregate collector as the number of unique keys
+    that it is holding grows
+    '''
+
+    def add(collector, records):
+        for data in records:
+            collector.add_data(data)
+
+    def remove(collector, records):
+        for data in records:
+            collector.remove_data(data)
+
+    print('%12s %15s %15s' % ('keys', 'add lines/s', 'remove lines/s'))
+
+    for cardinality in (1000, 10000, 100000, 1000000):
+        collector = Aggregate({}, 0)
+
+        # Fill up the collector so that it holds every key
+        add(collector, _records(cardinality, cardinality))
+
+        records = _records(RECORDS, cardinality, offset=cardinality / 2)
+        added = _timeit(add, collector, records)
+        removed = _timeit(remove, collector, records)
+
+        print('%12d %15d %15d' % (cardinality, RECORDS / added,
+                                  RECORDS / removed))
+
+
+def bench_delta():
+    '''
+    Bytes sent to the collector and time taken by the collector, for a
+    minute of traffic sent as records versus as deltas aggregated at the
+    source, for different numbers of unique URIs
+    '''
+
+    class Recorder(object):
+        '''A transport which keeps the deltas sent on it'''
+        def __init__(self):
+            self.deltas = []
+
+        def send_delta(self, delta):
+            self.deltas.append(delta)
+
+    start = datetime.now().replace(microsecond=0)
+
+    print('%12s %12s %15s %15s' % ('cardinality', 'mode', 'bytes',
+                                   'collector ms'))
+
+    for cardinality in (100, 10000):
+        records = [data._replace(timestamp=start + timedelta(
+                   seconds=idx * 60.0 / RECORDS))
+                   for idx, data in enumerate(_records(RECORDS, cardinality))]
+
+        sent = sum(len(encode_batch(records[idx:idx + 1000], 1))
+                   for idx in xrange(0, RECORDS, 1000))
+        elapsed = _timeit(Slider({}, 120).add_batch, records)
+        print('%12d %12s %15d %15.1f' % (cardinality, 'records', sent,
+                                         elapsed * 1000))
+
+        recorder = Recorder()
+        transport = DeltaTransport({}, recorder)
+        transport.send_batch(records)
+        transport.close()
+
+        sent = sum(len(encode_delta(delta, 1)) for delta in recorder.deltas)
+        collector = Slider({}, 120)
+        elapsed = _timeit(lambda: [collector.add_delta(delta)
+                                   for delta in recorder.deltas])
+        print('%12d %12s %15d %15.1f' % (cardinality, 'deltas', sent,
+                                         elapsed * 1000))
+
+
+def bench_expiry():
+    '''
+    Latency of adding data to the Slider collector while a burst of data
+    is expiring, with expiry done inline versus on a background thread
+    '''
+    print('%12s %12s %12s %12s' % ('expiry', 'p50 ms', 'p99 ms', 'max ms'))
+
+    for name, conf in (('inline', {}),
+                       ('background', {'expire_interval': 0.1})):
+        collector = Slider(conf, 1)
+        collector.add_batch(_records(RECORDS, 10000))
+
+        # Trickle data in until well after the burst has expired
+        latencies = []
+        while len(latencies) < 2000:
+            data = _records(1, 10000)[0]
+            latencies.append(_timeit(collector.add_data, data) * 1000)
+            time.sleep(0.001)
+
+        collector.close()
+        latencies.sort()
+        print('%12s %12.3f %12.3f %12.3f' % (
+            name, latencies[len(latencies) / 2],
+            latencies[len(latencies) * 99 / 100], latencies[-1]))
+
+
+def bench_parallel():
+    '''
+    Throughput of parsing and aggregating a whole log file with a pool of
+    processes, for an increasing number of processes
+    '''
+    handle, path = tempfile.mkstemp(suffix='.log')
+    try:
+        with os.fdopen(handle, 'w') as logfile:
+            lines = '\n'.join(_clf_lines(RECORDS)) + '\n'
+            for idx in xrange(5):
+                logfile.write(lines)
+
+        print('%12s %15s' % ('processes', 'lines/s'))
+
+        jobs = 1
+        while jobs <= max(multiprocessing.cpu_count(), 2):
+            elapsed = _timeit(scan, path, CLFParser, jobs)
+            print('%12d %15d' % (jobs, RECORDS * 5 / elapsed))
+            jobs *= 2
+    finally:
+        os.remove(path)
+
+
+def bench_pipeline():
+    '''
+    Throughput of reading, parsing and collecting a burst of log lines,
+    one line at a time versus in batches
+    '''
+
+    def per_line(path, parser, transport):
+        with open(path) as handle:
+            line = handle.readline()
+            while line:
+                data = parser.parse_line(line.strip())
+                if data:
+                    transport.send(data)
+                line = handle.readline()
+
+    def batched(path, parser, transport):
+        monitor = Monitor({}, transport)
+        monitor.parser = parser
+        monitor.transport = transport
+
+        with io.open(path, 'rb') as handle:
+            monitor.consume(handle)
+
+    handle, path = tempfile.mkstemp(suffix='.log')
+    try:
+        with os.fdopen(handle, 'w') as logfile:
+            logfile.write('\n'.join(_clf_lines(RECORDS)) + '\n')
+
+        print('%12s %15s' % ('mode', 'lines/s'))
+
+        for name, func in (('per line', per_line), ('batched', batched)):
+            transport = Dummy(collector=Aggregate({}, 0))
+            elapsed = _timeit(func, path, CLFParser(path), transport)
+            print('%12s %15d' % (name, RECORDS / elapsed))
+    finally:
+        os.remove(path)
+
+
+def bench_archive():
+    '''
+    Throughput of replaying a log file through the Aggregate collector,
+    uncompressed and compressed with each of the supported formats
+    '''
+    data = '\n'.join(_clf_lines(RECORDS)) + '\n'
+    directory = tempfile.mkdtemp()
+
+    try:
+        files = [('plain', 'access.log', io.open)]
+        files.append(('gzip', 'access.log.gz', gzip.open))
+        files.append(('bzip2', 'access.log.bz2', bz2.BZ2File))
+
+        print('%12s %15s' % ('format', 'lines/s'))
+
+        for name, filename, opener in files:
+            path = os.path.join(directory, filename)
+            with opener(path, 'wb') as handle:
+                handle.write(data)
+
+            transport = Dummy(collector=Aggregate({}, 0))
+            monitor = Replay({}, transport, CLFParser(path), path)
+            print('%12s %15d' % (name, RECORDS / _timeit(monitor.run)))
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_clf():
+    '''
+    Parsing rate of the CLF parser using the regular expression and using
+    the delimiter based fast path, on the same lines
+    '''
+
+    class RegexCLFParser(CLFParser):
+        def _split_line(self, line):
+            return None
+
+    lines = _clf_lines(RECORDS)
+    results = {}
+
+    print('%12s %15s' % ('parser', 'lines/s'))
+
+    for name, parser in (('regex', RegexCLFParser('')),
+                         ('fast', CLFParser(''))):
+        start = time.time()
+        results[name] = [parser.parse_line(line) for line in lines]
+        print('%12s %15d' % (name, RECORDS / (time.time() - start)))
+
+    if results['regex'] != results['fast']:
+        print('ERROR: The parsers returned different data')
+
+
+def bench_sharded():
+    '''
+    Ingest rate of the Sharded collector for an increasing number of
+    worker processes, against a single Slider, and the time taken by the
+    queries of a refresh of the console
+    '''
+    parser = CLFParser('')
+    records = [parser.parse_line(line) for line in _clf_lines(RECORDS)]
+    batches = [records[idx:idx + 5000]
+               for idx in xrange(0, len(records), 5000)]
+
+    def add(collector):
+        for batch in batches:
+            collector.add_batch(batch)
+        # Wait for the workers to take in all the data
+        collector.get_summary()
+
+    print('%12s %15s %15s' % ('shards', 'lines/s', 'refresh ms'))
+
+    for shards in (0, 1, 2, 4, multiprocessing.cpu_count()):
+        # The windows go by the time in the log
+        conf = {'shards': shards, 'event_time': True}
+        collector = Sharded(conf, 3600) if shards else Slider(conf, 3600)
+
+        added = _timeit(add, collector)
+        refreshed = _timeit(_refresh, collector)
+        collector.close()
+
+        print('%12s %15d %15.1f' % (shards or 'slider', RECORDS / added,
+                                    refreshed * 1000))
+
+
+def bench_snapshot():
+    '''
+    Time taken by the queries of a refresh of the console, reading from a
+    Slider while data is being added to it, and reading from snapshots of
+    it, along with the rate at which the data is added meanwhile
+    '''
+
+    def feed(collector, stopped):
+        while not stopped.is_set():
+            collector.add_batch(_records(1000, 100000))
+
+    print('%12s %15s %15s' % ('reads', 'refresh ms', 'add lines/s'))
+
+    for name in ('live', 'snapshot'):
+        slider = Slider({}, 3600)
+        slider.add_batch(_records(RECORDS, 100000))
+        collector = slider
+        if name == 'snapshot':
+            collector = Snapshotter({}, slider)
+
+        added = slider.total['hits']
+        stopped = threading.Event()
+        feeder = threading.Thread(target=feed, args=(collector, stopped))
+        feeder.start()
+
+        # Refresh continuously for a few seconds
+        refreshes = 0
+        taken = 0.0
+        start = time.time()
+        while time.time() - start < 3:
+            view = collector.get_snapshot() if name == 'snapshot' \
+                else collector
+            taken += _timeit(_refresh, view)
+            refreshes += 1
+        elapsed = time.time() - start
+
+        stopped.set()
+        feeder.join()
+        added = slider.total['hits'] - added
+        if name == 'snapshot':
+            collector.close()
+
+        print('%12s %15.3f %15d' % (name, taken * 1000 / refreshes,
+                                    added / elapsed))
+
+
+def bench_spool():
+    '''
+    Throughput of spooling data to disk while the next transport is
+    healthy, stalling or down, for different fsync intervals
+    '''
+
+    class Downstream(object):
+        '''A transport which is healthy, stalls on every batch, or fails'''
+        def __init__(self, state):
+            self.state = state
+
+        def send_batch(self, batch):
+            if self.state == 'stalling':
+                time.sleep(0.1)
+            elif self.state == 'down':
+                raise IOError('Unreachable')
+
+    batches = [_records(1000, 10000, idx * 1000) for idx in xrange(100)]
+
+    print('%12s %12s %15s' % ('downstream', 'fsync', 'records/s'))
+
+    for state in ('healthy', 'stalling', 'down'):
+        for interval in (0, 1.0):
+            directory = tempfile.mkdtemp()
+            try:
+                spool = Spool({'spool_dir': directory,
+                               'fsync_interval': interval},
+                              Downstream(state))
+
+                start = time.time()
+                for batch in batches:
+                    spool.send_batch(batch)
+                elapsed = time.time() - start
+
+                spool.close()
+            finally:
+                shutil.rmtree(directory)
+
+            print('%12s %12s %15d' % (state, interval or 'every batch',
+                                      len(batches) * 1000 / elapsed))
+
+
+def bench_store():
+    '''
+    Memory taken per request retained by the sliding window, kept as Data
+    in a deque versus in the compact EventStore
+    '''
+
+    def max_rss():
+        # Kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    lines = _clf_lines(RECORDS)
+
+    print('%16s %15s' % ('store', 'bytes/request'))
+
+    # The peak memory only grows, so measure the smaller ones first
+    for name, store, parser in (
+            ('compact', EventStore(), CLFParser('')),
+            ('deque (interned)', deque(),
+             CLFParser('', symbols=SymbolTable())),
+            ('deque', deque(), CLFParser(''))):
+        start = max_rss()
+        for line in lines:
+            store.append(parser.parse_line(line))
+
+        print('%16s %15d' % (name, (max_rss() - start) / RECORDS))
+
+
+def bench_vector():
+    '''
+    Ingest rate of the numpy based VectorAggregate collector against the
+    Aggregate collector, for batches of a million lines
+    '''
+    try:
+        from collector.vector import VectorAggregate
+    except ImportError:
+        print('numpy is required for this benchmark')
+        return
+
+    batch = _records(1000000, 100000)
+    columns = dict(zip(Data._fields, zip(*batch)))
+
+    print('%24s %15s' % ('collector', 'lines/s'))
+
+    results = {}
+    for name, collector, func, arg in (
+            ('Aggregate.add_batch', Aggregate({}, 0), 'add_batch', batch),
+            ('Vector.add_batch', VectorAggregate({}, 0), 'add_batch', batch),
+            ('Vector.add_columns', VectorAggregate({}, 0), 'add_columns',
+             columns)):
+        elapsed = _timeit(getattr(collector, func), arg)
+        # Entries with equal counts may be ordered differently
+        results[name] = [[value for key, value in collector.get_top(dtype, 10)]
+                         for dtype in ('hits', 'size', 'status', 'referer')]
+        print('%24s %15d' % (name, len(batch) / elapsed))
+
+    if len(set(str(result) for result in results.values())) != 1:
+        print('ERROR: The collectors returned different data')
+
+
+def bench_queued():
+    '''
+    Latency of sending batches of data to a collector which stalls now and
+    then (e.g. while expiring data), sent directly versus through a queue
+    with each of the overflow policies
+    '''
+
+    class Stalling(Aggregate):
+        '''An aggregate which stalls on every 20th batch'''
+        batches = 0
+
+        def add_batch(self, batch):
+            self.batches += 1
+            if self.batches % 20 == 0:
+                time.sleep(0.05)
+            super(Stalling, self).add_batch(batch)
+
+    batches = [_records(1000, 10000, idx * 1000) for idx in xrange(200)]
+
+    print('%12s %12s %12s %12s %12s' % ('transport', 'p99 ms', 'max ms',
+                                        'dropped', 'sampled'))
+
+    transports = [('direct', Dummy(collector=Stalling({}, 0)))]
+    for policy in ('block', 'drop-oldest', 'sample'):
+        conf = {'queue_size': 50000, 'batch_size': 1000, 'overflow': policy}
+        transports.append((policy, Queued(conf, Stalling({}, 0))))
+
+    for name, transport in transports:
+        latencies = []
+        for batch in batches:
+            latencies.append(_timeit(transport.send_batch, batch) * 1000)
+            time.sleep(0.01)
+
+        stats = {}
+        if isinstance(transport, Queued):
+            transport.close()
+            stats = transport.stats()
+
+        latencies.sort()
+        print('%12s %12.3f %12.3f %12d %12d' % (
+            name, latencies[len(latencies) * 99 / 100], latencies[-1],
+            stats.get('dropped', 0), stats.get('sampled', 0)))
+
+
+def bench_reader():
+    '''
+    Rate of reading the lines of a file in chunks versus through a memory
+    map, for the first scan and for a scan of the same file again
+    '''
+
+    def chunked(path):
+        partial = ''
+        with io.open(path, 'rb') as handle:
+            chunk = handle.read(1024 * 1024)
+            while chunk:
+                lines = (partial + chunk).split('\n')
+                partial = lines.pop()
+                chunk = handle.read(1024 * 1024)
+
+    def mapped(path):
+        for lines in scan_lines(path):
+            pass
+
+    handle, path = tempfile.mkstemp(suffix='.log')
+    try:
+        with os.fdopen(handle, 'w') as logfile:
+            lines = '\n'.join(_clf_lines(RECORDS)) + '\n'
+            for idx in xrange(10):
+                logfile.write(lines)
+
+        print('%12s %15s %15s' % ('reader', 'first MB/s', 'again MB/s'))
+
+        size = os.path.getsize(path) / 1024.0 / 1024.0
+        for name, func in (('chunked', chunked), ('mmap', mapped)):
+            first = _timeit(func, path)
+            again = _timeit(func, path)
+            print('%12s %15d %15d' % (name, size / first, size / again))
+    finally:
+        os.remove(path)
+
+
+def bench_replay():
+    '''
+    Throughput of replaying a log file through the Slider collector in
+    event time mode, for each way of storing the window
+    '''
+    handle, path = tempfile.mkstemp(suffix='.log')
+    try:
+        with os.fdopen(handle, 'w') as logfile:
+            logfile.write('\n'.join(_clf_lines(RECORDS)) + '\n')
+
+        print('%12s %15s' % ('window', 'lines/s'))
+
+        for name, conf in (('records', {}),
+                           ('compact', {'compact': True}),
+                           ('buckets', {'bucket_size': 5})):
+            conf['event_time'] = True
+            transport = Dummy(collector=Slider(conf, 120))
+            monitor = Replay({}, transport, CLFParser(path), path)
+            print('%12s %15d' % (name, RECORDS / _timeit(monitor.run)))
+    finally:
+        os.remove(path)
+
+
+def bench_tcp():
+    '''
+    Throughput of sending data to a collector over a loopback TCP
+    connection, for different frame sizes, with and without compression
+    '''
+    records = _records(RECORDS, 10000)
+
+    print('%12s %12s %15s %15s' % ('flush size', 'compress', 'records/s',
+                                   'bytes/record'))
+
+    for flush_size in (100, 1000, 10000):
+        for level in (0, 1):
+            collector = Aggregate({}, 0)
+            receiver = TCPReceiver({'host': '127.0.0.1', 'port': 0},
+                                   collector)
+            thread = threading.Thread(target=receiver.run)
+            thread.start()
+
+            conf = {'host': '127.0.0.1', 'port': receiver.address[1],
+                    'flush_size': flush_size, 'compress': level}
+            sender = TCPSender(conf)
+
+            start = time.time()
+            for idx in xrange(0, RECORDS, 1000):
+                sender.send_batch(records[idx:idx + 1000])
+            sender.close()
+
+            while receiver.received < RECORDS:
+                time.sleep(0.01)
+            elapsed = time.time() - start
+
+            receiver.exit()
+            thread.join()
+
+            sent = sum(len(encode_batch(records[idx:idx + flush_size],
+                                        level))
+                       for idx in xrange(0, 20000, flush_size))
+            print('%12d %12d %15d %15.1f' % (flush_size, level,
+                                             RECORDS / elapsed,
+                                             sent / 20000.0))
+
+
+def _udp_send(port, rate):
+    '''Send records to a UDP receiver at a given rate per second'''
+    records = _records(RECORDS, 10000)
+    sender = UDPSender({'host': '127.0.0.1', 'port': port})
+
+    start = time.time()
+    for idx in xrange(0, RECORDS, 1000):
+        sender.send_batch(records[idx:idx + 1000])
+        delay = start + (idx + 1000) / float(rate) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+    sender.close()
+
+
+def bench_udp():
+    '''
+    Throughput and loss of sending data over loopback UDP, with the sender
+    in another process, for increasing rates of sending. The data received
+    is discarded, so that only the transport is measured
+    '''
+
+    class Discard(object):
+        '''A collector which ignores the data'''
+        def add_batch(self, batch):
+            pass
+
+    print('%12s %15s %15s %12s' % ('rate', 'sent/s', 'received/s', 'loss'))
+
+    for rate in (50000, 100000, 200000):
+        collector = Discard()
+        receiver = UDPReceiver({'host': '127.0.0.1', 'port': 0}, collector)
+        thread = threading.Thread(target=receiver.run)
+        thread.start()
+
+        sender = multiprocessing.Process(target=_udp_send,
+                                         args=(receiver.address[1], rate))
+        start = time.time()
+        sender.start()
+        sender.join()
+        sent = time.time() - start
+
+        # Wait for the receiver to drain its buffer
+        received = -1
+        while received != receiver.received:
+            received = receiver.received
+            time.sleep(0.2)
+        elapsed = time.time() - start - 0.2
+
+        receiver.exit()
+        thread.join()
+
+        stats = receiver.stats()
+        print('%12d %15d %15d %11.2f%%' % (rate, RECORDS / sent,
+                                           received / elapsed,
+                                           stats['loss_rate'] * 100))
+
+
+def bench_wire():
+    '''
+    Size and speed of the wire format against JSON, pickle and marshal,
+    for batches of parsed CLF lines. The timestamps are sent as epoch
+    seconds in the JSON and the marshal encodings
+    '''
+    parser = CLFParser('')
+    records = [parser.parse_line(line) for line in _clf_lines(RECORDS)]
+    batches = [records[idx:idx + 1000]
+               for idx in xrange(0, len(records), 1000)]
+
+    def rows(batch):
+        return [(data.uri, time.mktime(data.timestamp.timetuple())) +
+                data[2:] for data in batch]
+
+    formats = (
+        ('json', lambda batch: json.dumps(rows(batch)), json.loads),
+        ('pickle', lambda batch: pickle.dumps(batch, 2), pickle.loads),
+        ('marshal', lambda batch: marshal.dumps(rows(batch)),
+         marshal.loads),
+        ('wire', wire.encode_batch, wire.decode_batch),
+        ('wire columns', wire.encode_batch, wire.decode_columns),
+    )
+
+    print('%14s %12s %15s %15s' % ('format', 'bytes/line', 'encode lines/s',
+                                   'decode lines/s'))
+
+    for name, encode, decode in formats:
+        start = time.time()
+        encoded = [encode(batch) for batch in batches]
+        encoded_in = time.time() - start
+
+        start = time.time()
+        for payload in encoded:
+            decode(payload)
+        decoded_in = time.time() - start
+
+        size = sum(len(payload) for payload in encoded)
+        print('%14s %12.1f %15d %15d' % (name, float(size) / RECORDS,
+                                         RECORDS / encoded_in,
+                                         RECORDS / decoded_in))
+
+
+BENCHMARKS = {
+    'aggregate': bench_aggregate,
+    'archive': bench_archive,
+    'clf': bench_clf,
+    'delta': bench_delta,
+    'expiry': bench_expiry,
+    'parallel': bench_parallel,
+    'pipeline': bench_pipeline,
+    'queued': bench_queued,
+    'reader': bench_reader,
+    'replay': bench_replay,
+    'sharded': bench_sharded,
+    'snapshot': bench_snapshot,
+    'spool': bench_spool,
+    'store': bench_store,
+    'tcp': bench_tcp,
+    'udp': bench_udp,
+    'vector': bench_vector,
+    'wire': bench_wire,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(BENCHMARKS)
+
+    for name in names:
+        if name not in BENCHMARKS:
+            print('Unknown benchmark: %s (one of %s)' %
+                  (name, ', '.join(sorted(BENCHMARKS))))
+            sys.exit(-1)
+
+    for name in names:
+        print('== %s' % name)
+        BENCHMARKS[name]()
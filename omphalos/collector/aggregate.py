@@ -8,17 +8,93 @@ from datetime import datetime, timedelta
 
 from collector.base import Collector
 from collector.base import Summary
+from collector.counter import Tally
+from collector.topk import SpaceSaving
+from common.base import Delta
+
+# The data sets which can be tracked approximately, within a bounded
+# amount of memory
+APPROXIMATE = ('hits', 'size', 'referer', 'user')
 
 
 class Aggregate(Collector):
     '''An in memory aggregating collector implementation'''
     def __init__(self, conf, timeout):
-        self.data = defaultdict(Counter)
+        self.data = defaultdict(Tally)
+
+        # Optionally, track only the heavy hitters of the data sets with
+        # a high number of unique entries. Their counts are then approximate
+        capacity = conf.get('top_capacity', 0)
+        if capacity:
+            for dtype in APPROXIMATE:
+                self.data[dtype] = SpaceSaving(capacity)
+
         self.started_at = datetime.now() - timedelta(seconds=1)
         self.created_at = self.started_at
         self.updated_at = datetime.now()
         self.total = Counter({'hits': 0, 'size': 0})
 
+        # In event time mode, the time of the collector is driven by the
+        # timestamps of the data (the newest one seen so far) instead of
+        # the clock. Used for analysing and replaying historical logs
+        self.event_time = conf.get('event_time', False)
+        self.watermark = None
+
+    def now(self):
+        '''
+        Get the current time of the collector
+
+        @return: The newest timestamp seen in event time mode, the current
+            time otherwise
+        @rtype: L{datetime}
+        '''
+        if self.watermark is not None:
+            return self.watermark
+        return datetime.now()
+
+    def advance(self, batch):
+        '''
+        Move the watermark up to the newest timestamp in a batch of data.
+        Does nothing unless the collector is in event time mode
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        if not self.event_time or not batch:
+            return
+
+        newest = max(data.timestamp for data in batch)
+        if self.watermark is None:
+            # The data starts from the oldest timestamp of the first batch
+            oldest = min(data.timestamp for data in batch)
+            self.started_at = oldest - timedelta(seconds=1)
+            self.created_at = self.started_at
+            self.watermark = newest
+        elif newest > self.watermark:
+            self.watermark = newest
+
+    def advance_interval(self, start, end):
+        '''
+        Move the watermark up to the end of an interval for which data has
+        been aggregated. Does nothing unless the collector is in event time
+        mode
+
+        @param start: The start of the interval
+        @type start: L{datetime}
+
+        @param end: The end of the interval
+        @type end: L{datetime}
+        '''
+        if not self.event_time:
+            return
+
+        if self.watermark is None:
+            self.started_at = start
+            self.created_at = self.started_at
+            self.watermark = end
+        elif end > self.watermark:
+            self.watermark = end
+
     def add_data(self, data):
         '''
         Add data to the collector
@@ -26,25 +102,43 @@ class Aggregate(Collector):
         @param data: The data that is being collected
         @type data: L{Data}
         '''
+        self.advance((data,))
+        self._count(data)
+        self.updated_at = datetime.now()
+
+    def add_batch(self, batch):
+        '''
+        Add a batch of data to the collector
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        self.advance(batch)
+
+        for data in batch:
+            self._count(data)
+
+        self.updated_at = datetime.now()
+
+    def _count(self, data):
+        '''
+        Update the aggregation info with the data
+        '''
         size = int(data.size)
-        self.total.update({'hits': 1, 'size': size})
+        self.total['hits'] += 1
+        self.total['size'] += size
 
-        self.data['hits'].update({data.uri: 1})
-        self.data['size'].update({data.uri: size})
-        self.data['status'].update({data.status: 1})
-        self.data['method'].update({data.method: 1})
+        counters = self.data
+        counters['hits'].incr(data.uri)
+        counters['size'].incr(data.uri, size)
+        counters['status'].incr(data.status)
+        counters['method'].incr(data.method)
 
         if data.referer:
-            self.data['referer'].update({data.referer: 1})
+            counters['referer'].incr(data.referer)
 
         if data.user:
-            self.data['user'].update({data.user: 1})
-
-        # Remove items with 0 value
-        for key in self.data:
-            self.data[key] += Counter()
-
-        self.updated_at = datetime.now()
+            counters['user'].incr(data.user)
 
     def remove_data(self, data):
         '''
@@ -56,26 +150,119 @@ class Aggregate(Collector):
         '''
 
         size = int(data.size)
-        self.total.subtract({'hits': 1, 'size': size})
+        self.total['hits'] -= 1
+        self.total['size'] -= size
 
-        self.data['hits'].subtract({data.uri: 1})
-        self.data['size'].subtract({data.uri: size})
-        self.data['status'].subtract({data.status: 1})
-        self.data['method'].subtract({data.method: 1})
+        # Entries are dropped by the counters as soon as they reach zero
+        counters = self.data
+        counters['hits'].decr(data.uri)
+        counters['size'].decr(data.uri, size)
+        counters['status'].decr(data.status)
+        counters['method'].decr(data.method)
 
         if data.referer:
-            self.data['referer'].subtract({data.referer: 1})
+            counters['referer'].decr(data.referer)
 
         if data.user:
-            self.data['user'].subtract({data.user: 1})
-
-        # Remove items with 0 value
-        for key in self.data:
-            self.data[key] += Counter()
+            counters['user'].decr(data.user)
 
         self.started_at = data.timestamp
         self.updated_at = datetime.now()
 
+    def add_aggregate(self, aggregate):
+        '''
+        Add the data collected by another aggregate to this collector
+
+        @param aggregate: The aggregate whose data is to be added
+        @type aggregate: L{Aggregate}
+        '''
+        self.total['hits'] += aggregate.total['hits']
+        self.total['size'] += aggregate.total['size']
+
+        for dtype, counter in aggregate.data.iteritems():
+            mine = self.data[dtype]
+            if isinstance(mine, SpaceSaving) and \
+                    isinstance(counter, SpaceSaving):
+                # Carry the error bounds of both over
+                mine.merge(counter)
+                continue
+
+            incr = mine.incr
+            for key, value in counter.iteritems():
+                incr(key, value)
+
+        # In event time mode, the data now spans the times of both
+        if self.event_time and aggregate.watermark is not None:
+            if self.watermark is None or \
+                    aggregate.started_at < self.started_at:
+                self.started_at = aggregate.started_at
+                self.created_at = self.started_at
+
+            if self.watermark is None or aggregate.watermark > self.watermark:
+                self.watermark = aggregate.watermark
+
+        self.updated_at = datetime.now()
+
+    def add_delta(self, delta):
+        '''
+        Add data which has been aggregated at the source to the collector
+
+        @param delta: The aggregated data
+        @type delta: L{Delta}
+        '''
+        self.advance_interval(delta.start, delta.end)
+        self._merge(delta)
+        self.updated_at = datetime.now()
+
+    def _merge(self, delta):
+        '''
+        Update the aggregation info with aggregated data
+        '''
+        self.total['hits'] += delta.hits
+        self.total['size'] += delta.size
+
+        for dtype, counts in delta.counters.iteritems():
+            incr = self.data[dtype].incr
+            for key, value in counts.iteritems():
+                incr(key, value)
+
+    def get_delta(self, start, end):
+        '''
+        Get the data collected, to be added to another collector
+
+        @param start: The start of the interval the data covers
+        @type start: L{datetime}
+
+        @param end: The end of the interval the data covers
+        @type end: L{datetime}
+
+        @return: The aggregated data
+        @rtype: L{Delta}
+        '''
+        counters = dict((dtype, dict(counter.iteritems()))
+                        for dtype, counter in self.data.iteritems()
+                        if counter)
+        return Delta(start, end, self.total['hits'], self.total['size'],
+                     counters)
+
+    def remove_aggregate(self, aggregate):
+        '''
+        Remove the data collected by another aggregate from this collector.
+        Used when a pre-aggregated set of data is being purged.
+
+        @param aggregate: The aggregate whose data is to be removed
+        @type aggregate: L{Aggregate}
+        '''
+        self.total['hits'] -= aggregate.total['hits']
+        self.total['size'] -= aggregate.total['size']
+
+        for dtype, counter in aggregate.data.iteritems():
+            decr = self.data[dtype].decr
+            for key, value in counter.iteritems():
+                decr(key, value)
+
+        self.updated_at = datetime.now()
+
     def get_summary(self):
         '''
         Get a summary of the collected data
@@ -83,7 +270,7 @@ class Aggregate(Collector):
         @return: The summary of the data
         @rtype: L{Summary}
         '''
-        interval = datetime.now() - self.started_at
+        interval = self.now() - self.started_at
         return Summary(interval=interval, **self.total)
 
     def get_top(self, dtype, count):
@@ -101,6 +288,24 @@ class Aggregate(Collector):
         '''
         return self.data[dtype].most_common(count)
 
+    def get_error(self, dtype, key):
+        '''
+        Get the maximum amount by which the count of an entry may be
+        over-estimated. This is zero unless the data set is being tracked
+        approximately (see 'top_capacity')
+
+        @param dtype: Must be 'hits', 'size', 'status', 'referer' or 'user'
+        @type dtype: C{str}
+
+        @param key: The entry whose error is requested
+        @type key: C{str}
+
+        @return: The maximum error in the count
+        @rtype: C{int}
+        '''
+        counter = self.data[dtype]
+        return counter.error(key) if isinstance(counter, SpaceSaving) else 0
+
     def get_uri_data(self, uri, dtype):
         '''
         Get the specified data for the uri
@@ -32,6 +32,25 @@ class Collector(object):
         '''
         raise NotImplemented('Not implemented in plugin')
 
+    def add_batch(self, batch):
+        '''
+        Add a batch of data to the collector
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        for data in batch:
+            self.add_data(data)
+
+    def add_delta(self, delta):
+        '''
+        Add data which has been aggregated at the source to the collector
+
+        @param delta: The aggregated data
+        @type delta: L{Delta}
+        '''
+        raise NotImplemented('Not implemented in plugin')
+
     def get_summary(self):
         '''
         Get a summary of the collected data
@@ -0,0 +1,47 @@
+'''
+Counters used by the aggregating collectors
+'''
+
+from collections import Counter
+
+
+class Tally(Counter):
+    '''
+    A Counter which only keeps entries with a positive count.
+
+    Counter.update() and Counter.subtract() leave zero and negative entries
+    behind, and removing them with the "counter += Counter()" idiom rebuilds
+    the whole counter. The methods here touch a single key and drop it as
+    soon as its count reaches zero, so an update costs the same irrespective
+    of the number of keys being tracked.
+    '''
+
+    def incr(self, key, value=1):
+        '''
+        Increment the count of a key
+
+        @param key: The key to be incremented
+        @type key: C{str}
+
+        @param value: The value to add to the count
+        @type value: C{int}
+        '''
+        if value > 0:
+            self[key] += value
+
+    def decr(self, key, value=1):
+        '''
+        Decrement the count of a key. The key is removed if its count
+        drops to zero.
+
+        @param key: The key to be decremented
+        @type key: C{str}
+
+        @param value: The value to subtract from the count
+        @type value: C{int}
+        '''
+        count = self[key] - value
+        if count > 0:
+            self[key] = count
+        else:
+            self.pop(key, None)
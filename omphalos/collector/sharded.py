@@ -0,0 +1,368 @@
+'''
+A collector which spreads the data over a number of worker processes, so
+that adding data is not limited to a single core.
+
+The data is partitioned by URI: the data of a URI always goes to the same
+worker, which keeps it in a sliding window of its own (a L{Slider}). The
+batches are handed over to the workers through pipes, in the wire format
+(see L{common.wire}). A worker which falls behind blocks the pipe, and so
+slows down adding data instead of queueing it up without bounds.
+
+Queries are sent to every worker and the results are merged. As a URI
+lives in a single worker, the top URIs by hits or size are the top entries
+of the workers' lists. The other data sets (status, method, referer and
+user) are spread over the workers, so their top entries are merged exactly
+in up to three rounds (the Threshold Algorithm, TPUT):
+
+1. Every worker returns its top entries, which gives a lower bound for the
+   count of the last of the top entries overall
+2. Every worker returns the entries whose count is at least the bound over
+   the number of workers. Entries which were not returned by any worker
+   cannot have a count above the bound
+3. The exact counts of the entries which can still make it to the top are
+   looked up in every worker
+
+Data aggregated at the source (a L{Delta}) is split up in the same way.
+'''
+
+import multiprocessing
+import threading
+from collections import Counter
+from datetime import timedelta
+from heapq import nlargest
+from operator import itemgetter
+
+from collector.base import Collector
+from collector.base import Summary
+from collector.slider import Slider
+from common import wire
+from common.base import Delta
+
+# The data sets which are partitioned by URI
+PARTITIONED = ('hits', 'size')
+
+
+def _serve(conn, conf, timeout):
+    '''
+    Keep the data of a shard in a L{Slider}, and answer the queries about
+    it. Run in a separate process
+
+    @param conn: The connection to the parent process
+    @type conn: L{multiprocessing.Connection}
+
+    @param conf: The configuration of the slider
+    @type conf: C{dict}
+
+    @param timeout: The time for which the data has to be stored
+    @type timeout: C{int}
+    '''
+    collector = Slider(conf, timeout)
+
+    try:
+        while True:
+            request = conn.recv()
+            op = request[0]
+
+            if op == 'batch':
+                batch, span = wire.decode_batch(request[1]), request[2]
+                if batch:
+                    collector.add_batch(batch)
+                if span:
+                    # Keep up with the time of the other shards
+                    collector.advance_interval(*span)
+
+            elif op == 'delta':
+                collector.add_delta(request[1])
+
+            elif op == 'call':
+                name, args = request[1], request[2]
+                conn.send(getattr(collector, name)(*args))
+
+            elif op == 'above':
+                # The entries whose count is at least a threshold
+                dtype, threshold = request[1], request[2]
+                with collector.lock:
+                    conn.send([(key, value) for key, value
+                               in collector.data[dtype].iteritems()
+                               if value >= threshold])
+
+            elif op == 'lookup':
+                # The counts of a list of entries
+                dtype, keys = request[1], request[2]
+                with collector.lock:
+                    counter = collector.data[dtype]
+                    conn.send([counter[key] for key in keys])
+
+            elif op == 'close':
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        collector.close()
+        conn.close()
+
+
+class Sharded(Collector):
+    '''A collector which partitions the data over worker processes'''
+
+    def __init__(self, conf, timeout):
+        '''
+        Initialize the collector plugin, and start the workers
+
+        @param conf: A configuration dictionary. This can have the number of
+            workers ('shards', the number of CPUs by default), and is passed
+            on to the L{Slider} of every worker
+        @type conf: C{dict}
+
+        @param timeout: The time for which the data has to be stored
+        @type timeout: C{int}
+        '''
+        # The workers would fail to start with the same error
+        if conf.get('top_capacity') and not conf.get('bucket_size'):
+            raise ValueError('top_capacity requires bucket_size')
+
+        count = conf.get('shards', 0) or multiprocessing.cpu_count()
+        self.event_time = conf.get('event_time', False)
+
+        self.conns = []
+        self.workers = []
+        for _ in xrange(count):
+            conn, child = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_serve,
+                                             args=(child, conf, timeout))
+            worker.daemon = True
+            worker.start()
+            child.close()
+
+            self.conns.append(conn)
+            self.workers.append(worker)
+
+        # The pipes are used by the thread adding data and by the ones
+        # querying it, one request (or round of requests) at a time
+        self.lock = threading.Lock()
+
+    def _shard(self, key):
+        '''Get the connection to the worker which holds a key'''
+        return self.conns[hash(key) % len(self.conns)]
+
+    def close(self):
+        '''Stop the workers'''
+        with self.lock:
+            for conn in self.conns:
+                try:
+                    conn.send(('close',))
+                except (IOError, EOFError):
+                    pass
+
+            for worker in self.workers:
+                worker.join()
+
+            for conn in self.conns:
+                conn.close()
+
+    def add_data(self, data):
+        '''
+        Add data to the collector
+
+        @param data: The data that is being collected
+        @type data: L{Data}
+        '''
+        self.add_batch([data])
+
+    def add_batch(self, batch):
+        '''
+        Add a batch of data to the collector. The data of every worker is
+        sent to it as a batch of its own
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        if not batch:
+            return
+
+        count = len(self.conns)
+        parts = [[] for _ in xrange(count)]
+        appends = [part.append for part in parts]
+        for data in batch:
+            appends[hash(data.uri) % count](data)
+
+        # In event time mode, every worker moves on to the newest timestamp
+        # of the batch, even if none of the data is its own
+        span = None
+        if self.event_time:
+            timestamps = [data.timestamp for data in batch]
+            span = (min(timestamps) - timedelta(seconds=1), max(timestamps))
+
+        with self.lock:
+            for conn, part in zip(self.conns, parts):
+                if part or span:
+                    conn.send(('batch', wire.encode_batch(part), span))
+
+    def add_delta(self, delta):
+        '''
+        Add data which has been aggregated at the source to the collector.
+        The counts of every worker are sent to it as a delta of its own
+
+        @param delta: The aggregated data
+        @type delta: L{Delta}
+        '''
+        count = len(self.conns)
+        parts = [{} for _ in xrange(count)]
+
+        # The counts by URI go to the worker of the URI. The counts of the
+        # other data sets are spread over the workers as well
+        for dtype, counts in delta.counters.iteritems():
+            for key, value in counts.iteritems():
+                counters = parts[hash(key) % count]
+                counters.setdefault(dtype, {})[key] = value
+
+        with self.lock:
+            for conn, counters in zip(self.conns, parts):
+                if not counters and not self.event_time:
+                    continue
+
+                hits = counters.get('hits', {})
+                size = counters.get('size', {})
+                conn.send(('delta', Delta(delta.start, delta.end,
+                                          sum(hits.itervalues()),
+                                          sum(size.itervalues()),
+                                          counters)))
+
+    def _fan_out(self, request, conns=None):
+        '''
+        Send a request to the workers and get their replies. Called with
+        the lock held
+
+        @return: The reply of every worker
+        @rtype: C{list}
+        '''
+        conns = self.conns if conns is None else conns
+        for conn in conns:
+            conn.send(request)
+        return [conn.recv() for conn in conns]
+
+    def get_summary(self):
+        '''
+        Get a summary of the collected data
+
+        @return: The summary of the data
+        @rtype: L{Summary}
+        '''
+        with self.lock:
+            summaries = self._fan_out(('call', 'get_summary', ()))
+
+        return Summary(hits=sum(summary.hits for summary in summaries),
+                       size=sum(summary.size for summary in summaries),
+                       interval=max(summary.interval
+                                    for summary in summaries))
+
+    def get_top(self, dtype, count):
+        '''
+        Get the top entries of a particular data set
+
+        @param dtype: Must be 'hits', 'size', 'status', 'referer' or 'user'
+        @type dtype: C{str}
+
+        @param count: The top 'count' entries will be returned
+        @type count: C{int}
+
+        @return: A list of the most common entries and their counts
+        @rtype: C{list}
+        '''
+        with self.lock:
+            tops = self._fan_out(('call', 'get_top', (dtype, count)))
+
+            if dtype in PARTITIONED:
+                entries = [entry for top in tops for entry in top]
+                return nlargest(count, entries, key=itemgetter(1))
+
+            return self._merge_top(dtype, count, tops)
+
+    def _merge_top(self, dtype, count, tops):
+        '''
+        Merge the top entries of the workers for a data set which is spread
+        over them. Called with the lock held
+
+        @param tops: The top entries of every worker
+        @type tops: C{list} of C{list}
+
+        @return: The top entries overall
+        @rtype: C{list}
+        '''
+        seen = [dict(top) for top in tops]
+
+        # Workers which returned fewer entries than asked for returned all
+        # their entries
+        if all(len(top) < count for top in tops):
+            return self._total(seen).most_common(count)
+
+        # Entries which no worker has with a count of at least the threshold
+        # have a total count below the bound, and are not in the top
+        top = self._total(seen).most_common(count)
+        bound = top[-1][1] if len(top) == count else 0
+        threshold = float(bound) / len(self.conns)
+
+        for counts, above in zip(seen, self._fan_out(('above', dtype,
+                                                       threshold))):
+            counts.update(above)
+
+        # The counts which are not known are below the threshold, which
+        # gives an upper bound for the total count of every entry
+        totals = self._total(seen)
+        top = totals.most_common(count)
+        bound = top[-1][1] if len(top) == count else 0
+
+        candidates = [key for key, value in totals.iteritems()
+                      if value + threshold * sum(key not in counts
+                                                 for counts in seen) >= bound]
+
+        totals = Counter()
+        for counts in self._fan_out(('lookup', dtype, candidates)):
+            for key, value in zip(candidates, counts):
+                totals[key] += value
+
+        return nlargest(count, totals.iteritems(), key=itemgetter(1))
+
+    def _total(self, seen):
+        '''Add up the counts of the entries returned by the workers'''
+        totals = Counter()
+        for counts in seen:
+            totals.update(counts)
+        return totals
+
+    def get_error(self, dtype, key):
+        '''
+        Get the maximum amount by which the count of an entry may be
+        over-estimated (see L{Aggregate.get_error})
+
+        @param dtype: Must be 'hits', 'size', 'status', 'referer' or 'user'
+        @type dtype: C{str}
+
+        @param key: The entry whose error is requested
+        @type key: C{str}
+
+        @return: The maximum error in the count
+        @rtype: C{int}
+        '''
+        request = ('call', 'get_error', (dtype, key))
+        with self.lock:
+            if dtype in PARTITIONED:
+                return self._fan_out(request, [self._shard(key)])[0]
+            return sum(self._fan_out(request))
+
+    def get_uri_data(self, uri, dtype):
+        '''
+        Get the specified data for the uri, from the worker which holds it
+
+        @param uri: The URI for which data is requested
+        @type uri: C{str}
+
+        @param dtype: Must be 'hits', 'size'
+        @type dtype: C{str}
+
+        @return: The requested count
+        @rtype: C{int}
+        '''
+        with self.lock:
+            return self._fan_out(('call', 'get_uri_data', (uri, dtype)),
+                                 [self._shard(uri)])[0]
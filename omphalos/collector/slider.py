@@ -3,14 +3,45 @@ A collector which keeps data only for a specified set of time (in memory).
 
 WARNING:
 This class aggregates data in memory. For large number of unique URL's,
-it is advised to use a different plugin based on a time-series database.
+it is advised to use a different plugin based on a time-series database,
+or to track only the top entries approximately (see 'top_capacity'). The
+memory is then bounded only with buckets (see 'bucket_size'), which is why
+'top_capacity' requires them.
 '''
 
 import threading
 from datetime import datetime, timedelta
 from collections import deque
 
-from collector.aggregate import Aggregate
+from collector.aggregate import APPROXIMATE, Aggregate
+from collector.store import EventStore
+from collector.topk import SpaceSaving
+
+# The number of entries expired at a time by the expiry thread
+EXPIRE_CHUNK = 256
+
+
+class Bucket(Aggregate):
+    '''The data aggregated over a slice of the sliding window'''
+
+    def __init__(self, start, size, capacity=0):
+        '''
+        Initialize the bucket
+
+        @param start: The time from which the bucket collects data
+        @type start: L{datetime}
+
+        @param size: The time span covered by the bucket
+        @type size: L{timedelta}
+
+        @param capacity: Track only these many top entries (see
+            'top_capacity'), 0 to track all of them
+        @type capacity: C{int}
+        '''
+        super(Bucket, self).__init__({'top_capacity': capacity},
+                                     size.seconds)
+        self.start = start
+        self.end = start + size
 
 
 class Slider(Aggregate):
@@ -24,6 +55,33 @@ class Slider(Aggregate):
         self.timeseries = deque()
         self.timeout = timedelta(seconds=timeout)
 
+        # If a bucket size (in seconds) is configured, the queue holds
+        # pre-aggregated buckets instead of the individual datasets. Memory
+        # and the cost of expiry then depend on the length of the window
+        # rather than on the request rate, at the cost of expiring data
+        # one bucket at a time
+        bucket_size = conf.get('bucket_size', 0)
+        self.bucket_size = timedelta(seconds=bucket_size) if bucket_size \
+            else None
+
+        # Otherwise, the datasets can be kept in a compact column oriented
+        # store, which takes a fraction of the memory per dataset
+        self.compact = conf.get('compact', False) and not self.bucket_size
+
+        # Tracking only the top entries bounds the memory only if the
+        # buckets track only their top entries as well. Individual datasets
+        # are kept whatever their number
+        self.capacity = conf.get('top_capacity', 0)
+        if self.capacity and not self.bucket_size:
+            raise ValueError('top_capacity requires bucket_size')
+        if self.compact:
+            self.timeseries = EventStore()
+
+        # Data aggregated at the source is kept in buckets of its own, in
+        # order of their start, so that records are never counted in them
+        # and they do not hold up the expiry of the records
+        self.deltas = deque()
+
         # The overall aggregation info is maintained separately
         super(Slider, self).__init__(conf, timeout)
 
@@ -32,24 +90,159 @@ class Slider(Aggregate):
         # in detail before changing
         self.lock = threading.Lock()
 
-    def _cleanup(self):
+        # Optionally, expire old data on a separate thread every
+        # 'expire_interval' seconds instead of on every call. The thread
+        # releases the lock after every EXPIRE_CHUNK entries, so that
+        # adding data never waits for a large expiry to complete
+        self.expire_interval = conf.get('expire_interval', 0)
+        self.stopped = threading.Event()
+        self.expirer = None
+
+        if self.expire_interval:
+            self.expirer = threading.Thread(target=self._expire_loop)
+            self.expirer.daemon = True
+            self.expirer.start()
+
+    def close(self):
+        '''Stop expiring data on a separate thread'''
+        self.stopped.set()
+        if self.expirer:
+            self.expirer.join()
+
+    def _expire_loop(self):
+        '''Cleanup old data at regular intervals'''
+        while not self.stopped.wait(self.expire_interval):
+            self._cleanup(limit=EXPIRE_CHUNK)
+
+    def _inline_cleanup(self):
+        '''Cleanup old data, unless it is done on a separate thread'''
+
+        # Cleanup old entries from the data list. This can be time
+        # consuming when our traffic loads are voluminous, in which case
+        # it is scheduled separately (see 'expire_interval')
+        if not self.expire_interval:
+            self._cleanup()
+
+    def _cleanup(self, limit=None):
         '''
         Cleanup any old data that is there in the queue
+
+        @param limit: Release the lock after removing these many entries
+        @type limit: C{int}
         '''
 
         # Calculate the reference time
-        ref_time = datetime.now() - self.timeout
+        ref_time = self.now() - self.timeout
 
-        with self.lock:
+        while True:
+            with self.lock:
+                if not self._expire(ref_time, limit):
+                    continue
+
+                # The oldest bucket still holds data from before the
+                # reference time. Report the interval it covers
+                if self.bucket_size and self.timeseries:
+                    ref_time = min(ref_time, self.timeseries[0].start)
+                if self.deltas:
+                    ref_time = min(ref_time, self.deltas[0].start)
+
+                # The data which is left covers the time since the
+                # reference time, even if it has not been expired inline
+                self.reset_interval(ref_time)
+                return
+
+    def _expire(self, ref_time, limit=None):
+        '''
+        Remove the entries which are older than the reference time from
+        the queue, up to 'limit' entries at a time
+
+        @return: Whether all the old entries have been removed
+        @rtype: C{bool}
+        '''
+        count = 0
+
+        if not self._expire_buckets(self.deltas, ref_time, limit):
+            return False
+
+        if self.bucket_size:
+            return self._expire_buckets(self.timeseries, ref_time, limit)
+
+        if self.compact:
+            expired = self.timeseries.expire(ref_time, limit)
+            for old in expired:
+                super(Slider, self).remove_data(old)
+
+            if len(expired) == limit:
+                return False
+
+        else:
             while self.timeseries:
                 old = self.timeseries[0]
                 if old.timestamp > ref_time:
                     break
+                if count == limit:
+                    return False
 
                 old = self.timeseries.popleft()
                 super(Slider, self).remove_data(old)
+                count += 1
 
-            self.reset_interval(ref_time)
+        return True
+
+    def _expire_buckets(self, buckets, ref_time, limit=None):
+        '''
+        Remove the buckets which end before the reference time, up to
+        'limit' buckets at a time
+
+        @return: Whether all the old buckets have been removed
+        @rtype: C{bool}
+        '''
+        count = 0
+        done = True
+        while buckets:
+            old = buckets[0]
+            if old.end > ref_time:
+                break
+            if count == limit:
+                done = False
+                break
+
+            old = buckets.popleft()
+            super(Slider, self).remove_aggregate(old)
+            count += 1
+
+        if count and self.capacity:
+            self._rebuild_top()
+
+        return done
+
+    def _rebuild_top(self):
+        '''
+        Rebuild the approximate counters of the window from the buckets
+        which are left. Subtracting the counts of an expired bucket would
+        break their error bounds: those counts include the errors of the
+        bucket, the keys it evicted would never be decremented, and the
+        bound of the window would never come down
+        '''
+        for dtype in APPROXIMATE:
+            counter = SpaceSaving(self.capacity)
+            for buckets in (self.timeseries, self.deltas):
+                for bucket in buckets:
+                    counter.merge(bucket.data[dtype])
+
+            self.data[dtype] = counter
+
+    def _insert(self, buckets, bucket):
+        '''
+        Insert a bucket in order of its start. Buckets which arrive late
+        are inserted close to the end
+        '''
+        later = []
+        while buckets and buckets[-1].start > bucket.start:
+            later.append(buckets.pop())
+
+        buckets.append(bucket)
+        buckets.extend(reversed(later))
 
     def add_data(self, data):
         '''
@@ -59,17 +252,76 @@ class Slider(Aggregate):
         @param data: The data that is being collected
         @type data: L{Data}
         '''
+        self.advance((data,))
+        self._inline_cleanup()
 
-        # Cleanup old entries from the data list. This can be time
-        # consuming. We can look at scheduling this separately when our
-        # traffic loads are volumnious
-        self._cleanup()
+        with self.lock:
+            self._add(data)
 
+        self.updated_at = datetime.now()
+
+    def add_batch(self, batch):
+        '''
+        Add a batch of data to the collector. Pending data is cleaned-up
+        once for the whole batch
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        self.advance(batch)
+        self._inline_cleanup()
+
+        with self.lock:
+            for data in batch:
+                self._add(data)
+
+        self.updated_at = datetime.now()
+
+    def add_delta(self, delta):
+        '''
+        Add data which has been aggregated at the source to the collector.
+        It is kept as a bucket covering the interval it was aggregated over,
+        and expires as a whole. Like the data from before the start of the
+        window, a delta which starts before it is dropped, as its counts
+        cannot be split
+
+        @param delta: The aggregated data
+        @type delta: L{Delta}
+        '''
+        self.advance_interval(delta.start, delta.end)
+        self._inline_cleanup()
+
+        with self.lock:
+            if delta.start >= self.started_at:
+                bucket = Bucket(delta.start, delta.end - delta.start,
+                                self.capacity)
+                bucket._merge(delta)
+
+                self._insert(self.deltas, bucket)
+                self._merge(delta)
+
+        self.updated_at = datetime.now()
+
+    def _add(self, data):
+        '''
+        Add data to the queue and to the overall aggregation info
+        '''
         if data.timestamp < self.started_at:
             return
 
-        self.timeseries.append(data)
-        super(Slider, self).add_data(data)
+        if self.bucket_size:
+            # Data which arrives out of order is added to the latest bucket
+            bucket = self.timeseries[-1] if self.timeseries else None
+            if bucket is None or data.timestamp >= bucket.end:
+                start = data.timestamp.replace(microsecond=0)
+                bucket = Bucket(start, self.bucket_size, self.capacity)
+                self.timeseries.append(bucket)
+
+            bucket._count(data)
+        else:
+            self.timeseries.append(data)
+
+        self._count(data)
 
     def get_summary(self):
         '''
@@ -78,8 +330,10 @@ class Slider(Aggregate):
         @return: The summary of the data
         @rtype: L{Summary}
         '''
-        self._cleanup()
-        return super(Slider, self).get_summary()
+        self._inline_cleanup()
+
+        with self.lock:
+            return super(Slider, self).get_summary()
 
     def get_top(self, dtype, count):
         '''
@@ -94,5 +348,7 @@ class Slider(Aggregate):
         @return: A list of the most common entries and their counts
         @rtype: C{list}
         '''
-        self._cleanup()
-        return super(Slider, self).get_top(dtype, count)
+        self._inline_cleanup()
+
+        with self.lock:
+            return super(Slider, self).get_top(dtype, count)
@@ -0,0 +1,322 @@
+'''
+A collector which publishes snapshots of the data of another collector,
+for outputs to read from.
+
+Every 'snapshot_interval' seconds, the summary, the top 'snapshot_count'
+entries of every data set and the data of the top URIs are taken from the
+collector, in one go, and published as an immutable L{Snapshot} with a new
+version. Adding data is held up only while a snapshot is being taken.
+
+Reading from a snapshot does not touch the collector at all: there is no
+locking and no expiry of old data, and the data is consistent across the
+calls made for a refresh of the display. The data of the snapshot is as old
+as the snapshot, i.e. up to 'snapshot_interval' seconds.
+'''
+
+import threading
+from datetime import datetime
+
+from collector.base import Collector
+
+# The default time between snapshots, in seconds
+SNAPSHOT_INTERVAL = 1.0
+
+# The default number of top entries of every data set kept in a snapshot
+SNAPSHOT_COUNT = 15
+
+# The data sets kept in a snapshot
+DTYPES = ('hits', 'size', 'status', 'method', 'referer', 'user')
+
+
+class Snapshot(object):
+    '''
+    The data of a collector at a point in time. It answers the same queries
+    as the collector, from the data taken in the snapshot
+    '''
+
+    __slots__ = ('version', 'created_at', 'summary', 'count', 'top',
+                 'uri_data', 'errors')
+
+    def __init__(self, version, summary, count, top, uri_data, errors):
+        '''
+        Initialize the snapshot
+
+        @param version: The version of the snapshot, which increases with
+            every snapshot taken
+        @type version: C{int}
+
+        @param summary: The summary of the data
+        @type summary: L{Summary}
+
+        @param count: The number of top entries taken of every data set
+        @type count: C{int}
+
+        @param top: The top entries of every data set
+        @type top: C{dict} of C{tuple}
+
+        @param uri_data: The hits and the size of the top URIs
+        @type uri_data: C{dict} of C{dict}
+
+        @param errors: The maximum errors in the counts of the top entries
+            of every data set
+        @type errors: C{dict} of C{dict}
+        '''
+        self.version = version
+        self.created_at = datetime.now()
+        self.summary = summary
+        self.count = count
+        self.top = top
+        self.uri_data = uri_data
+        self.errors = errors
+
+    def get_summary(self):
+        '''
+        Get a summary of the data
+
+        @return: The summary of the data
+        @rtype: L{Summary}
+        '''
+        return self.summary
+
+    def get_top(self, dtype, count):
+        '''
+        Get the top entries of a particular data set. More entries than were
+        taken in the snapshot (see 'snapshot_count') raise a C{ValueError},
+        as the entries which follow them are not known
+
+        @param dtype: Must be 'hits', 'size', 'status', 'referer' or 'user'
+        @type dtype: C{str}
+
+        @param count: The top 'count' entries will be returned
+        @type count: C{int}
+
+        @return: A list of the most common entries and their counts
+        @rtype: C{list}
+        '''
+        if count > self.count:
+            raise ValueError('Only the top %d entries are kept in a snapshot, '
+                             '%d requested' % (self.count, count))
+        return list(self.top[dtype][:count])
+
+    def get_error(self, dtype, key):
+        '''
+        Get the maximum amount by which the count of a top entry may be
+        over-estimated (see L{Aggregate.get_error})
+
+        @param dtype: Must be 'hits', 'size', 'status', 'referer' or 'user'
+        @type dtype: C{str}
+
+        @param key: The entry whose error is requested
+        @type key: C{str}
+
+        @return: The maximum error in the count
+        @rtype: C{int}
+        '''
+        return self.errors[dtype].get(key, 0)
+
+    def get_uri_data(self, uri, dtype):
+        '''
+        Get the specified data for one of the top URIs
+
+        @param uri: The URI for which data is requested
+        @type uri: C{str}
+
+        @param dtype: Must be 'hits', 'size'
+        @type dtype: C{str}
+
+        @return: The requested count, 0 if the URI is not in the snapshot
+        @rtype: C{int}
+        '''
+        return self.uri_data[dtype].get(uri, 0)
+
+
+class Snapshotter(Collector):
+    '''A collector which publishes snapshots of another collector'''
+
+    def __init__(self, conf, collector):
+        '''
+        Initialize the collector plugin, and start taking snapshots
+
+        @param conf: A configuration dictionary to be used by the plugin.
+            This can have 'snapshot_interval' and 'snapshot_count'
+        @type conf: C{dict}
+
+        @param collector: The collector to take the snapshots of
+        @type collector: L{Collector}
+        '''
+        self.collector = collector
+        self.interval = conf.get('snapshot_interval', SNAPSHOT_INTERVAL)
+        self.count = conf.get('snapshot_count', SNAPSHOT_COUNT)
+
+        # Held while adding data and while taking a snapshot, so that a
+        # snapshot does not have the data of a batch in part
+        self.lock = threading.Lock()
+
+        self.snapshot = None
+        self.publish()
+
+        self.stopped = threading.Event()
+        self.publisher = threading.Thread(target=self._publish_loop)
+        self.publisher.daemon = True
+        self.publisher.start()
+
+    def _take(self, version):
+        '''
+        Take a snapshot of the collector. Called with the lock held
+
+        @return: The snapshot
+        @rtype: L{Snapshot}
+        '''
+        collector = self.collector
+        summary = collector.get_summary()
+
+        top = {}
+        for dtype in DTYPES:
+            top[dtype] = tuple(collector.get_top(dtype, self.count))
+
+        uris = set(key for key, _ in top['hits'])
+        uris.update(key for key, _ in top['size'])
+
+        uri_data = {}
+        for dtype in ('hits', 'size'):
+            uri_data[dtype] = dict((uri, collector.get_uri_data(uri, dtype))
+                                   for uri in uris)
+
+        errors = dict((dtype, {}) for dtype in DTYPES)
+        if hasattr(collector, 'get_error'):
+            for dtype, entries in top.iteritems():
+                errors[dtype] = dict((key, collector.get_error(dtype, key))
+                                     for key, _ in entries)
+
+        return Snapshot(version, summary, self.count, top, uri_data, errors)
+
+    def publish(self):
+        '''
+        Take a snapshot of the collector and publish it
+
+        @return: The snapshot
+        @rtype: L{Snapshot}
+        '''
+        with self.lock:
+            version = self.snapshot.version + 1 if self.snapshot else 1
+            snapshot = self._take(version)
+
+        # Replacing the reference is atomic, readers see either snapshot
+        self.snapshot = snapshot
+        return snapshot
+
+    def _publish_loop(self):
+        '''Publish a snapshot every 'snapshot_interval' seconds'''
+        while not self.stopped.wait(self.interval):
+            self.publish()
+
+    def close(self):
+        '''Stop taking snapshots, and close the collector'''
+        self.stopped.set()
+        self.publisher.join()
+
+        if hasattr(self.collector, 'close'):
+            self.collector.close()
+
+    def get_snapshot(self):
+        '''
+        Get the latest snapshot. Outputs read all the data for a refresh
+        from the same snapshot, for a consistent view
+
+        @return: The snapshot
+        @rtype: L{Snapshot}
+        '''
+        return self.snapshot
+
+    def add_data(self, data):
+        '''
+        Add data to the collector
+
+        @param data: The data that is being collected
+        @type data: L{Data}
+        '''
+        with self.lock:
+            self.collector.add_data(data)
+
+    def add_batch(self, batch):
+        '''
+        Add a batch of data to the collector
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        with self.lock:
+            self.collector.add_batch(batch)
+
+    def add_delta(self, delta):
+        '''
+        Add data which has been aggregated at the source to the collector
+
+        @param delta: The aggregated data
+        @type delta: L{Delta}
+        '''
+        with self.lock:
+            self.collector.add_delta(delta)
+
+    def get_summary(self):
+        '''
+        Get a summary of the data, from the latest snapshot
+
+        @return: The summary of the data
+        @rtype: L{Summary}
+        '''
+        return self.snapshot.get_summary()
+
+    def get_top(self, dtype, count):
+        '''
+        Get the top entries of a particular data set, from the latest
+        snapshot. More entries than the snapshot has are taken from the
+        collector
+
+        @param dtype: Must be 'hits', 'size', 'status', 'referer' or 'user'
+        @type dtype: C{str}
+
+        @param count: The top 'count' entries will be returned
+        @type count: C{int}
+
+        @return: A list of the most common entries and their counts
+        @rtype: C{list}
+        '''
+        if count > self.count:
+            return self.collector.get_top(dtype, count)
+        return self.snapshot.get_top(dtype, count)
+
+    def get_error(self, dtype, key):
+        '''
+        Get the maximum amount by which the count of an entry may be
+        over-estimated, from the latest snapshot
+
+        @param dtype: Must be 'hits', 'size', 'status', 'referer' or 'user'
+        @type dtype: C{str}
+
+        @param key: The entry whose error is requested
+        @type key: C{str}
+
+        @return: The maximum error in the count
+        @rtype: C{int}
+        '''
+        return self.snapshot.get_error(dtype, key)
+
+    def get_uri_data(self, uri, dtype):
+        '''
+        Get the specified data for the uri, from the latest snapshot if it
+        is one of the top URIs, from the collector otherwise
+
+        @param uri: The URI for which data is requested
+        @type uri: C{str}
+
+        @param dtype: Must be 'hits', 'size'
+        @type dtype: C{str}
+
+        @return: The requested count
+        @rtype: C{int}
+        '''
+        uri_data = self.snapshot.uri_data[dtype]
+        if uri in uri_data:
+            return uri_data[uri]
+        return self.collector.get_uri_data(uri, dtype)
@@ -0,0 +1,154 @@
+'''
+A compact store for the data retained by the sliding window collector.
+
+Instead of keeping a L{Data} namedtuple (and a datetime and a string per
+field) for every request, the data is kept in typed arrays, one per field.
+Timestamps are kept as seconds since the epoch, sizes as integers and the
+string fields as ids into a symbol table of the distinct values. This
+takes a few tens of bytes per request.
+'''
+
+import time
+from array import array
+from datetime import datetime
+
+from common.base import Data
+from common.symbols import SymbolTable
+
+# The id used for fields which are not set (referer, user)
+NO_VALUE = -1
+
+# Expired entries are dropped from the front of the arrays in one go,
+# once there are at least these many of them
+COMPACT_SIZE = 4096
+
+
+class EventStore(object):
+    '''
+    A column oriented queue of data, ordered by the time of arrival. Data
+    can be appended, removed from the front by time and iterated over.
+    '''
+
+    def __init__(self, symbols=None):
+        '''
+        Initialize the store
+
+        @param symbols: The symbol table used for encoding strings
+        @type symbols: L{SymbolTable}
+        '''
+        self.timestamps = array('l')
+        self.sizes = array('l')
+        self.uris = array('i')
+        self.statuses = array('i')
+        self.methods = array('i')
+        self.referers = array('i')
+        self.users = array('i')
+
+        self.columns = (self.timestamps, self.sizes, self.uris,
+                        self.statuses, self.methods, self.referers,
+                        self.users)
+
+        self.symbols = symbols if symbols is not None else SymbolTable()
+
+        # The position of the first entry which has not expired
+        self.head = 0
+
+        # The last datetime converted, and its seconds since the epoch
+        self._datetime = None
+        self._epoch = None
+
+    def __len__(self):
+        return len(self.timestamps) - self.head
+
+    def __iter__(self):
+        for idx in xrange(self.head, len(self.timestamps)):
+            yield self._get(idx)
+
+    def append(self, data):
+        '''
+        Add data to the end of the store
+
+        @param data: The data that is being collected
+        @type data: L{Data}
+        '''
+        acquire = self.symbols.acquire
+
+        self.timestamps.append(self._to_epoch(data.timestamp))
+        self.sizes.append(int(data.size))
+        self.uris.append(acquire(data.uri))
+        self.statuses.append(acquire(data.status))
+        self.methods.append(acquire(data.method))
+        self.referers.append(acquire(data.referer) if data.referer
+                             else NO_VALUE)
+        self.users.append(acquire(data.user) if data.user else NO_VALUE)
+
+    def expire(self, ref_time, limit=None):
+        '''
+        Remove the data which is not newer than a given time from the
+        front of the store
+
+        @param ref_time: The time up to which data has to be removed
+        @type ref_time: L{datetime}
+
+        @param limit: The maximum number of entries to be removed
+        @type limit: C{int}
+
+        @return: The data that was removed, in order of arrival
+        @rtype: C{list} of L{Data}
+        '''
+        ref_time = self._to_epoch(ref_time)
+        timestamps = self.timestamps
+        release = self.symbols.release
+
+        end = len(timestamps)
+        if limit is not None:
+            end = min(end, self.head + limit)
+
+        expired = []
+        head = self.head
+        while head < end and timestamps[head] <= ref_time:
+            expired.append(self._get(head))
+
+            release(self.uris[head])
+            release(self.statuses[head])
+            release(self.methods[head])
+            if self.referers[head] != NO_VALUE:
+                release(self.referers[head])
+            if self.users[head] != NO_VALUE:
+                release(self.users[head])
+
+            head += 1
+
+        self.head = head
+        if head >= COMPACT_SIZE and head * 2 >= len(timestamps):
+            for column in self.columns:
+                del column[:head]
+            self.head = 0
+
+        return expired
+
+    def _get(self, idx):
+        '''Get the data stored at a position'''
+        symbols = self.symbols
+        referer = self.referers[idx]
+        user = self.users[idx]
+
+        return Data(uri=symbols[self.uris[idx]],
+                    timestamp=datetime.fromtimestamp(self.timestamps[idx]),
+                    size=self.sizes[idx],
+                    status=symbols[self.statuses[idx]],
+                    method=symbols[self.methods[idx]],
+                    referer=symbols[referer] if referer != NO_VALUE else None,
+                    user=symbols[user] if user != NO_VALUE else None)
+
+    def _to_epoch(self, timestamp):
+        '''Convert a timestamp into seconds since the epoch'''
+        if not isinstance(timestamp, datetime):
+            return int(timestamp)
+
+        # Consecutive data usually shares the same timestamp
+        if timestamp != self._datetime:
+            self._datetime = timestamp
+            self._epoch = int(time.mktime(timestamp.timetuple()))
+
+        return self._epoch
@@ -0,0 +1,197 @@
+'''
+Approximate counters for tracking the most frequent entries of a data set
+within a fixed amount of memory
+'''
+
+from heapq import heapify, heappop, heappush, nlargest
+from operator import itemgetter
+
+# The heap of counts is rebuilt once it holds these many entries per
+# monitored key. This bounds the number of stale entries in the heap
+HEAP_FACTOR = 4
+
+
+class SpaceSaving(object):
+    '''
+    A counter which implements the Space-Saving algorithm.
+
+    At most 'capacity' keys are monitored. When a new key arrives and the
+    counter is full, the key with the lowest count is evicted and the new
+    key takes over its count. The count of a key is therefore never lower
+    than its real value, and over-estimates it by at most error(key).
+
+    Decrements (used by sliding windows when data expires) are applied to
+    monitored keys and ignored for evicted ones. Any key which is not
+    monitored has a real count of at most 'bound'.
+
+    The interface follows that of L{Tally} so that it can be used in its
+    place by the aggregating collectors.
+    '''
+
+    def __init__(self, capacity):
+        '''
+        Initialize the counter
+
+        @param capacity: The maximum number of keys to be monitored
+        @type capacity: C{int}
+        '''
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+        # A min-heap of (count, key). Entries are not updated in place,
+        # so an entry is valid only if its count is the current count of
+        # a monitored key
+        self.heap = []
+
+        # The highest count of a key that has been evicted
+        self.bound = 0
+
+    def __getitem__(self, key):
+        return self.counts.get(key, 0)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def iteritems(self):
+        '''Iterate over the monitored keys and their counts'''
+        return self.counts.iteritems()
+
+    def error(self, key):
+        '''
+        Get the maximum over-estimation of the count of a key
+
+        @param key: The key whose error is requested
+        @type key: C{str}
+
+        @return: The maximum error in the count of the key
+        @rtype: C{int}
+        '''
+        return self.errors.get(key, self.bound)
+
+    def incr(self, key, value=1):
+        '''
+        Increment the count of a key
+
+        @param key: The key to be incremented
+        @type key: C{str}
+
+        @param value: The value to add to the count
+        @type value: C{int}
+        '''
+        if value <= 0:
+            return
+
+        counts = self.counts
+        if key in counts:
+            count = counts[key] + value
+        else:
+            error = self.bound
+            if len(counts) >= self.capacity:
+                error = max(error, self._evict())
+
+            self.errors[key] = error
+            count = error + value
+
+        counts[key] = count
+        self._push(count, key)
+
+    def decr(self, key, value=1):
+        '''
+        Decrement the count of a key. The key is removed if its count
+        drops to zero.
+
+        @param key: The key to be decremented
+        @type key: C{str}
+
+        @param value: The value to subtract from the count
+        @type value: C{int}
+        '''
+        count = self.counts.get(key)
+        if count is None:
+            return
+
+        count -= value
+        if count > 0:
+            self.counts[key] = count
+            self._push(count, key)
+        else:
+            del self.counts[key]
+            del self.errors[key]
+
+    def merge(self, other):
+        '''
+        Add the counts of another counter, carrying over the errors of
+        both. A key which one of the counters does not monitor may have
+        had a count of up to its 'bound' there, which is added to the
+        count and the error of the key. Only the 'capacity' keys with the
+        highest counts are kept
+
+        @param other: The counter whose counts are to be added
+        @type other: L{SpaceSaving}
+        '''
+        counts = {}
+        errors = {}
+        for key in set(self.counts).union(other.counts):
+            counts[key] = self.counts.get(key, self.bound) + \
+                other.counts.get(key, other.bound)
+            errors[key] = self.error(key) + other.error(key)
+
+        # Keys which neither counter monitors had a count of up to the sum
+        # of the bounds, and the keys dropped here up to their counts
+        bound = self.bound + other.bound
+        if len(counts) > self.capacity:
+            kept = nlargest(self.capacity, counts.iteritems(),
+                            key=itemgetter(1))
+            bound = max(bound, kept[-1][1])
+            counts = dict(kept)
+            errors = dict((key, errors[key]) for key in counts)
+
+        self.counts = counts
+        self.errors = errors
+        self.bound = bound
+
+        heap = [(value, key) for key, value in counts.iteritems()]
+        heapify(heap)
+        self.heap = heap
+
+    def most_common(self, count):
+        '''
+        Get the keys with the highest counts
+
+        @param count: The number of entries to be returned
+        @type count: C{int}
+
+        @return: A list of the most common entries and their counts
+        @rtype: C{list}
+        '''
+        return nlargest(count, self.counts.iteritems(), key=itemgetter(1))
+
+    def _push(self, count, key):
+        '''Record the count of a key in the heap'''
+        heap = self.heap
+        heappush(heap, (count, key))
+
+        if len(heap) > HEAP_FACTOR * self.capacity:
+            # Drop the stale entries
+            heap = [(value, item) for item, value in self.counts.iteritems()]
+            heapify(heap)
+            self.heap = heap
+
+    def _evict(self):
+        '''Evict the key with the lowest count and return its count'''
+        counts = self.counts
+        heap = self.heap
+
+        while heap:
+            count, key = heappop(heap)
+            if counts.get(key) == count:
+                del counts[key]
+                del self.errors[key]
+                self.bound = max(self.bound, count)
+                return count
+
+        return 0
@@ -0,0 +1,198 @@
+'''
+An aggregating collector which updates its counts a batch at a time,
+using vectorised numpy operations. Useful for backfills and bursts, where
+data arrives in large batches.
+
+The string fields are dictionary encoded into integer ids, and the counts
+are kept in numpy arrays indexed by these ids.
+'''
+
+from datetime import datetime, timedelta
+from itertools import imap
+
+import numpy
+
+from collector.base import Collector
+from collector.base import Summary
+from common.base import Data
+
+# The field of the data which each data set is counted by
+FIELDS = {
+    'hits': 'uri',
+    'size': 'uri',
+    'status': 'status',
+    'method': 'method',
+    'referer': 'referer',
+    'user': 'user',
+}
+
+# The id reserved for fields which are not set (referer, user)
+NO_VALUE = 0
+
+# The fields whose empty values are not counted either, as with Aggregate
+OPTIONAL = ('referer', 'user')
+
+
+class VectorAggregate(Collector):
+    '''An in memory aggregating collector which works on columns of data'''
+
+    def __init__(self, conf, timeout):
+        # The ids of the values of every field, and the values by id
+        self.ids = {}
+        self.values = {}
+        for field in set(FIELDS.values()):
+            self.ids[field] = {None: NO_VALUE}
+            self.values[field] = [None]
+
+        for field in OPTIONAL:
+            self.ids[field][''] = NO_VALUE
+
+        self.counts = {}
+        for dtype in FIELDS:
+            self.counts[dtype] = numpy.zeros(1024, dtype=numpy.int64)
+
+        self.started_at = datetime.now() - timedelta(seconds=1)
+        self.created_at = self.started_at
+        self.updated_at = datetime.now()
+        self.total = {'hits': 0, 'size': 0}
+
+    def add_data(self, data):
+        '''
+        Add data to the collector
+
+        @param data: The data that is being collected
+        @type data: L{Data}
+        '''
+        self.add_batch([data])
+
+    def add_batch(self, batch):
+        '''
+        Add a batch of data to the collector
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        if batch:
+            self.add_columns(dict(zip(Data._fields, zip(*batch))))
+
+    def add_columns(self, columns):
+        '''
+        Add a batch of data, organised as columns, to the collector
+
+        @param columns: A sequence of values for each of the fields 'uri',
+            'size', 'status', 'method', 'referer' and 'user'
+        @type columns: C{dict}
+        '''
+        rows = len(columns['uri'])
+        if not rows:
+            return
+
+        sizes = numpy.fromiter(imap(int, columns['size']), numpy.int64, rows)
+
+        codes = {}
+        for field in set(FIELDS.values()):
+            codes[field] = self._encode(field, columns[field])
+
+        for dtype, field in FIELDS.iteritems():
+            length = len(self.values[field])
+            weights = sizes if dtype == 'size' else None
+
+            counts = numpy.bincount(codes[field], weights=weights,
+                                    minlength=length)
+            if weights is not None:
+                counts = numpy.rint(counts).astype(numpy.int64)
+
+            # Missing values are not counted
+            counts[NO_VALUE] = 0
+
+            total = self._grow(dtype, length)
+            total[:length] += counts
+
+        self.total['hits'] += rows
+        self.total['size'] += int(sizes.sum())
+        self.updated_at = datetime.now()
+
+    def get_summary(self):
+        '''
+        Get a summary of the collected data
+
+        @return: The summary of the data
+        @rtype: L{Summary}
+        '''
+        interval = datetime.now() - self.started_at
+        return Summary(interval=interval, **self.total)
+
+    def get_top(self, dtype, count):
+        '''
+        Get the top entries of a particular data set
+
+        @param dtype: Must be 'hits', 'size', 'status', 'referer' or 'user'
+        @type dtype: C{str}
+
+        @param count: The top 'count' entries will be returned
+        @type count: C{int}
+
+        @return: A list of the most common entries and their counts
+        @rtype: C{list}
+        '''
+        counts = self.counts[dtype]
+        count = min(count, numpy.count_nonzero(counts))
+        if count <= 0:
+            return []
+
+        top = numpy.argpartition(-counts, count - 1)[:count]
+        top = top[numpy.argsort(-counts[top], kind='mergesort')]
+
+        values = self.values[FIELDS[dtype]]
+        return [(values[idx], int(counts[idx])) for idx in top]
+
+    def get_uri_data(self, uri, dtype):
+        '''
+        Get the specified data for the uri
+
+        @param uri: The URI for which data is requested
+        @type uri: C{str}
+
+        @param dtype: Must be 'hits', 'size'
+        @type dtype: C{str}
+
+        @return: The requested count
+        @rtype: C{int}
+        '''
+        idx = self.ids['uri'].get(uri)
+        if not idx:
+            return 0
+        return int(self.counts[dtype][idx])
+
+    def _encode(self, field, column):
+        '''
+        Get the ids of the values in a column, assigning ids to the values
+        which have not been seen before
+        '''
+        ids = self.ids[field]
+        codes = map(ids.get, column)
+
+        if None in codes:
+            values = self.values[field]
+            for value in set(column):
+                if value not in ids:
+                    ids[value] = len(values)
+                    values.append(value)
+
+            codes = map(ids.get, column)
+
+        return numpy.array(codes, dtype=numpy.intp)
+
+    def _grow(self, dtype, length):
+        '''Make sure that the counts of a data set can hold 'length' ids'''
+        counts = self.counts[dtype]
+        if len(counts) < length:
+            size = len(counts)
+            while size < length:
+                size *= 2
+
+            grown = numpy.zeros(size, dtype=numpy.int64)
+            grown[:len(counts)] = counts
+            counts = self.counts[dtype] = grown
+
+        return counts
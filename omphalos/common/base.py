@@ -10,3 +10,9 @@ from collections import namedtuple
 # On top of it, it is memory efficient (as per Guido)
 Data = namedtuple('Data', ('uri', 'timestamp', 'size', 'status',
                            'method', 'referer', 'user'))
+
+# The structure in which data aggregated at the source (e.g. by an agent
+# on a web server) is sent to the collector plugins. It covers the time
+# from 'start' to 'end', and holds the totals ('hits' and 'size') and the
+# counts of every data set (e.g. counters['status']['200'])
+Delta = namedtuple('Delta', ('start', 'end', 'hits', 'size', 'counters'))
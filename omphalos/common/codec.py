@@ -0,0 +1,185 @@
+'''
+Encoding of batches of data for sending them over the network.
+
+A batch is sent as a frame: a 4 byte length (of the payload, in network
+byte order) and a byte of flags, followed by the payload. The payload is
+the batch in the wire format (see L{common.wire}), optionally compressed
+with zlib. Data aggregated at the source (a L{Delta}) is encoded in the
+wire format as well, and sent with a flag of its own.
+
+Frames come from the network, so nothing in them is trusted: a payload
+is decompressed up to MAX_FRAME_SIZE bytes, and a frame which cannot be
+decoded raises a C{ValueError}.
+'''
+
+import struct
+import zlib
+
+from common import wire
+from common.base import Delta
+
+# The header of a frame: the length of the payload and the flags
+HEADER = struct.Struct('!IB')
+
+# The payload is compressed with zlib
+FLAG_COMPRESSED = 0x01
+
+# 0x02 marked the marshalled records of earlier versions, which are no
+# longer read as marshal is not safe for untrusted data. It is not to be
+# reused
+
+# The payload is a delta instead of a batch of records
+FLAG_DELTA = 0x04
+
+# The payload is a batch in the wire format
+FLAG_WIRE = 0x08
+
+# Frames larger than this (before or after decompression) are taken to be
+# corrupt
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+
+def encode_batch(batch, level=0):
+    '''
+    Encode a batch of data as a frame
+
+    @param batch: The data to be sent
+    @type batch: C{list} of L{Data}
+
+    @param level: The zlib compression level, 0 for no compression
+    @type level: C{int}
+
+    @return: The frame
+    @rtype: C{str}
+    '''
+    flags = FLAG_WIRE
+    payload = wire.encode_batch(batch)
+    if level:
+        flags |= FLAG_COMPRESSED
+        payload = zlib.compress(payload, level)
+
+    return HEADER.pack(len(payload), flags) + payload
+
+
+def encode_delta(delta, level=0):
+    '''
+    Encode data aggregated at the source as a frame
+
+    @param delta: The aggregated data
+    @type delta: L{Delta}
+
+    @param level: The zlib compression level, 0 for no compression
+    @type level: C{int}
+
+    @return: The frame
+    @rtype: C{str}
+    '''
+    flags = FLAG_DELTA
+    payload = wire.encode_delta(delta)
+    if level:
+        flags |= FLAG_COMPRESSED
+        payload = zlib.compress(payload, level)
+
+    return HEADER.pack(len(payload), flags) + payload
+
+
+def encode(item, level=0):
+    '''
+    Encode a batch of data, or data aggregated at the source, as a frame
+
+    @param item: The data
+    @type item: C{list} of L{Data}, or L{Delta}
+
+    @param level: The zlib compression level, 0 for no compression
+    @type level: C{int}
+
+    @return: The frame
+    @rtype: C{str}
+    '''
+    if isinstance(item, Delta):
+        return encode_delta(item, level)
+    return encode_batch(item, level)
+
+
+def _decompress(payload):
+    '''
+    Decompress a payload, up to MAX_FRAME_SIZE bytes
+
+    @param payload: The compressed payload
+    @type payload: C{str}
+
+    @return: The decompressed payload
+    @rtype: C{str}
+    '''
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(payload, MAX_FRAME_SIZE)
+    except zlib.error as exp:
+        raise ValueError('Invalid compressed payload: %s' % exp)
+
+    if decompressor.unconsumed_tail:
+        raise ValueError('Frame too large once decompressed')
+    return data
+
+
+def decode_payload(flags, payload):
+    '''
+    Decode the payload of a frame
+
+    @param flags: The flags of the frame
+    @type flags: C{int}
+
+    @param payload: The payload of the frame
+    @type payload: C{str}
+
+    @return: The data in the frame
+    @rtype: C{list} of L{Data}, or L{Delta}
+    '''
+    if flags & FLAG_COMPRESSED:
+        payload = _decompress(payload)
+
+    if flags & FLAG_DELTA:
+        return wire.decode_delta(payload)
+
+    if flags & FLAG_WIRE:
+        return wire.decode_batch(payload)
+
+    raise ValueError('Unsupported frame: flags %#x' % flags)
+
+
+class FrameReader(object):
+    '''Splits a stream of bytes into frames, and decodes them'''
+
+    def __init__(self):
+        self.buffer = ''
+
+    def feed(self, chunk):
+        '''
+        Add data received from the stream
+
+        @param chunk: The data received
+        @type chunk: C{str}
+
+        @return: The batches of data (or the deltas) in the frames
+            completed by the chunk
+        @rtype: C{list}
+        '''
+        buf = self.buffer + chunk if self.buffer else chunk
+
+        batches = []
+        start = 0
+        while len(buf) - start >= HEADER.size:
+            length, flags = HEADER.unpack_from(buf, start)
+            if length > MAX_FRAME_SIZE:
+                raise ValueError('Frame too large: %d bytes' % length)
+
+            end = start + HEADER.size + length
+            if end > len(buf):
+                break
+
+            batches.append(decode_payload(flags,
+                                          buf[start + HEADER.size:end]))
+            start = end
+
+        self.buffer = buf[start:]
+        return batches
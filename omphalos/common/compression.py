@@ -0,0 +1,74 @@
+'''
+Compressed (rotated) log files, as used by the monitors and the parsers.
+
+Files compressed with gzip, bzip2 or xz are recognised by their extension.
+xz files need the lzma module (backports.lzma on Python 2).
+'''
+
+import bz2
+import gzip
+import io
+import os
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+def _gzip_decompressor():
+    # Expect a gzip header and trailer
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def _xz_decompressor():
+    if lzma is None:
+        raise ValueError('The lzma module is required for xz files')
+    return lzma.LZMADecompressor()
+
+
+# The functions which make a decompressor for every kind of file
+DECOMPRESSORS = {
+    '.gz': _gzip_decompressor,
+    '.bz2': bz2.BZ2Decompressor,
+    '.xz': _xz_decompressor,
+}
+
+
+def is_compressed(path):
+    '''
+    Check if a file is compressed, going by its extension
+
+    @param path: The path of the file
+    @type path: C{str}
+
+    @return: Whether the file is compressed
+    @rtype: C{bool}
+    '''
+    return os.path.splitext(path)[1] in DECOMPRESSORS
+
+
+def open_log(path):
+    '''
+    Open a log file for reading, decompressing it if required
+
+    @param path: The path of the file
+    @type path: C{str}
+
+    @return: A file like object with the data of the file
+    @rtype: C{file}
+    '''
+    extension = os.path.splitext(path)[1]
+    if extension == '.gz':
+        return gzip.open(path, 'rb')
+    elif extension == '.bz2':
+        return bz2.BZ2File(path, 'rb')
+    elif extension == '.xz':
+        _xz_decompressor()
+        return lzma.LZMAFile(path, 'rb')
+
+    return io.open(path, 'rb')
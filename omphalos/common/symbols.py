@@ -0,0 +1,122 @@
+'''
+A symbol table for the string fields of the data (uri, referer, user,
+method and status).
+
+The same few strings occur in a large number of log lines. The table is
+used in two ways:
+
+* Parsers intern the strings they extract, so that every occurrence of a
+  value refers to a single string object. Retained data then shares its
+  strings, and counters compare keys by identity.
+* The compact store of the Slider (see L{EventStore}) encodes values as
+  small integer ids, which are cheaper to store than the strings.
+
+The counters of the aggregating collectors are keyed on the (interned)
+strings, not on ids. Getting the id of a value costs a lookup of the
+string, which is as much as updating a counter keyed on it: a string
+object caches its hash, and an interned one is compared by identity.
+'''
+
+# The default number of interned strings
+CAPACITY = 65536
+
+
+class SymbolTable(object):
+    '''
+    Interns strings and maps them to integer ids.
+
+    Interned strings are kept in two generations. When the current one
+    is full, it replaces the previous one and the strings which were not
+    used during that time are dropped. At most 'capacity' strings are held.
+
+    Ids are reference counted. A value is dropped, and its id reused, once
+    nothing refers to it any more.
+    '''
+
+    def __init__(self, capacity=CAPACITY):
+        '''
+        Initialize the symbol table
+
+        @param capacity: The maximum number of interned strings
+        @type capacity: C{int}
+        '''
+        self.generation = max(capacity / 2, 1)
+        self.hot = {}
+        self.cold = {}
+
+        self.ids = {}
+        self.values = []
+        self.refs = []
+        self.free = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, idx):
+        return self.values[idx]
+
+    def intern(self, value):
+        '''
+        Get the shared string object for a value
+
+        @param value: The value to be interned
+        @type value: C{str}
+
+        @return: The shared string equal to the value
+        @rtype: C{str}
+        '''
+        symbol = self.hot.get(value)
+        if symbol is not None:
+            return symbol
+
+        symbol = self.cold.get(value, value)
+
+        hot = self.hot
+        hot[value] = symbol
+        if len(hot) >= self.generation:
+            self.cold = hot
+            self.hot = {}
+
+        return symbol
+
+    def acquire(self, value):
+        '''
+        Get the id of a value, and add a reference to it
+
+        @param value: The value to be encoded
+        @type value: C{str}
+
+        @return: The id of the value
+        @rtype: C{int}
+        '''
+        idx = self.ids.get(value)
+        if idx is not None:
+            self.refs[idx] += 1
+            return idx
+
+        if self.free:
+            idx = self.free.pop()
+            self.values[idx] = value
+            self.refs[idx] = 1
+        else:
+            idx = len(self.values)
+            self.values.append(value)
+            self.refs.append(1)
+
+        self.ids[value] = idx
+        return idx
+
+    def release(self, idx):
+        '''
+        Remove a reference to a value
+
+        @param idx: The id of the value
+        @type idx: C{int}
+        '''
+        refs = self.refs[idx] - 1
+        self.refs[idx] = refs
+
+        if not refs:
+            del self.ids[self.values[idx]]
+            self.values[idx] = None
+            self.free.append(idx)
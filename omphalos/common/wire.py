@@ -0,0 +1,425 @@
+'''
+A compact binary encoding of batches of data, for sending them over the
+network or keeping them on disk.
+
+A batch is encoded column by column. The strings of the batch (URIs,
+statuses, methods, referers and users) are kept once, in a dictionary,
+and the string fields are encoded as ids into it (0 for fields which are
+not set). Timestamps are encoded as microseconds since the epoch, relative
+to the oldest timestamp of the batch. Every column of integers is packed
+with the smallest width (1, 2, 4 or 8 bytes) which fits all its values.
+
+The layout of an encoded batch (all integers are little endian):
+
+* A header: the version of the format, the flags, the number of records,
+  the number of strings and the oldest timestamp
+* The lengths of the strings (a column), followed by the strings
+* The columns of the uri, status, method, referer and user ids, the sizes
+  and the timestamps
+
+A column is a byte with the width of its integers, followed by the
+integers. A batch can be decoded into records, or into columns without
+building an object per record (see L{decode_columns}). Batches which do
+not hold together (ids without a string, strings or columns running past
+the end, or data left over after them) raise a C{ValueError}.
+
+Data aggregated at the source (a L{Delta}) is encoded in the same way: a
+header with the version, the flags, the start and the end of the interval,
+the totals and the number of strings, followed by the strings, a column
+with the number of entries of every data set, and the columns of the ids
+and the counts of the entries of every data set.
+'''
+
+import struct
+import time
+from array import array
+from datetime import datetime
+from itertools import izip
+
+from common.base import Data, Delta
+
+VERSION = 1
+
+# The version, the flags, the number of records, the number of strings and
+# the oldest timestamp
+HEADER = struct.Struct('<BBIIq')
+
+# The timestamps were datetime objects (in local time), instead of seconds
+# since the epoch
+FLAG_DATETIME = 0x01
+
+# The version, the flags, the start and the end of the interval, the hits,
+# the size and the number of strings of a delta
+DELTA_HEADER = struct.Struct('<BBqqQQI')
+
+# The string fields, in the order of their columns
+STRING_FIELDS = ('uri', 'status', 'method', 'referer', 'user')
+
+# The data sets of a delta, in the order of their columns
+DELTA_FIELDS = ('hits', 'size', 'status', 'method', 'referer', 'user')
+
+# The struct format codes for every width of integers, which are the same
+# on every platform
+TYPECODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+WIDTHS = sorted(TYPECODES)
+
+
+def _pack_column(values, parts):
+    '''
+    Pack a column of non-negative integers with the smallest width which
+    fits them all
+
+    @param values: The integers
+    @type values: C{list} of C{int}
+
+    @param parts: The encoded parts of the batch, to add the column to
+    @type parts: C{list} of C{str}
+    '''
+    maximum = max(values) if values else 0
+    for width in WIDTHS:
+        if maximum < 1 << (8 * width):
+            break
+    else:
+        raise ValueError('Value too large: %d' % maximum)
+
+    parts.append(chr(width))
+    parts.append(struct.pack('<%d%s' % (len(values), TYPECODES[width]),
+                             *values))
+
+
+def _unpack_column(payload, offset, count):
+    '''
+    Unpack a column of integers
+
+    @return: The integers and the offset after the column
+    @rtype: C{tuple}
+    '''
+    if offset >= len(payload):
+        raise ValueError('Truncated batch')
+
+    width = ord(payload[offset])
+    if width not in TYPECODES:
+        raise ValueError('Invalid column width: %d' % width)
+
+    offset += 1
+    end = offset + width * count
+    if end > len(payload):
+        raise ValueError('Truncated batch')
+
+    column = struct.unpack_from('<%d%s' % (count, TYPECODES[width]),
+                                payload, offset)
+    return column, end
+
+
+def _pack_strings(strings, parts):
+    '''
+    Pack the strings of a batch: a column of their lengths, followed by
+    the strings
+
+    @param strings: The encoded strings
+    @type strings: C{list} of C{str}
+
+    @param parts: The encoded parts of the batch, to add the strings to
+    @type parts: C{list} of C{str}
+    '''
+    _pack_column([len(value) for value in strings], parts)
+    parts.extend(strings)
+
+
+def _unpack_strings(payload, offset, count):
+    '''
+    Unpack the strings of a batch
+
+    @return: The strings, with None first (for the id 0), and the offset
+        after them
+    @rtype: C{tuple}
+    '''
+    lengths, offset = _unpack_column(payload, offset, count)
+    if offset + sum(lengths) > len(payload):
+        raise ValueError('Truncated batch')
+
+    strings = [None]
+    for length in lengths:
+        strings.append(payload[offset:offset + length])
+        offset += length
+
+    return strings, offset
+
+
+def _check_ids(column, strings):
+    '''Check that a column of ids refers to the strings of a batch'''
+    if column and max(column) >= len(strings):
+        raise ValueError('Invalid string id: %d' % max(column))
+
+
+def _to_bytes(value):
+    '''Get the encoded form of a string value'''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value if isinstance(value, str) else str(value)
+
+
+def _to_micros(timestamps):
+    '''
+    Convert timestamps to microseconds since the epoch
+
+    @return: The flags for the timestamps and the converted timestamps
+    @rtype: C{tuple}
+    '''
+    if not isinstance(timestamps[0], datetime):
+        return 0, [int(round(timestamp * 1000000))
+                   for timestamp in timestamps]
+
+    # Timestamps in a batch mostly fall in the same few seconds
+    cache = {}
+    micros = []
+    for timestamp in timestamps:
+        second = timestamp.replace(microsecond=0)
+        epoch = cache.get(second)
+        if epoch is None:
+            epoch = cache[second] = \
+                int(time.mktime(second.timetuple())) * 1000000
+
+        micros.append(epoch + timestamp.microsecond)
+
+    return FLAG_DATETIME, micros
+
+
+def _from_micros(flags, micros):
+    '''Convert microseconds since the epoch back to a timestamp'''
+    if not flags & FLAG_DATETIME:
+        return micros / 1e6
+
+    second, micro = divmod(micros, 1000000)
+    return datetime.fromtimestamp(second).replace(microsecond=micro)
+
+
+def encode_batch(batch):
+    '''
+    Encode a batch of data
+
+    @param batch: The data to be encoded
+    @type batch: C{list} of L{Data}
+
+    @return: The encoded batch
+    @rtype: C{str}
+    '''
+    if not batch:
+        return HEADER.pack(VERSION, 0, 0, 0, 0)
+
+    uris, timestamps, sizes, statuses, methods, referers, users = \
+        zip(*batch)
+
+    # Every string gets an id in the order in which it is first seen
+    ids = {None: 0}
+    assign = ids.setdefault
+    columns = [[assign(value, len(ids)) for value in values]
+               for values in (uris, statuses, methods, referers, users)]
+
+    strings = [None] * len(ids)
+    for value, idx in ids.iteritems():
+        strings[idx] = value
+    strings = [_to_bytes(value) for value in strings[1:]]
+
+    flags, micros = _to_micros(timestamps)
+    base = min(micros)
+
+    parts = [HEADER.pack(VERSION, flags, len(batch), len(strings), base)]
+    _pack_strings(strings, parts)
+
+    for column in columns:
+        _pack_column(column, parts)
+
+    _pack_column([int(size) for size in sizes], parts)
+    _pack_column([micro - base for micro in micros], parts)
+
+    return ''.join(parts)
+
+
+def _decode(payload):
+    '''
+    Decode the columns of an encoded batch
+
+    @return: The flags, the strings (None first, for the id 0), the oldest
+        timestamp, and the columns of ids, sizes and timestamp offsets
+    @rtype: C{tuple}
+    '''
+    if len(payload) < HEADER.size:
+        raise ValueError('Truncated batch')
+
+    version, flags, count, string_count, base = \
+        HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError('Unsupported version: %d' % version)
+
+    offset = HEADER.size
+    if not count:
+        if string_count or offset != len(payload):
+            raise ValueError('Invalid empty batch')
+        return flags, [None], base, [[]] * len(STRING_FIELDS), [], []
+
+    strings, offset = _unpack_strings(payload, offset, string_count)
+
+    columns = []
+    for _ in xrange(len(STRING_FIELDS) + 2):
+        column, offset = _unpack_column(payload, offset, count)
+        columns.append(column)
+
+    if offset != len(payload):
+        raise ValueError('Trailing data after the batch')
+
+    ids, sizes, offsets = columns[:-2], columns[-2], columns[-1]
+    for column in ids:
+        _check_ids(column, strings)
+
+    return flags, strings, base, ids, sizes, offsets
+
+
+def decode_columns(payload):
+    '''
+    Decode an encoded batch into columns, without building an object for
+    every record. The string columns refer to the strings of the batch, the
+    sizes are integers and the timestamps are seconds since the epoch (in
+    an array)
+
+    @param payload: The encoded batch
+    @type payload: C{str}
+
+    @return: The column of every field of the data (see L{Data}), which
+        can be added to a L{VectorAggregate} directly
+    @rtype: C{dict}
+    '''
+    flags, strings, base, ids, sizes, offsets = _decode(payload)
+
+    columns = {}
+    lookup = strings.__getitem__
+    for field, column in izip(STRING_FIELDS, ids):
+        columns[field] = map(lookup, column)
+
+    columns['size'] = sizes
+    columns['timestamp'] = array('d', [(base + offset) / 1e6
+                                       for offset in offsets])
+    return columns
+
+
+def decode_batch(payload):
+    '''
+    Decode an encoded batch
+
+    @param payload: The encoded batch
+    @type payload: C{str}
+
+    @return: The data
+    @rtype: C{list} of L{Data}
+    '''
+    flags, strings, base, ids, sizes, offsets = _decode(payload)
+    if not sizes:
+        return []
+
+    lookup = strings.__getitem__
+    uris, statuses, methods, referers, users = [map(lookup, column)
+                                                for column in ids]
+
+    if flags & FLAG_DATETIME:
+        # Records of a batch mostly fall in the same few seconds
+        cache = {}
+        fromtimestamp = datetime.fromtimestamp
+        timestamps = []
+        for offset in offsets:
+            second, micro = divmod(base + offset, 1000000)
+            timestamp = cache.get(second)
+            if timestamp is None:
+                timestamp = cache[second] = fromtimestamp(second)
+            timestamps.append(timestamp.replace(microsecond=micro)
+                              if micro else timestamp)
+    else:
+        timestamps = [(base + offset) / 1e6 for offset in offsets]
+
+    return map(Data._make, izip(uris, timestamps, sizes, statuses, methods,
+                                referers, users))
+
+
+def encode_delta(delta):
+    '''
+    Encode data aggregated at the source
+
+    @param delta: The aggregated data
+    @type delta: L{Delta}
+
+    @return: The encoded delta
+    @rtype: C{str}
+    '''
+    for dtype in delta.counters:
+        if dtype not in DELTA_FIELDS:
+            raise ValueError('Unknown data set: %s' % dtype)
+
+    # Every key gets an id in the order in which it is first seen, the
+    # same key being shared by the data sets (e.g. URIs)
+    ids = {}
+    assign = ids.setdefault
+    columns = []
+    for dtype in DELTA_FIELDS:
+        items = delta.counters.get(dtype, {}).items()
+        columns.append(([assign(key, len(ids) + 1) for key, _ in items],
+                        [value for _, value in items]))
+
+    strings = [None] * len(ids)
+    for value, idx in ids.iteritems():
+        strings[idx - 1] = _to_bytes(value)
+
+    flags, (start, end) = _to_micros([delta.start, delta.end])
+
+    parts = [DELTA_HEADER.pack(VERSION, flags, start, end, delta.hits,
+                               delta.size, len(strings))]
+    _pack_strings(strings, parts)
+    _pack_column([len(keys) for keys, _ in columns], parts)
+
+    for keys, values in columns:
+        _pack_column(keys, parts)
+        _pack_column(values, parts)
+
+    return ''.join(parts)
+
+
+def decode_delta(payload):
+    '''
+    Decode an encoded delta
+
+    @param payload: The encoded delta
+    @type payload: C{str}
+
+    @return: The aggregated data
+    @rtype: L{Delta}
+    '''
+    if len(payload) < DELTA_HEADER.size:
+        raise ValueError('Truncated delta')
+
+    version, flags, start, end, hits, size, string_count = \
+        DELTA_HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError('Unsupported version: %d' % version)
+
+    strings, offset = _unpack_strings(payload, DELTA_HEADER.size,
+                                      string_count)
+    counts, offset = _unpack_column(payload, offset, len(DELTA_FIELDS))
+
+    counters = {}
+    for dtype, count in izip(DELTA_FIELDS, counts):
+        keys, offset = _unpack_column(payload, offset, count)
+        values, offset = _unpack_column(payload, offset, count)
+        if not count:
+            continue
+
+        # Every key of a delta is set
+        _check_ids(keys, strings)
+        if min(keys) == 0:
+            raise ValueError('Invalid string id: 0')
+
+        counters[dtype] = dict(izip(map(strings.__getitem__, keys), values))
+
+    if offset != len(payload):
+        raise ValueError('Trailing data after the delta')
+
+    return Delta(_from_micros(flags, start), _from_micros(flags, end), hits,
+                 size, counters)
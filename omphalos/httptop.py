@@ -5,17 +5,31 @@ following data on the http log file
 '''
 
 import cement
+import functools
+import glob
+import os
 import sys
 import threading
 import time
 
 from monitor.inotify import MonitorINotify
+from monitor.parallel import scan
 from monitor.poll import Poll
+from monitor.replay import Replay
+from collector.sharded import Sharded
 from collector.slider import Slider
+from collector.snapshot import Snapshotter
+from common.symbols import SymbolTable
 from output.console import Console
+from output.text import Text
 from parser.clf import CLFParser
 from parser.w3c import W3CLogParser
+from transport.delta import DeltaTransport
 from transport.dummy import Dummy
+from transport.queued import OVERFLOW_POLICIES, Queued
+from transport.spool import Spool
+from transport.tcp import TCPReceiver, TCPSender
+from transport.udp import UDPReceiver, UDPSender
 
 try:
     from cement.core import foundation, controller, handler, exc
@@ -37,6 +51,68 @@ class HttpTopController(controller.CementBaseController):
                                         default=120, type=int,
                               help='The time period for storing data')),
 
+            (['-b', '--bucket-size'], dict(action='store', dest='bucket_size',
+                                           default=0, type=int,
+                              help='Aggregate stored data into buckets of '
+                                   'these many seconds')),
+
+            (['--compact'], dict(action='store_true', dest='compact',
+                              help='Keep stored data in a compact form '
+                                   '(less memory, slower)')),
+
+            (['-e', '--expire-interval'], dict(action='store',
+                                               dest='expire_interval',
+                                               default=0, type=int,
+                              help='Expire old data in the background every '
+                                   'these many seconds')),
+
+            (['-t', '--top-capacity'], dict(action='store',
+                                            dest='top_capacity',
+                                            default=0, type=int,
+                              help='Track only these many top URIs, referers '
+                                   'and users (approximate counts, needs '
+                                   '--bucket-size)')),
+
+            (['--replay'], dict(action='store_true', dest='replay',
+                              help='Replay the whole log file as fast as '
+                                   'possible, using the time in the log')),
+
+            (['--report-interval'], dict(action='store',
+                                         dest='report_interval',
+                                         default=0, type=int,
+                              help='When replaying, report every these many '
+                                   'seconds of log time')),
+
+            (['-j', '--jobs'], dict(action='store', dest='jobs',
+                                    default=0, type=int,
+                              help='Summarise the whole log file using these '
+                                   'many processes')),
+
+            (['--shards'], dict(action='store', dest='shards',
+                                default=0, type=int,
+                              help='Spread the collected data over these '
+                                   'many processes')),
+
+            (['--snapshot-interval'], dict(action='store',
+                                           dest='snapshot_interval',
+                                           default=0, type=float,
+                              help='Display snapshots of the data taken '
+                                   'every these many seconds')),
+
+            (['--checkpoint'], dict(action='store', dest='checkpoint_file',
+                              help='Keep the read offsets in this file, and '
+                                   'resume from them after a restart')),
+
+            (['-q', '--queue-size'], dict(action='store', dest='queue_size',
+                                          default=0, type=int,
+                              help='Queue up to these many records for the '
+                                   'collector, which runs on its own thread')),
+
+            (['--overflow'], dict(action='store', dest='overflow',
+                                  default='block', choices=OVERFLOW_POLICIES,
+                              help='What to do when the queue is full: '
+                                   'block/drop-oldest/sample')),
+
             (['-r', '--refresh'], dict(action='store', dest='refresh_time',
                                        default=10, type=int,
                               help='Screen refresh interval')),
@@ -59,8 +135,37 @@ class HttpTopController(controller.CementBaseController):
             (['--hits'], dict(action='store', dest='hits', default=0, type=int,
                               help='Per segment hits to generate an alert')),
 
-            (['log_file'], dict(action='store',
-                                help='The log file to monitor')),
+            (['--max-handles'], dict(action='store', dest='max_handles',
+                                     default=256, type=int,
+                              help='The number of log files kept open at a '
+                                   'time')),
+
+            (['--send'], dict(action='store', dest='send',
+                              help='Send the data to a collector '
+                                   'listening at this host:port, instead of '
+                                   'displaying it')),
+
+            (['--listen'], dict(action='store', dest='listen',
+                              help='Display the data sent by other hosts to '
+                                   'this [host:]port (localhost by default), '
+                                   'instead of following a log')),
+
+            (['--spool'], dict(action='store', dest='spool_dir',
+                              help='Keep the data being sent in this '
+                                   'directory until the collector takes it')),
+
+            (['--delta-interval'], dict(action='store', dest='delta_interval',
+                                        default=0, type=int,
+                              help='Send counts aggregated over these many '
+                                   'seconds instead of the records (TCP)')),
+
+            (['--udp'], dict(action='store_true', dest='udp',
+                              help='Send or listen over UDP, dropping data '
+                                   'instead of waiting for the collector')),
+
+            (['log_file'], dict(action='store', nargs='?',
+                                help='The log file to monitor (or a '
+                                     'directory, or a glob pattern)')),
         ]
 
     @controller.expose(hide=True, aliases=['run'])
@@ -70,27 +175,56 @@ class HttpTopController(controller.CementBaseController):
         '''
 
         # Start the sliding collector with 2 minutes of storage
-        conf = {}
-        collector = Slider(conf, self.pargs.interval)
+        conf = {
+            'bucket_size': self.pargs.bucket_size,
+            'compact': self.pargs.compact,
+            'expire_interval': self.pargs.expire_interval,
+            'top_capacity': self.pargs.top_capacity,
+            'event_time': self.pargs.replay,
+            'checkpoint_file': self.pargs.checkpoint_file,
+            'max_handles': self.pargs.max_handles,
+        }
+        if self.pargs.shards:
+            # Spread the data over processes, to use more than one core
+            collector = Sharded(dict(conf, shards=self.pargs.shards),
+                                self.pargs.interval)
+        else:
+            collector = Slider(conf, self.pargs.interval)
+
+        if self.pargs.snapshot_interval and not self.pargs.replay:
+            # The display reads from snapshots instead of the live data.
+            # Replays report on the window as it is at every report
+            # The snapshots keep as many top entries as the display shows
+            snapconf = {
+                'snapshot_interval': self.pargs.snapshot_interval,
+                'snapshot_count': max(self.pargs.top_count, 5),
+            }
+            collector = Snapshotter(snapconf, collector)
 
         # Start a dummy transport
         transport = Dummy(collector=collector)
 
-        # Start the parser
+        # Start the parser. The strings of the retained data are shared,
+        # unless the collector encodes them itself
+        symbols = None if self.pargs.compact else SymbolTable()
+
         if self.pargs.parser == 'clf':
-            parser = CLFParser(self.pargs.log_file)
+            parser_class = CLFParser
         elif self.pargs.parser == 'w3c':
-            parser = W3CLogParser(self.pargs.log_file)
+            parser_class = W3CLogParser
         else:
             raise ValueError('Invalid parser')
 
-        # Start the monitor
-        monitor = MonitorINotify(conf, transport, parser, self.pargs.log_file)
-
-        # Switch to this for use on Linux, Windows or Mac (to be tested)
-        # monitor = Poll(conf, transport, parser)
+        if not self.pargs.log_file:
+            if not self.pargs.listen:
+                raise ValueError('A log file to monitor is required')
+            parser = None
+        elif os.path.isfile(self.pargs.log_file):
+            parser = parser_class(self.pargs.log_file, symbols=symbols)
+        else:
+            # A directory or a glob pattern. Every file gets its own parser
+            parser = functools.partial(parser_class, symbols=symbols)
 
-        # Start the console display
         displayconf = {
             'refresh_time': self.pargs.refresh_time,
             'top_count': self.pargs.top_count,
@@ -102,6 +236,97 @@ class HttpTopController(controller.CementBaseController):
             },
         }
 
+        if self.pargs.jobs:
+            # Aggregate the whole log (or all the logs matching a glob
+            # pattern, compressed or not) in parallel and print a report
+            aggconf = {
+                'top_capacity': self.pargs.top_capacity,
+                'event_time': True,
+            }
+            paths = sorted(glob.glob(self.pargs.log_file))
+            aggregate = scan(paths, parser_class, self.pargs.jobs, aggconf)
+            Text(displayconf, aggregate).report(aggregate.watermark)
+            return
+
+        if self.pargs.replay:
+            # Replay the log and print reports of the window as plain text
+            display = Text(displayconf, collector)
+            replayconf = {
+                'report': display.report,
+                'report_interval': self.pargs.report_interval,
+            }
+            Replay(replayconf, transport, parser, self.pargs.log_file).run()
+            return
+
+        if self.pargs.listen:
+            # Display the data received from other hosts
+            host, _, port = self.pargs.listen.rpartition(':')
+            listenconf = {'host': host or 'localhost', 'port': int(port)}
+            receiver_class = UDPReceiver if self.pargs.udp else TCPReceiver
+            receiver = receiver_class(listenconf, collector)
+            receiver_th = threading.Thread(target=receiver.run)
+            receiver_th.daemon = True
+            receiver_th.start()
+
+            Console(displayconf, collector).run()
+            receiver.exit()
+            return
+
+        if self.pargs.queue_size:
+            # Hand the data over to the collector through a bounded queue,
+            # so that following the logs does not wait for the collector
+            queueconf = {
+                'queue_size': self.pargs.queue_size,
+                'overflow': self.pargs.overflow,
+            }
+            transport = Queued(queueconf, collector)
+
+        if self.pargs.send:
+            # Ship the data to a remote collector in batches (compressed
+            # over TCP)
+            host, _, port = self.pargs.send.rpartition(':')
+            sendconf = {'host': host or 'localhost', 'port': int(port),
+                        'compress': 1}
+            transport = UDPSender(sendconf) if self.pargs.udp \
+                else TCPSender(sendconf)
+
+            # The transports, in the order in which they are to be closed
+            transports = [transport]
+
+            if self.pargs.spool_dir:
+                # Spool the data to disk while the collector is slow or
+                # unreachable
+                transport = Spool({'spool_dir': self.pargs.spool_dir},
+                                  transport)
+                transports.insert(0, transport)
+
+            if self.pargs.delta_interval:
+                if self.pargs.udp:
+                    raise ValueError('Deltas cannot be sent over UDP')
+
+                # Aggregate the data here and send only the counts
+                deltaconf = {'delta_interval': self.pargs.delta_interval}
+                transport = DeltaTransport(deltaconf, transport)
+                transports.insert(0, transport)
+
+        # Start the monitor
+        monitor = MonitorINotify(conf, transport, parser, self.pargs.log_file)
+
+        if self.pargs.send:
+            try:
+                monitor.run()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                for transport in transports:
+                    transport.close()
+            return
+
+        # Switch to this for use on Linux, Windows or Mac (to be tested)
+        # monitor = Poll(dict(conf, paths=[self.pargs.log_file]), transport,
+        #                parser)
+
+        # Start the console display
         display = Console(displayconf, collector)
 
         # Start two threads. One for monitoring and one for displaying
@@ -117,6 +342,12 @@ class HttpTopController(controller.CementBaseController):
         monitor_th.start()
         display_th.start()
 
+        # Stop the monitor once the display is closed. It saves the read
+        # offsets as it stops
+        display_th.join()
+        monitor.exit()
+        monitor_th.join()
+
 class HttpTopApp(foundation.CementApp):
     class Meta:
         label = 'httptop'
@@ -0,0 +1,122 @@
+'''
+Reading of compressed (rotated) log files.
+
+Files compressed with gzip, bzip2 or xz (see L{common.compression}) are
+decompressed as a stream, a block at a time, and handed over as batches of
+lines. Nothing is written to disk, and the memory used is bounded by the
+size of a block.
+'''
+
+import io
+import os
+
+from common.compression import DECOMPRESSORS, is_compressed
+from monitor.reader import scan_lines
+
+# The amount of decompressed data handed over at a time
+BLOCK_SIZE = 256 * 1024
+
+# The amount of compressed data fed to the decompressors which cannot limit
+# their output (bzip2 and xz) at a time. Their blocks are bounded by the
+# compression ratio of this much data
+CHUNK_SIZE = 16 * 1024
+
+
+def read_blocks(path, size=BLOCK_SIZE):
+    '''
+    Decompress a compressed file, a block at a time
+
+    @param path: The path of the file
+    @type path: C{str}
+
+    @param size: The maximum amount of decompressed data in a block. The
+        blocks of bzip2 and xz files are bounded by the data decompressed
+        from CHUNK_SIZE bytes instead
+    @type size: C{int}
+
+    @return: An iterator over the blocks of decompressed data
+    @rtype: C{generator}
+    '''
+    make_decompressor = DECOMPRESSORS[os.path.splitext(path)[1]]
+
+    decompressor = make_decompressor()
+
+    # zlib can stop after a given amount of output, keeping the rest of
+    # the input for the next call
+    bounded = hasattr(decompressor, 'unconsumed_tail')
+    read_size = size if bounded else CHUNK_SIZE
+
+    with io.open(path, 'rb') as handle:
+        data = handle.read(read_size)
+
+        while data:
+            if bounded:
+                block = decompressor.decompress(data, size)
+                data = decompressor.unconsumed_tail
+            else:
+                try:
+                    block = decompressor.decompress(data)
+                except EOFError:
+                    # The stream ended exactly at the end of the previous
+                    # chunk, which left nothing in its unused data. The
+                    # chunk starts the next stream, unless it is padding
+                    if not data.strip('\0'):
+                        break
+                    decompressor = make_decompressor()
+                    continue
+                data = ''
+
+            if block:
+                yield block
+
+            # Files can hold several compressed streams one after another
+            # (e.g. when compressed data is appended). The data after the
+            # end of a stream (which zlib leaves in the unconsumed tail as
+            # well) starts the next one. Padding after the last stream is
+            # ignored
+            rest = decompressor.unused_data
+            if rest:
+                if not rest.strip('\0'):
+                    break
+                decompressor = make_decompressor()
+                data = rest
+            elif not data:
+                data = handle.read(read_size)
+
+        # Output held back by zlib, at most its window
+        if bounded:
+            block = decompressor.flush()
+            if block:
+                yield block
+
+
+def read_lines(path, size=BLOCK_SIZE):
+    '''
+    Read all the lines of a file, which may be compressed, in batches
+
+    @param path: The path of the file
+    @type path: C{str}
+
+    @param size: The approximate amount of data in a batch. Compressed
+        files are decompressed BLOCK_SIZE bytes at a time instead
+    @type size: C{int}
+
+    @return: An iterator over lists of lines
+    @rtype: C{generator}
+    '''
+    if not is_compressed(path):
+        for lines in scan_lines(path, size):
+            yield lines
+        return
+
+    partial = ''
+    for block in read_blocks(path):
+        lines = (partial + block).split('\n')
+        partial = lines.pop()
+
+        if lines:
+            yield lines
+
+    # The last line need not end with a new line
+    if partial:
+        yield [partial]
@@ -2,6 +2,20 @@
 The data structures required for monitoring plugins
 '''
 
+import os
+import time
+from fnmatch import fnmatch
+
+# The amount of data read from a file at a time
+READ_SIZE = 256 * 1024
+
+# Backlogs larger than this are read in blocks of this size
+CATCH_UP_SIZE = 4 * 1024 * 1024
+
+# The default time for which a file which has been replaced by a new file
+# at its path is still read, after the last data was written to it
+ROTATE_GRACE = 60
+
 
 class Monitor(object):
     '''The base class for implementing a monitoring plugin'''
@@ -23,6 +37,163 @@ class Monitor(object):
         '''
         raise NotImplemented('Not implemented in plugin')
 
+    def consume(self, handle, partial=''):
+        '''
+        Read all the data available in a file in large chunks and hand the
+        complete lines over to the parser and the transport in batches.
+        An incomplete line at the end of the data is returned, so that it
+        can be completed by the next read
+
+        @param handle: The file to be read
+        @type handle: C{file}
+
+        @param partial: The incomplete line left over from the last read
+        @type partial: C{str}
+
+        @return: Whether any data was read and the incomplete line
+        @rtype: C{tuple}
+        '''
+        chunk = handle.read(READ_SIZE)
+        if not chunk:
+            return False, partial
+
+        while chunk:
+            lines = (partial + chunk).split('\n')
+            partial = lines.pop()
+
+            if lines:
+                self.send_lines(lines)
+
+            chunk = handle.read(READ_SIZE)
+
+        return True, partial
+
+    def get_parser(self, path):
+        '''
+        Get the parser for the lines of a file, from 'parsers'. This is
+        either the parser for all the files, or a function (e.g. a parser
+        class) which returns a parser for a file path, or a dictionary
+        mapping patterns of file paths to either of these
+
+        @param path: The path of the file
+        @type path: C{str}
+
+        @return: The parser, or None if no pattern matches the path
+        @rtype: L{Parser}
+        '''
+        parser = self.parsers
+
+        if isinstance(parser, dict):
+            # The longest (most specific) matching pattern wins
+            for pattern in sorted(parser, key=len, reverse=True):
+                if fnmatch(path, pattern):
+                    parser = parser[pattern]
+                    break
+            else:
+                return None
+
+        # Parser classes (and other functions) make a parser for the file
+        if isinstance(parser, type) or not hasattr(parser, 'parse_lines'):
+            parser = parser(path)
+
+        return parser
+
+    def catch_up(self, handle, partial=''):
+        '''
+        Read a large backlog of data in a file in large blocks, and hand
+        the complete lines over to the parser and the transport. The file
+        is left positioned after the last complete line, so that the rest
+        of the data can be consumed as usual
+
+        The file is being followed, so it is not memory mapped: it can be
+        truncated at any time (e.g. by copytruncate), and touching the
+        pages of a map beyond the new end of the file kills the process
+        with SIGBUS. Memory maps are only used for files which are not
+        being written to (see L{MappedFile})
+
+        @param handle: The file to be read
+        @type handle: C{file}
+
+        @param partial: The incomplete line left over from the last read
+        @type partial: C{str}
+
+        @return: The incomplete line left over, if nothing was read
+        @rtype: C{str}
+        '''
+        offset = handle.tell()
+        if os.fstat(handle.fileno()).st_size - offset < CATCH_UP_SIZE:
+            return partial
+
+        while True:
+            handle.seek(offset)
+            chunk = handle.read(CATCH_UP_SIZE)
+
+            # Stop at the end of the data, or at a line longer than a
+            # block, which is left to be consumed as usual
+            newline = chunk.rfind('\n')
+            if newline < 0:
+                break
+
+            lines = chunk[:newline].split('\n')
+            if partial:
+                lines[0] = partial + lines[0]
+                partial = ''
+
+            self.send_lines(lines)
+            offset += newline + 1
+
+        handle.seek(offset)
+        return partial
+
+    def send_lines(self, lines):
+        '''
+        Parse a batch of lines and send the data on the transport
+
+        @param lines: The lines read from the data source
+        @type lines: C{list}
+        '''
+        batch = self.parser.parse_lines(lines)
+        if batch:
+            self.transport.send_batch(batch)
+
+    def _replaced(self, tailed):
+        '''
+        Keep reading a file which has been replaced by a new file at its
+        path (or moved away from it), until it has been idle for
+        'rotate_grace' seconds, or until the file at the path is replaced
+        in turn. Writers keep writing to a rotated file until they reopen
+        their log (e.g. nginx, on USR1). Used by the monitors which keep
+        the files being drained in 'draining', and read them with _read
+
+        @param tailed: The file which has been replaced
+        @type tailed: L{TailedFile}
+        '''
+        for entry in list(self.draining):
+            if entry[0].path == tailed.path:
+                self._read(entry[0])
+                entry[0].close()
+                self.draining.remove(entry)
+
+        self.draining.append([tailed, time.time()])
+
+    def _drain(self, final=False):
+        '''
+        Read the data written to the files which have been replaced, and
+        stop reading the ones which have been idle for long enough
+
+        @param final: Stop reading all of them after this read
+        @type final: C{bool}
+        '''
+        now = time.time()
+        for entry in list(self.draining):
+            tailed = entry[0]
+            if self._read(tailed):
+                entry[1] = now
+
+            if final or now - entry[1] >= self.rotate_grace:
+                tailed.close()
+                self.draining.remove(entry)
+
     def exit(self):
         '''Indicate that the monitor must exit'''
         self._exit = True
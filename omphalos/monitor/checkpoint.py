@@ -0,0 +1,135 @@
+'''
+A persistent record of how far each followed file has been read, so that
+a monitor can resume where it left off after a restart
+'''
+
+import json
+import os
+import time
+
+# The checkpoint is written out after these many updates, or after these
+# many seconds, whichever happens first
+FLUSH_COUNT = 1000
+FLUSH_INTERVAL = 5
+
+
+class Checkpoint(object):
+    '''
+    The offsets of the followed files, kept in a file as JSON. Each path
+    is mapped to the inode, the offset and the fingerprint of the file
+    (see L{TailedFile}). Updates are written out in batches.
+    '''
+
+    def __init__(self, path, flush_count=FLUSH_COUNT,
+                 flush_interval=FLUSH_INTERVAL):
+        '''
+        Initialize the checkpoint, loading it from the file if it exists
+
+        @param path: The path of the checkpoint file
+        @type path: C{str}
+
+        @param flush_count: Write out after these many updates
+        @type flush_count: C{int}
+
+        @param flush_interval: Write out after these many seconds
+        @type flush_interval: C{int}
+        '''
+        self.path = path
+        self.flush_count = flush_count
+        self.flush_interval = flush_interval
+
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as handle:
+                self.entries = json.load(handle)
+
+        self.pending = 0
+        self.flushed_at = time.time()
+
+    def get(self, path):
+        '''
+        Get the state of a file
+
+        @param path: The path of the file
+        @type path: C{str}
+
+        @return: The inode, the offset and the fingerprint of the file, or
+            None if the file is not known
+        @rtype: C{tuple}
+        '''
+        entry = self.entries.get(path)
+        return tuple(entry) if entry else None
+
+    def update(self, path, inode, offset, fingerprint):
+        '''
+        Record the state of a file
+
+        @param path: The path of the file
+        @type path: C{str}
+
+        @param inode: The inode of the file
+        @type inode: C{int}
+
+        @param offset: The offset up to which the file has been read
+        @type offset: C{int}
+
+        @param fingerprint: The fingerprint of the file
+        @type fingerprint: C{str}
+        '''
+        entry = [inode, offset, fingerprint]
+        if self.entries.get(path) == entry:
+            return
+
+        self.entries[path] = entry
+        self.pending += 1
+
+        if self.pending >= self.flush_count or \
+                time.time() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def restore(self, tailed):
+        '''
+        Move a file which has just been opened to the offset it was read
+        up to. A file which has changed since the checkpoint is read from
+        the start, as none of its data has been read
+
+        @param tailed: The file
+        @type tailed: L{TailedFile}
+        '''
+        entry = self.get(tailed.path)
+        if entry:
+            inode, offset, fingerprint = entry
+            tailed.seek(offset if tailed.identifies(inode, fingerprint) else 0)
+
+    def save(self, tailed):
+        '''
+        Record how far a file has been read
+
+        @param tailed: The file
+        @type tailed: L{TailedFile}
+        '''
+        self.update(tailed.path, tailed.inode, tailed.offset,
+                    tailed.fingerprint())
+
+    def remove(self, path):
+        '''
+        Forget the state of a file
+
+        @param path: The path of the file
+        @type path: C{str}
+        '''
+        if self.entries.pop(path, None):
+            self.pending += 1
+
+    def flush(self):
+        '''Write out the checkpoint, replacing the file atomically'''
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as handle:
+            json.dump(self.entries, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        os.rename(temp_path, self.path)
+
+        self.pending = 0
+        self.flushed_at = time.time()
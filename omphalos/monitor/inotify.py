@@ -2,17 +2,29 @@
 Monitoring plugin which uses inotify to tail files
 '''
 
+import glob
 import os
-import time
+from collections import OrderedDict
+from fnmatch import fnmatch
+
 import pyinotify
 
-from monitor.base import Monitor
+from monitor.base import ROTATE_GRACE, Monitor
+from monitor.checkpoint import Checkpoint
+from monitor.tail import TailedFile
+
+# Events on the directories of the followed files. Files in a directory
+# are followed through a single watch on the directory, for detecting
+# files which are modified, created, rotated or deleted
+INOTIFY_MASK = pyinotify.IN_MODIFY | pyinotify.IN_CREATE | \
+    pyinotify.IN_MOVED_TO | pyinotify.IN_MOVED_FROM | pyinotify.IN_DELETE
 
-INOTIFY_MASK = pyinotify.IN_MODIFY | pyinotify.IN_DELETE_SELF
+# The default number of files which are kept open at a time
+MAX_HANDLES = 256
 
-# When a file is opened, read some data from the end of the file to
-# ensure that we have not lost any data
-READ_BACK = 1024
+# The time for which the monitor waits for events before checking on the
+# files which have been replaced, in milliseconds
+POLL_TIMEOUT = 1000
 
 
 class FileMonitor(pyinotify.ProcessEvent):
@@ -27,16 +39,25 @@ class FileMonitor(pyinotify.ProcessEvent):
         '''
         self.monitor = monitor
 
-    def process_IN_DELETE_SELF(self, event):
-        '''Invoked if the file is deleted'''
-
-        # TODO: The behaviour seems to have an issue. Not triggered always
-        time.sleep(2)
-        self.monitor.register(event.pathname)
+    def process_IN_MOVED_FROM(self, event):
+        '''Invoked if a file is moved away (rotated)'''
+        self.monitor.moved(event.pathname)
 
     def process_IN_MODIFY(self, event):
         '''Invoked if the file is modified'''
-        self.monitor.process(event.pathname)
+        self.monitor.modified(event.pathname)
+
+    def process_IN_CREATE(self, event):
+        '''Invoked if a file is created in a directory'''
+        self.monitor.created(event.pathname)
+
+    def process_IN_MOVED_TO(self, event):
+        '''Invoked if a file is moved into a directory'''
+        self.monitor.created(event.pathname)
+
+    def process_IN_DELETE(self, event):
+        '''Invoked if a file is deleted from a directory'''
+        self.monitor.deleted(event.pathname)
 
 
 class MonitorINotify(Monitor):
@@ -45,106 +66,347 @@ class MonitorINotify(Monitor):
         '''
         Initialize the monitoring plugin
 
-        @param conf: A configuration dictionary to be used by the plugin
+        @param conf: A configuration dictionary to be used by the plugin.
+            If 'checkpoint_file' is given, the offsets of the files are
+            kept there, and reading resumes from them after a restart.
+            At most 'max_handles' files are kept open at a time. A file
+            which is replaced by a new file at its path is read until no
+            data has been written to it for 'rotate_grace' seconds
         @type conf: C{dict}
 
         @param transport: A transport instance used by the plugin
         @type conf: L{Transport}
 
-        @param parser: A parser instance used by the plugin
-        @type conf: L{Parser}
+        @param parser: The parser used for all the files, or a function
+            (e.g. a parser class) which returns a parser for a file path,
+            or a dictionary mapping patterns of file paths to either of
+            these. Files which do not match any pattern are ignored
+        @type conf: L{Parser}, C{callable} or C{dict}
 
-        @param paths: A list of paths to monitor
+        @param paths: A list of paths to monitor. These can be files,
+            directories (for all the files in them) or glob patterns. Files
+            which show up later are monitored as well
         @type paths: C{tuple}
         '''
 
         self.transport = transport
-        self.parser = parser
-        self.paths = list(paths)
-        self.handles = {}
-        self.watches = {}
+        self.parsers = parser
+        self.parser = None
+        self.files = {}
 
-        if not self.paths:
+        if not paths:
             raise ValueError('At least one input file must be provided')
 
+        # The file name patterns to follow in every directory
+        self.patterns = {}
+        for path in paths:
+            path = os.path.abspath(path)
+            if os.path.isdir(path):
+                path = os.path.join(path, '*')
+
+            directory, pattern = os.path.split(path)
+            if not os.path.isdir(directory):
+                raise ValueError('Directory does not exist: %s' % directory)
+
+            self.patterns.setdefault(directory, []).append(pattern)
+
+        conf = conf if conf else {}
+        checkpoint_file = conf.get('checkpoint_file')
+        self.checkpoint = Checkpoint(checkpoint_file) if checkpoint_file \
+            else None
+
+        # The files which are open, least recently read first
+        self.max_handles = conf.get('max_handles', MAX_HANDLES)
+        self.handles = OrderedDict()
+
+        # The files which have been replaced by a new file at their path,
+        # and the time data was last read from them. Writers keep writing
+        # to a rotated file until they reopen their log (e.g. nginx, on
+        # USR1), under a name which need not be followed
+        self.rotate_grace = conf.get('rotate_grace', ROTATE_GRACE)
+        self.draining = []
+
         # Initialize the monitors
         self.manager = pyinotify.WatchManager()
         self.monitor = FileMonitor(monitor=self)
-        self.notifier = pyinotify.Notifier(self.manager, self.monitor)
+        self.notifier = pyinotify.Notifier(self.manager, self.monitor,
+                                           timeout=POLL_TIMEOUT)
 
-        for path in self.paths:
-            if not os.path.exists(path):
-                raise ValueError('File does not exist: %s' % path)
-            if not os.path.isfile(path):
-                raise ValueError('Input is not a file: %s' % path)
+        # Watch the directories before reading the files in them, so that
+        # no update is missed
+        self.watches = {}
+        for directory in self.patterns:
+            self.watches.update(self.manager.add_watch(
+                directory, INOTIFY_MASK, rec=False))
 
-            self.handles[path] = None
-            self.register(path)
+        for directory, patterns in self.patterns.iteritems():
+            for pattern in patterns:
+                for path in glob.glob(os.path.join(directory, pattern)):
+                    if path not in self.files and self.follows(path):
+                        self.register(path)
 
-    def register(self, path):
+    def follows(self, path):
         '''
-        Register a file path for monitoring. Also, read the first few
-        lines of data to ensure that we don't lose out on any data
+        Check if a file is to be followed, and set it up if so
+
+        @param path: The path of the file
+        @type path: C{str}
+
+        @return: Whether the file is followed
+        @rtype: C{bool}
         '''
-        try:
-            handle = self.handles[path]
+        if path in self.files:
+            return True
 
-            # Close the file handler first
-            if handle:
-                handle.close()
-                self.handles[path] = None
+        directory, name = os.path.split(path)
+        for pattern in self.patterns.get(directory, ()):
+            if fnmatch(name, pattern):
+                break
+        else:
+            return False
 
-            # Read through the last 1kb of the file
-            handle = open(path, 'r')
+        if not os.path.isfile(path):
+            return False
 
-            file_size = os.fstat(handle.fileno()).st_size
-            if file_size > READ_BACK:
-                handle.seek(-READ_BACK, 2)
+        parser = self.get_parser(path)
+        if parser is None:
+            return False
 
-            self.handles[path] = handle
+        self.files[path] = TailedFile(path, parser)
+        return True
+
+    def register(self, path, offset=None):
+        '''
+        Register a file path for monitoring. Reading resumes from the
+        checkpoint if there is one for the file. Otherwise, the first few
+        lines of data are read to ensure that we don't lose out on any data
+
+        @param path: The path of the file
+        @type path: C{str}
+
+        @param offset: The offset to start reading at, if known
+        @type offset: C{int}
+        '''
+        tailed = self.files[path]
+
+        try:
+            tailed.open(offset)
         except IOError:
-            self.exit()
+            self._forget(path)
             return
 
+        if offset is None and self.checkpoint:
+            self.checkpoint.restore(tailed)
+
         self.process(path)
-        watch = self.manager.add_watch(path, INOTIFY_MASK, rec=False)
-        self.watches.update(watch)
 
     def process(self, path):
-        # There is data to be read
-        handle = self.handles[path]
-        line = handle.readline()
+        '''
+        Read the new data in a file
+
+        @param path: The path of the file
+        @type path: C{str}
+        '''
+        tailed = self.files[path]
+        if not tailed.handle:
+            if tailed.rotated:
+                return
 
-        if not line:
             try:
-                file_size = os.stat(path).st_size
-            except OSError:
-                # File has been deleted
-                self.exit()
+                tailed.resume()
+            except IOError:
+                self._forget(path)
                 return
 
-            if file_size < handle.tell():
+        self._touch(path)
+        handle = tailed.handle
+
+        if not self._read(tailed) and not tailed.rotated:
+            if os.fstat(handle.fileno()).st_size < handle.tell():
                 # Looks the file has been truncated
-                handle.seek(0)
+                tailed.seek(0)
 
-        while line:
-            data = self.parser.parse_line(line.strip())
-            if data:
-                self.transport.send(data)
-            line = handle.readline()
+        if self.checkpoint:
+            self.checkpoint.save(tailed)
 
-    def exit(self):
-        '''Indicate that the monitor must exit'''
-        if self.watches:
-            self.manager.rm_watch(self.watches.values())
+    def _read(self, tailed):
+        '''
+        Read the new data in an open file
+
+        @param tailed: The file
+        @type tailed: L{TailedFile}
+
+        @return: Whether any data was read
+        @rtype: C{bool}
+        '''
+        # Lines are sent through the parser of the file
+        self.parser = tailed.parser
 
-        super(MonitorINotify, self).exit()
+        # There is data to be read. A large backlog (e.g. after a restart
+        # or a burst of traffic) is read in large blocks first
+        partial = self.catch_up(tailed.handle, tailed.partial)
+        read, tailed.partial = self.consume(tailed.handle, partial)
+        return read
+
+    def modified(self, path):
+        '''
+        Read the new data in a file which has been modified
+
+        @param path: The path of the file
+        @type path: C{str}
+        '''
+        tailed = self.files.get(path)
+        if tailed:
+            if not tailed.rotated:
+                self.process(path)
+        elif self.follows(path):
+            # A file which was missed when it was created
+            self.register(path, offset=0)
+        elif self.draining:
+            # Possibly a rotated file which is still being written to
+            self._drain()
+
+    def moved(self, path):
+        '''
+        Drain a file which has been moved away from its path. The file is
+        followed until a new file is created at the path
+
+        @param path: The path of the file
+        @type path: C{str}
+        '''
+        tailed = self.files.get(path)
+        if tailed and not tailed.rotated:
+            # A closed file cannot be opened by its path any more
+            if tailed.handle:
+                self.process(path)
+            tailed.rotated = True
+
+    def deleted(self, path):
+        '''
+        Drain a file which has been deleted, and stop following it
+
+        @param path: The path of the file
+        @type path: C{str}
+        '''
+        tailed = self.files.get(path)
+        if not tailed:
+            return
+
+        if tailed.handle:
+            self.process(path)
+
+        self._forget(path)
+        if self.checkpoint:
+            self.checkpoint.remove(path)
+
+    def created(self, path):
+        '''
+        Start following a file which has been created. If it replaces a
+        followed file, the previous file is drained first
+
+        @param path: The path of the file
+        @type path: C{str}
+        '''
+        tailed = self.files.get(path)
+        if not tailed:
+            if self.follows(path):
+                self.register(path, offset=self._renamed(path))
+            return
+
+        try:
+            if tailed.handle and os.stat(path).st_ino == tailed.inode:
+                # Still the same file
+                return
+        except OSError:
+            return
+
+        if tailed.handle:
+            tailed.rotated = True
+            self.process(path)
+
+            # Keep reading the previous file for a while, and follow the
+            # new one in its place
+            self._replaced(tailed)
+            self.files[path] = TailedFile(path, tailed.parser)
+
+        # All the data in the new file is unread
+        self.register(path, offset=0)
+
+    def _replaced(self, tailed):
+        '''Keep reading a file which has been replaced (see L{Monitor})'''
+        self.handles.pop(tailed.path, None)
+        super(MonitorINotify, self)._replaced(tailed)
+
+    def _renamed(self, path):
+        '''
+        Get the offset to start reading a new file at. If the file is a
+        rotated file which has been moved to a path which is followed as
+        well, it is read from where its previous path left off. Otherwise
+        it is read from the start
+        '''
+        try:
+            inode = os.stat(path).st_ino
+        except OSError:
+            return 0
+
+        for old, tailed in self.files.items():
+            if tailed.rotated and tailed.inode == inode:
+                if tailed.handle:
+                    self.process(old)
+                    offset = tailed.offset
+                else:
+                    offset = tailed.resume_at
+                self._forget(old)
+
+                # Keep waiting for a new file at the previous path
+                self.files[old] = TailedFile(old, tailed.parser)
+                self.files[old].rotated = True
+                return offset
+
+        return 0
+
+    def _touch(self, path):
+        '''
+        Mark an open file as the most recently read one, and close the
+        least recently read files if there are too many open
+        '''
+        handles = self.handles
+        handles.pop(path, None)
+        handles[path] = True
+
+        while len(handles) > self.max_handles:
+            old, _ = handles.popitem(last=False)
+            tailed = self.files[old]
+            if tailed.rotated:
+                # Nothing more will be written to it
+                self._forget(old)
+            else:
+                tailed.suspend()
+
+    def _forget(self, path):
+        '''Stop following a file'''
+        tailed = self.files.pop(path, None)
+        if tailed:
+            tailed.close()
+        self.handles.pop(path, None)
 
     def _check_exit(self, notifier):
+        if self.draining:
+            self._drain()
         return self.check_exit()
 
     def run(self):
         '''
-        Monitor the data source
+        Monitor the data source. The monitor is stopped with L{exit}, from
+        any thread: the files, the watches and the checkpoint are only
+        touched here, and the offsets are written out once it stops
         '''
-        self.notifier.loop(self._check_exit)
+        try:
+            # The watches are removed once the loop stops
+            self.notifier.loop(self._check_exit)
+
+            # Read whatever has been written to the replaced files meanwhile
+            self._drain(final=True)
+        finally:
+            if self.checkpoint:
+                self.checkpoint.flush()
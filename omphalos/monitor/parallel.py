@@ -0,0 +1,146 @@
+'''
+Parallel parsing of large log files, for backfills.
+
+A file is split into ranges of bytes which start and end at line
+boundaries. The ranges are parsed by a pool of processes, each of which
+aggregates the data of its range into an L{Aggregate}. The partial
+aggregates are merged into a single one as they are returned.
+
+Compressed files cannot be split, so each of them is decompressed and
+parsed as a whole by one of the processes.
+'''
+
+import io
+import multiprocessing
+import os
+
+from collector.aggregate import Aggregate
+from common.compression import is_compressed
+from monitor.archive import read_lines
+from monitor.base import READ_SIZE
+from monitor.reader import MappedFile
+
+# The number of ranges handed to each process. Having more ranges than
+# processes evens out the time taken by the slower ranges
+RANGES_PER_JOB = 4
+
+
+def split_file(path, count):
+    '''
+    Split a file into ranges of bytes which start at the beginning of a
+    line and end after a new line (or at the end of the file)
+
+    @param path: The path of the file
+    @type path: C{str}
+
+    @param count: The number of ranges wanted. Small files are split into
+        fewer ranges
+    @type count: C{int}
+
+    @return: The start and end offsets of the ranges
+    @rtype: C{list} of C{tuple}
+    '''
+    size = os.path.getsize(path)
+    count = max(min(count, size / READ_SIZE), 1)
+
+    ranges = []
+    with io.open(path, 'rb') as handle:
+        start = 0
+        for idx in xrange(1, count + 1):
+            if idx == count:
+                end = size
+            else:
+                # Move the boundary up to the end of the line it falls in
+                handle.seek(max(size * idx / count, start))
+                handle.readline()
+                end = handle.tell()
+
+            if end > start:
+                ranges.append((start, end))
+                start = end
+
+    return ranges
+
+
+def parse_range(args):
+    '''
+    Parse a range of bytes of a file and aggregate the data. Run in a
+    separate process
+
+    @param args: The parser class, the path of the file, the start and
+        end offsets of the range (None for the whole file), and the
+        configuration of the aggregate
+    @type args: C{tuple}
+
+    @return: The data aggregated from the range
+    @rtype: L{Aggregate}
+    '''
+    parser_class, path, start, end, conf = args
+
+    parser = parser_class(path)
+    aggregate = Aggregate(conf, 0)
+
+    if start is None:
+        for lines in read_lines(path):
+            aggregate.add_batch(parser.parse_lines(lines))
+        return aggregate
+
+    # The last line need not end with a new line
+    with io.open(path, 'rb') as handle:
+        with MappedFile(handle) as mapped:
+            for lines in mapped.batches(start, end, tail=True):
+                aggregate.add_batch(parser.parse_lines(lines))
+
+    return aggregate
+
+
+def scan(paths, parser_class, jobs=None, conf=None):
+    '''
+    Parse and aggregate whole files using a pool of processes
+
+    @param paths: The path of the file, or a list of paths. Files can be
+        compressed with gzip, bzip2 or xz
+    @type paths: C{str} or C{list}
+
+    @param parser_class: The class of the parser, e.g. L{CLFParser}. It
+        is instantiated with the path of the file in every process
+    @type parser_class: C{type}
+
+    @param jobs: The number of processes (the number of CPUs by default)
+    @type jobs: C{int}
+
+    @param conf: The configuration of the aggregates
+    @type conf: C{dict}
+
+    @return: The data aggregated from all the files
+    @rtype: L{Aggregate}
+    '''
+    jobs = jobs or multiprocessing.cpu_count()
+    conf = conf if conf else {}
+
+    if isinstance(paths, basestring):
+        paths = [paths]
+
+    tasks = []
+    for path in paths:
+        if is_compressed(path):
+            tasks.append((parser_class, path, None, None, conf))
+            continue
+
+        for start, end in split_file(path, jobs * RANGES_PER_JOB):
+            tasks.append((parser_class, path, start, end, conf))
+
+    result = Aggregate(conf, 0)
+    if jobs == 1:
+        for task in tasks:
+            result.add_aggregate(parse_range(task))
+        return result
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for aggregate in pool.imap_unordered(parse_range, tasks):
+            result.add_aggregate(aggregate)
+    finally:
+        pool.terminate()
+
+    return result
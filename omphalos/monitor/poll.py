@@ -1,11 +1,29 @@
 '''
-Monitoring plugin which polls the files at fixed intervals
+Monitoring plugin which polls the files at regular intervals. Useful where
+inotify is not available, e.g. on network file systems.
+
+Every file is polled at its own interval, which is halved whenever new
+data is found in the file and doubled whenever it is idle (within the
+limits 'min_interval' and 'max_interval'). Busy files are then read with
+little delay, while idle files are rarely looked at.
 '''
 
+import glob
+import heapq
 import os
 import time
 
-from monitor.base import Monitor
+from monitor.base import ROTATE_GRACE, Monitor
+from monitor.checkpoint import Checkpoint
+from monitor.tail import TailedFile
+
+# The limits of the polling interval of a file, in seconds
+MIN_INTERVAL = 0.25
+MAX_INTERVAL = 5
+
+# The default time after which a file which has gone missing is forgotten,
+# in seconds
+MISSING_GRACE = 60
 
 
 class Poll(Monitor):
@@ -14,55 +32,228 @@ class Poll(Monitor):
         '''
         Initialize the monitoring plugin
 
-        @param conf: A configuration dictionary to be used by the plugin
+        @param conf: A configuration dictionary to be used by the plugin.
+            'paths' lists the files, directories or glob patterns to be
+            followed ('file_path' for a single file). New files are looked
+            for every 'max_interval' seconds. If 'checkpoint_file' is given,
+            reading resumes from the offsets kept there after a restart.
+            A file which is moved away or replaced by a new file at its path
+            is read until no data has been written to it for 'rotate_grace'
+            seconds. Paths which have been missing for 'missing_grace'
+            seconds are forgotten
         @type conf: C{dict}
 
         @param transport: A transport instance used by the plugin
         @type conf: L{Transport}
 
-        @param parser: A parser instance used by the plugin
+        @param parser: The parser used for all the files, or a function
+            (e.g. a parser class) which returns a parser for a file path,
+            or a dictionary mapping patterns of file paths to either of
+            these (see L{Monitor.get_parser})
         @type conf: L{Parser}
         '''
 
-        self.file_path = conf['file_path']
         self.transport = transport
-        self.parser = parser
-        self.poll = 5
-        self._register()
+        self.parsers = parser
+        self.parser = None
 
-    def _register(self):
-        '''Register for polling the file'''
-        try:
-            self.fd = open(self.file_path)
+        self.patterns = []
+        for path in conf.get('paths') or [conf['file_path']]:
+            path = os.path.abspath(path)
+            if os.path.isdir(path):
+                path = os.path.join(path, '*')
+            self.patterns.append(path)
+
+        self.min_interval = conf.get('min_interval', MIN_INTERVAL)
+        self.max_interval = conf.get('max_interval', MAX_INTERVAL)
+        self.missing_grace = conf.get('missing_grace', MISSING_GRACE)
+
+        # The files which have been moved away or replaced, and the time
+        # data was last read from them (see L{Monitor._replaced})
+        self.rotate_grace = conf.get('rotate_grace', ROTATE_GRACE)
+        self.draining = []
+
+        checkpoint_file = conf.get('checkpoint_file')
+        self.checkpoint = Checkpoint(checkpoint_file) if checkpoint_file \
+            else None
+
+        # The followed files, their polling intervals, and the times at
+        # which they are to be polled next (in order)
+        self.files = {}
+        self.intervals = {}
+        self.schedule = []
+
+        # The times at which the files which are missing were first found
+        # to be missing
+        self.missing = {}
+
+        self.scanned_at = None
+        self._scan()
+
+    def _scan(self):
+        '''Look for files to follow'''
+        for pattern in self.patterns:
+            for path in glob.glob(pattern):
+                if path in self.files or not os.path.isfile(path):
+                    continue
+
+                parser = self.get_parser(path)
+                if parser is None:
+                    continue
+
+                tailed = self.files[path] = TailedFile(path, parser)
+
+                # Files which are there from the start are read like the
+                # inotify monitor does. Files which show up later are new
+                try:
+                    if self.scanned_at is None:
+                        tailed.open()
+                        if self.checkpoint:
+                            self.checkpoint.restore(tailed)
+                    else:
+                        tailed.open(0)
+                except IOError:
+                    del self.files[path]
+                    continue
+
+                self.intervals[path] = self.min_interval
+                heapq.heappush(self.schedule, (0, path))
+
+        self.scanned_at = time.time()
+
+    def _poll(self, path, stat):
+        '''
+        Check a file for new data, given its current status, and read it
+
+        @param path: The path of the file
+        @type path: C{str}
+
+        @param stat: The status of the file at the path, None if missing
+        @type stat: C{posix.stat_result}
+
+        @return: Whether any data was read
+        @rtype: C{bool}
+        '''
+        tailed = self.files[path]
 
-            # Read through the last 1kb of the file
-            file_size = os.stat(self.file_path).st_size
-            if file_size > 1024:
-                self.fd.seek(-1024, 2)
-        except OSError:
-            self.exit()
+        read = False
+        if tailed.handle and (stat is None or stat.st_ino != tailed.inode):
+            # The file has been moved away, deleted or replaced. Drain it,
+            # keep reading it for a while, and wait for a new file at the
+            # path (or read the new one)
+            tailed.rotated = True
+            read = self._read(tailed)
+            self._replaced(tailed)
+            tailed = self.files[path] = TailedFile(path, tailed.parser)
+
+        if stat is None:
+            return read
+
+        if not tailed.handle:
+            tailed.open(0)
+
+        elif stat.st_size < tailed.handle.tell():
+            # Looks the file has been truncated
+            tailed.seek(0)
+
+        elif stat.st_size == tailed.handle.tell():
+            return read
+
+        if not self._read(tailed):
+            return read
+
+        if self.checkpoint:
+            self.checkpoint.save(tailed)
+        return True
+
+    def _read(self, tailed):
+        '''Read the new data in a file'''
+        handle = tailed.handle
+
+        # Lines are sent through the parser of the file
+        self.parser = tailed.parser
+
+        partial = self.catch_up(handle, tailed.partial)
+        read, tailed.partial = self.consume(handle, partial)
+        return read
+
+    def _vanished(self, path, now):
+        '''
+        Check if a missing file has been missing for long enough, and stop
+        following it if so. A new file at the path is picked up by the
+        next scan
+
+        @return: Whether the file is no longer followed
+        @rtype: C{bool}
+        '''
+        since = self.missing.setdefault(path, now)
+        if now - since < self.missing_grace:
+            return False
+
+        self.files.pop(path).close()
+        del self.intervals[path]
+        del self.missing[path]
+
+        if self.checkpoint:
+            self.checkpoint.remove(path)
+        return True
 
     def run(self):
         '''
-        Monitor the data source
+        Monitor the data source, until L{exit} is called. The offsets are
+        written out once the monitor stops
         '''
+        try:
+            self._run()
+
+            # Read whatever has been written to the replaced files meanwhile
+            self._drain(final=True)
+        finally:
+            if self.checkpoint:
+                self.checkpoint.flush()
+
+    def _run(self):
+        '''Poll the files which are due, until the monitor must exit'''
+        schedule = self.schedule
+
         while not self.check_exit():
-            line = self.fd.readline()
+            now = time.time()
+            if now - self.scanned_at >= self.max_interval:
+                self._scan()
 
-            if not line:
+            # Stat all the files which are due in one pass, before reading
+            # any of them
+            due = []
+            while schedule and schedule[0][0] <= now:
+                path = heapq.heappop(schedule)[1]
                 try:
-                    file_size = os.stat(self.file_path).st_size
+                    due.append((path, os.stat(path)))
                 except OSError:
-                    return
+                    due.append((path, None))
+
+            for path, stat in due:
+                try:
+                    read = self._poll(path, stat)
+                except IOError:
+                    read = False
+
+                if stat is not None:
+                    self.missing.pop(path, None)
+                elif self._vanished(path, now):
+                    continue
+
+                interval = self.intervals[path]
+                if read:
+                    interval = max(interval / 2, self.min_interval)
+                else:
+                    interval = min(interval * 2, self.max_interval)
 
-                if file_size < self.fd.tell():
-                    # Looks the file has been truncated
-                    self._register()
+                self.intervals[path] = interval
+                heapq.heappush(schedule, (now + interval, path))
 
-            while line:
-                data = self.parser.parse_line(line.strip())
-                if data:
-                    self.transport.send(data)
-                line = self.fd.readline()
+            if self.draining:
+                self._drain()
 
-            time.sleep(self.poll)
+            delay = schedule[0][0] - time.time() if schedule \
+                else self.max_interval
+            time.sleep(min(max(delay, 0), self.max_interval))
@@ -0,0 +1,116 @@
+'''
+A reader which memory maps log files, for reading large amounts of data
+such as backlogs and whole file scans.
+
+The file is walked by offset. Each batch of lines is sliced out of the
+map in one go, so no read buffers are copied and no partial lines have to
+be joined. Repeated scans of the same file are served from the page cache.
+'''
+
+import io
+import mmap
+import os
+
+# The amount of data handed over as a batch of lines
+BATCH_SIZE = 1024 * 1024
+
+
+class MappedFile(object):
+    '''A read only memory map of the data currently in a file'''
+    def __init__(self, handle):
+        '''
+        Map a file. Data appended to the file later is not mapped
+
+        @param handle: The file to be mapped, opened for reading
+        @type handle: C{file}
+        '''
+        self.size = os.fstat(handle.fileno()).st_size
+
+        # Empty files cannot be mapped
+        self.map = None
+        if self.size:
+            self.map = mmap.mmap(handle.fileno(), self.size,
+                                 access=mmap.ACCESS_READ)
+
+        # The offset up to which the lines have been read
+        self.offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''Unmap the file'''
+        if self.map:
+            self.map.close()
+            self.map = None
+
+    def batches(self, start=0, end=None, tail=False, size=BATCH_SIZE):
+        '''
+        Read the lines in a range of the file, in batches. The offset up to
+        which the lines have been read is kept in 'offset'
+
+        @param start: The offset to start reading from
+        @type start: C{int}
+
+        @param end: The offset to stop reading at (the end of the file by
+            default)
+        @type end: C{int}
+
+        @param tail: Whether to return an incomplete line at the end of the
+            range. Otherwise the reading stops after the last new line
+        @type tail: C{bool}
+
+        @param size: The approximate amount of data in a batch
+        @type size: C{int}
+
+        @return: An iterator over lists of lines
+        @rtype: C{generator}
+        '''
+        end = self.size if end is None else min(end, self.size)
+        self.offset = start
+
+        if not self.map:
+            return
+
+        data = self.map
+        pos = start
+
+        while pos < end:
+            # Break the batch after the last new line within it, or after
+            # the first one beyond it for very long lines
+            stop = min(pos + size, end)
+            newline = data.rfind('\n', pos, stop)
+            if newline < 0:
+                newline = data.find('\n', stop, end)
+            if newline < 0:
+                break
+
+            lines = data[pos:newline].split('\n')
+            pos = self.offset = newline + 1
+            yield lines
+
+        if tail and pos < end:
+            self.offset = end
+            yield [data[pos:end]]
+
+
+def scan_lines(path, size=BATCH_SIZE):
+    '''
+    Read all the lines of a file, in batches
+
+    @param path: The path of the file
+    @type path: C{str}
+
+    @param size: The approximate amount of data in a batch
+    @type size: C{int}
+
+    @return: An iterator over lists of lines
+    @rtype: C{generator}
+    '''
+    with io.open(path, 'rb') as handle:
+        with MappedFile(handle) as mapped:
+            for lines in mapped.batches(tail=True, size=size):
+                yield lines
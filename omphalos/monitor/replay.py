@@ -0,0 +1,112 @@
+'''
+Monitoring plugin which replays whole log files, as fast as they can be
+read and parsed, instead of following them.
+
+Used along with a collector in event time mode (see 'event_time') for
+analysing historical logs. The state of the collector can be reported at
+regular intervals of the time in the logs.
+'''
+
+from datetime import timedelta
+
+from monitor.archive import read_lines
+from monitor.base import Monitor
+
+# Logs are replayed in larger chunks than they are followed
+REPLAY_READ_SIZE = 4 * 1024 * 1024
+
+
+class Replay(Monitor):
+    '''A monitor which reads through files from the start to the end'''
+    def __init__(self, conf, transport, parser, *paths):
+        '''
+        Initialize the monitoring plugin
+
+        @param conf: A configuration dictionary to be used by the plugin.
+            'report' is a function which is called with a timestamp every
+            'report_interval' seconds of log time, and at the end
+        @type conf: C{dict}
+
+        @param transport: A transport instance used by the plugin
+        @type conf: L{Transport}
+
+        @param parser: A parser instance used by the plugin
+        @type conf: L{Parser}
+
+        @param paths: A list of paths to replay, in order. These can be
+            compressed with gzip, bzip2 or xz
+        @type paths: C{tuple}
+        '''
+        self.transport = transport
+        self.parser = parser
+        self.paths = list(paths)
+
+        if not self.paths:
+            raise ValueError('At least one input file must be provided')
+
+        self.report = conf.get('report')
+        interval = conf.get('report_interval', 0)
+        self.report_interval = timedelta(seconds=interval) if interval \
+            else None
+
+        # The log time at which the state has to be reported next
+        self.next_report = None
+        self.last_seen = None
+
+    def run(self):
+        '''
+        Replay the files and report the final state
+        '''
+        for path in self.paths:
+            if self.check_exit():
+                break
+
+            self.replay(path)
+
+        if self.report:
+            self.report(self.last_seen)
+
+    def replay(self, path):
+        '''
+        Replay all the data in a file. Compressed files are decompressed
+        on the fly
+
+        @param path: The path of the file
+        @type path: C{str}
+        '''
+        for lines in read_lines(path, REPLAY_READ_SIZE):
+            if self.check_exit():
+                break
+
+            self.send_lines(lines)
+
+    def send_lines(self, lines):
+        '''
+        Parse a batch of lines and send the data on the transport. The
+        batch is split at the times the state has to be reported at
+
+        @param lines: The lines read from the data source
+        @type lines: C{list}
+        '''
+        batch = self.parser.parse_lines(lines)
+        if not batch:
+            return
+
+        if self.report and self.report_interval:
+            if self.next_report is None:
+                self.next_report = batch[0].timestamp + self.report_interval
+
+            while batch[-1].timestamp >= self.next_report:
+                idx = 0
+                while batch[idx].timestamp < self.next_report:
+                    idx += 1
+
+                if idx:
+                    self.transport.send_batch(batch[:idx])
+                    batch = batch[idx:]
+
+                self.report(self.next_report)
+                self.next_report += self.report_interval
+
+        self.transport.send_batch(batch)
+        self.last_seen = batch[-1].timestamp
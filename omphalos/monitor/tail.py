@@ -0,0 +1,162 @@
+'''
+The state of a file which is being followed by a monitor
+'''
+
+import io
+import os
+import zlib
+
+# When a file is opened without a known offset, read some data from the
+# end of the file to ensure that we have not lost any data
+READ_BACK = 1024
+
+# The amount of data at the start of a file used for identifying it
+FINGERPRINT_SIZE = 1024
+
+
+class TailedFile(object):
+    '''
+    A file which is being followed. The file is identified by its inode
+    and by a fingerprint of its first few bytes, so that it can be told
+    apart from a different file at the same path (after a rotation)
+    '''
+
+    def __init__(self, path, parser=None):
+        '''
+        Initialize the file state
+
+        @param path: The path of the file
+        @type path: C{str}
+
+        @param parser: The parser for the lines of the file
+        @type parser: L{Parser}
+        '''
+        self.path = path
+        self.parser = parser
+        self.handle = None
+        self.inode = None
+
+        # The offset to resume reading at, while the file is suspended
+        self.resume_at = None
+
+        # The incomplete line left over from the last read
+        self.partial = ''
+
+        # Set once the file has been moved or deleted, until a new file
+        # is found at the path
+        self.rotated = False
+
+        self._fingerprint = None
+
+    @property
+    def offset(self):
+        '''The offset up to which the lines of the file have been read'''
+        return self.handle.tell() - len(self.partial)
+
+    def open(self, offset=None):
+        '''
+        Open the file at the path
+
+        @param offset: The offset to start reading at. By default, the
+            last READ_BACK bytes of the file are read
+        @type offset: C{int}
+        '''
+        self.close()
+
+        handle = io.open(self.path, 'rb')
+        stat = os.fstat(handle.fileno())
+        if offset is None:
+            offset = max(stat.st_size - READ_BACK, 0)
+
+        handle.seek(min(offset, stat.st_size))
+
+        self.handle = handle
+        self.inode = stat.st_ino
+        self.partial = ''
+        self.rotated = False
+        self._fingerprint = None
+
+    def close(self):
+        '''Close the file, if it is open'''
+        if self.handle:
+            self.handle.close()
+            self.handle = None
+
+    def suspend(self):
+        '''
+        Close the file to free its handle, remembering where to resume
+        reading. The incomplete line is read again on resuming
+        '''
+        if self.handle:
+            self.resume_at = self.offset
+            self.close()
+
+    def resume(self):
+        '''
+        Open a suspended file again. If a different file is found at the
+        path, it is read from the start
+        '''
+        inode = self.inode
+        self.open(self.resume_at)
+        if self.inode != inode:
+            self.seek(0)
+
+        self.resume_at = None
+
+    def seek(self, offset):
+        '''
+        Start reading the file again from an offset
+
+        @param offset: The offset to start reading at
+        @type offset: C{int}
+        '''
+        self.handle.seek(offset)
+        self.partial = ''
+
+    def fingerprint(self, length=None):
+        '''
+        Get a checksum of the start of the file. Only the data which has
+        already been read (up to FINGERPRINT_SIZE bytes) is used, as that
+        data does not change while the file is being appended to
+
+        @param length: The number of bytes to use, if not the default
+        @type length: C{int}
+
+        @return: The number of bytes used and their checksum
+        @rtype: C{str}
+        '''
+        if length is None:
+            # Once enough data has been read, the fingerprint is fixed
+            if self._fingerprint:
+                return self._fingerprint
+            length = min(self.offset, FINGERPRINT_SIZE)
+
+        position = self.handle.tell()
+        self.handle.seek(0)
+        data = self.handle.read(length)
+        self.handle.seek(position)
+
+        fingerprint = '%d:%08x' % (len(data), zlib.crc32(data) & 0xffffffff)
+        if length == FINGERPRINT_SIZE and len(data) == length:
+            self._fingerprint = fingerprint
+
+        return fingerprint
+
+    def identifies(self, inode, fingerprint):
+        '''
+        Check if the file is the one with the given inode and fingerprint
+
+        @param inode: The inode of the file
+        @type inode: C{int}
+
+        @param fingerprint: The fingerprint of the file
+        @type fingerprint: C{str}
+
+        @return: Whether the file is the same
+        @rtype: C{bool}
+        '''
+        if inode != self.inode:
+            return False
+
+        length = int(fingerprint.split(':')[0])
+        return self.fingerprint(length) == fingerprint
@@ -23,6 +23,17 @@ class Output(object):
         '''
         raise NotImplemented('Not implemented in plugin')
 
+    def view(self):
+        '''
+        Get a consistent view of the data, for a refresh of the output
+
+        @return: The latest snapshot, if the collector publishes them (see
+            L{Snapshotter}), the collector otherwise
+        @rtype: L{Snapshot} or L{Collector}
+        '''
+        get_snapshot = getattr(self.collector, 'get_snapshot', None)
+        return get_snapshot() if get_snapshot else self.collector
+
     def exit(self):
         '''Indicate that the display must stop'''
         self._exit = True
@@ -81,8 +81,9 @@ class Console(Output):
         display = ord('h')
 
         while not self.check_exit():
-            # Get the summary
-            summary = self.collector.get_summary()
+            # Get the summary, and the rest of the data, from the same view
+            collector = self.view()
+            summary = collector.get_summary()
             time = summary.interval
             tstr = []
 
@@ -131,7 +132,7 @@ class Console(Output):
                 stdscr.addstr(ypos, 0, alertstr, curses.color_pair(attr))
 
             # Print the status messages
-            fields = self.collector.get_top('status', 5)
+            fields = collector.get_top('status', 5)
             stdscr.addstr(2, 0, 'Top Status Codes: ')
 
             for status, count in fields:
@@ -141,7 +142,7 @@ class Console(Output):
                               curses.color_pair(color))
 
             # Print the HTTP methods
-            fields = self.collector.get_top('method', 5)
+            fields = collector.get_top('method', 5)
             stdscr.addstr(3, 0, 'Methods: ')
 
             for method, count in fields:
@@ -150,42 +151,45 @@ class Console(Output):
             # Display the requested information
             if display == ord('h'):
                 # Display the top Hits
-                fields = self.collector.get_top('hits', self.top_count)
+                fields = collector.get_top('hits', self.top_count)
                 title, fmt = FORMAT_INFO['hits']
 
                 stdscr.addstr(4, 0, title.ljust(79), curses.A_REVERSE)
+                self._print_error(stdscr, collector, 'hits', fields)
 
                 uris = self._get_print(fields, alerted_uris, alt_key='hits')
 
                 ypos = 5
                 for uri, hits, attr in uris:
-                    size = self.collector.get_uri_data(uri, 'size')
+                    size = collector.get_uri_data(uri, 'size')
                     uri_str = fmt % (uri, hits, size)
                     stdscr.addstr(ypos, 0, uri_str, curses.color_pair(attr))
                     ypos += 1
 
             elif display == ord('b'):
                 # Display the top uris by bytes transferred
-                fields = self.collector.get_top('size', self.top_count)
+                fields = collector.get_top('size', self.top_count)
                 title, fmt = FORMAT_INFO['size']
 
                 stdscr.addstr(4, 0, title.ljust(79), curses.A_REVERSE)
+                self._print_error(stdscr, collector, 'size', fields)
 
                 uris = self._get_print(fields, alerted_uris, alt_key='size')
 
                 ypos = 5
                 for uri, size, attr in uris:
-                    hits = self.collector.get_uri_data(uri, 'hits')
+                    hits = collector.get_uri_data(uri, 'hits')
                     uri_str = fmt % (uri, size, hits)
                     stdscr.addstr(ypos, 0, uri_str, curses.color_pair(attr))
                     ypos += 1
 
             elif display == ord('r'):
                 # Display the top referrers
-                fields = self.collector.get_top('referer', self.top_count)
+                fields = collector.get_top('referer', self.top_count)
                 title, fmt = FORMAT_INFO['referer']
 
                 stdscr.addstr(4, 0, title.ljust(79), curses.A_REVERSE)
+                self._print_error(stdscr, collector, 'referer', fields)
 
                 ypos = 5
                 for ref, hits in fields:
@@ -195,10 +199,11 @@ class Console(Output):
 
             elif display == ord('u'):
                 # Display the top users
-                fields = self.collector.get_top('user', self.top_count)
+                fields = collector.get_top('user', self.top_count)
                 title, fmt = FORMAT_INFO['user']
 
                 stdscr.addstr(4, 0, title.ljust(79), curses.A_REVERSE)
+                self._print_error(stdscr, collector, 'user', fields)
 
                 ypos = 5
                 for user, hits in fields:
@@ -230,6 +235,22 @@ class Console(Output):
             else:
                 pass
 
+    def _print_error(self, stdscr, collector, dtype, fields):
+        '''
+        Print the maximum error in the displayed counts at the end of the
+        title, if the collector is tracking the data set approximately
+        '''
+        if not hasattr(collector, 'get_error'):
+            return
+
+        error = 0
+        for key, value in fields:
+            error = max(error, collector.get_error(dtype, key))
+
+        if error:
+            error_str = '(error <= %d) ' % error
+            stdscr.addstr(4, 79 - len(error_str), error_str, curses.A_REVERSE)
+
     def _get_print(self, sequence, alerted, alt_key=None, prefix=None):
         '''
         Get the information for printing data from a sequence.
@@ -0,0 +1,83 @@
+'''
+Output plugin to print reports of the data as plain text. Useful when the
+output is not a terminal, e.g. when replaying logs
+'''
+
+import sys
+import time
+
+from output.base import Output
+from output.console import FORMAT_INFO
+
+
+class Text(Output):
+    '''An output plugin which prints reports to a stream'''
+    def __init__(self, conf, collector, stream=None):
+        '''
+        Initialize the text output plugin
+
+        @param conf: A configuration dictionary to be used by the plugin
+        @type conf: C{dict}
+
+        @param collector: A collector instance used by the plugin
+        @type conf: L{Collector}
+
+        @param stream: The stream to print to (standard output by default)
+        @type stream: C{file}
+        '''
+        conf = conf if conf else {}
+
+        self.refresh = conf.get('refresh_time', 5)
+        self.top_count = conf.get('top_count', 15)
+
+        self.collector = collector
+        self.stream = stream if stream else sys.stdout
+
+    def run(self):
+        '''
+        Print a report of the data from the collector at regular intervals
+        '''
+        while not self.check_exit():
+            self.report()
+            time.sleep(self.refresh)
+
+    def report(self, timestamp=None):
+        '''
+        Print a report of the data held by the collector
+
+        @param timestamp: The time of the report, if not the current time
+        @type timestamp: L{datetime}
+        '''
+        collector = self.view()
+        summary = collector.get_summary()
+        lines = []
+
+        if timestamp:
+            lines.append('== %s' % timestamp)
+
+        lines.append('Statistics for the last %s' % summary.interval)
+        lines.append('Total: %d total hits %d total bytes transferred' %
+                     (summary.hits, summary.size))
+
+        for dtype, name in (('status', 'Top Status Codes'),
+                            ('method', 'Methods')):
+            fields = collector.get_top(dtype, 5)
+            lines.append('%s: %s' % (name, ' '.join(
+                '%s(%d)' % (key, count) for key, count in fields)))
+
+        for dtype, other in (('hits', 'size'), ('size', 'hits'),
+                             ('referer', None), ('user', None)):
+            title, fmt = FORMAT_INFO[dtype]
+            lines.append('')
+            lines.append(title)
+
+            for key, count in collector.get_top(dtype, self.top_count):
+                if other:
+                    value = collector.get_uri_data(key, other)
+                    lines.append(fmt % (key, count, value))
+                else:
+                    lines.append(fmt % (key, count))
+
+        lines.append('')
+        self.stream.write('\n'.join(lines) + '\n')
+        self.stream.flush()
@@ -27,3 +27,18 @@ class Parser(object):
         @rtype: L{Data}
         '''
         raise NotImplemented('Not implemented in plugin')
+
+    def parse_lines(self, lines):
+        '''
+        Parse a batch of lines in the log file. Lines which cannot be
+        parsed are skipped
+
+        @param lines: The lines that are being parsed
+        @type lines: C{list}
+
+        @return: The parsed data
+        @rtype: C{list} of L{Data}
+        '''
+        parse_line = self.parse_line
+        batch = [parse_line(line.strip()) for line in lines]
+        return [data for data in batch if data]
@@ -3,9 +3,9 @@ Plugin to parse logs in CLF format
 '''
 
 import re
-from datetime import datetime
 from base import Parser
 from base import Data
+from timestamp import TimestampDecoder
 
 CLF_PARTS = [
     r'(?P<host>\S+)',
@@ -21,52 +21,137 @@ CLF_PARTS = [
     r'"(?P<agent>.*)"',
 ]
 
-DATE_FORMAT = '%d/%b/%Y:%H:%M:%S'
-
 
 class CLFParser(Parser):
-    def __init__(self, logpath):
+    def __init__(self, logpath, epoch=False, symbols=None):
         '''
         Initialize the parser plugin
 
         @param logpath: Path the log file which is about to be parsed
         @type conf: C{str}
+
+        @param epoch: Return timestamps as seconds since the epoch
+        @type epoch: C{bool}
+
+        @param symbols: A symbol table for interning strings, which can be
+            shared between parsers. Strings are not interned by default
+        @type symbols: L{SymbolTable}
         '''
+        self.timestamps = TimestampDecoder(epoch=epoch)
+        self.symbols = symbols
         self.clf_regex = re.compile(r'\s+'.join(CLF_PARTS) + r'\s*\Z')
 
     def parse_line(self, line):
         '''Parse a log line in Common Log Format and return the information'''
 
+        fields = self._split_line(line)
+        if fields:
+            return self._make_data(*fields)
+
+        # Not a standard line. Leave it to the regular expression
         match = self.clf_regex.match(line)
         if not match:
             return None
 
         fields = match.groupdict()
+        return self._make_data(fields['user'], fields['datetime'],
+                               fields['method'], fields['uri'],
+                               fields['status'], fields['size'],
+                               fields['referer'])
+
+    def _split_line(self, line):
+        '''
+        Split a log line in the standard format on its delimiters, without
+        using the regular expression. Returns None if the line does not
+        have exactly the expected layout, i.e.
+
+        host ident user [datetime tz] "method uri HTTP/version" status size
+        "referer" "agent"
+
+        The fields returned are those which the regular expression would
+        have matched for such a line.
+        '''
+
+        # The three quoted parts leave exactly seven pieces
+        parts = line.split('"')
+        if len(parts) != 7:
+            return None
+
+        head, request, middle, referer, sep, agent, tail = parts
+
+        # host ident user [datetime tz]
+        tokens = head.split()
+        if len(tokens) != 5 or not head[-1:].isspace() or \
+                not head.startswith(tokens[0]):
+            return None
+
+        host, ident, user, start, end = tokens
+        if start[0] != '[' or end[-1] != ']' or len(start) < 2 or \
+                len(end) < 2:
+            return None
+
+        # method uri HTTP/version
+        tokens = request.split(None, 2)
+        if len(tokens) != 3 or request[0].isspace():
+            return None
+
+        method, uri, version = tokens
+        if not version.startswith('HTTP/') or len(version) < 6:
+            return None
+
+        # status size
+        tokens = middle.split()
+        if len(tokens) != 2 or not middle[0].isspace() or \
+                not middle[-1].isspace():
+            return None
+
+        status, size = tokens
+        if not status.isdigit():
+            return None
+
+        if not sep.isspace() or (tail and not tail.isspace()):
+            return None
+
+        return (user, start[1:] + ' ' + end[:-1], method, uri,
+                status, size, referer)
+
+    def _make_data(self, user, datetime_str, method, uri, status, size,
+                   referer):
+        '''Convert the fields of a log line into the Data'''
 
         # Adjust the time information
-        # TODO: Adjust for timezone info
-        timestamp, tz = fields.pop('datetime').split()
-        fields['timestamp'] = datetime.strptime(timestamp, DATE_FORMAT)
+        timestamp, tz = datetime_str.split()
+        timestamp = self.timestamps.decode_clf(timestamp, tz)
 
         # Adjust other fields accordingly
-        if fields['size'] == '-':
-            fields['size'] = 0
+        if size == '-':
+            size = 0
 
-        if fields['user'] == '-':
-            fields['user'] = None
+        if user == '-':
+            user = None
 
-        if fields['referer'] == '-':
-            fields['referer'] = None
+        if referer == '-':
+            referer = None
 
         # Adjust the URI
-        fields['uri'] = fields['uri'].replace('//', '/').split('/')
-        fields['uri'] = '/'.join(fields['uri'][0:2])
+        uri = uri.replace('//', '/').split('/')
+        uri = '/'.join(uri[0:2])
+
+        # Share the strings with those of earlier lines
+        if self.symbols is not None:
+            intern = self.symbols.intern
+            uri = intern(uri)
+            method = intern(method)
+            status = intern(status)
+
+            if referer:
+                referer = intern(referer)
 
-        fields.pop('agent')
-        fields.pop('host')
-        fields.pop('version')
+            if user:
+                user = intern(user)
 
-        return Data(**fields)
+        return Data(uri=uri, timestamp=timestamp, size=size, status=status,
+                    method=method, referer=referer, user=user)
 
 if __name__ == '__main__':
     import sys
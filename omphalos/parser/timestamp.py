@@ -0,0 +1,162 @@
+'''
+Decoding of the timestamps found in log lines, shared by the parsers
+'''
+
+import calendar
+import time
+from datetime import datetime
+
+CLF_FORMAT = '%d/%b/%Y:%H:%M:%S'
+W3C_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Month names in logs are not localised
+MONTHS = dict((name, idx + 1) for idx, name in enumerate((
+    'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+    'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')))
+
+
+class TimestampDecoder(object):
+    '''
+    Converts the timestamps of log lines into local time L{datetime}
+    objects (or into seconds since the epoch).
+
+    Consecutive lines almost always share the same second, and nearly
+    always the same minute. The decoder remembers the last second it
+    decoded, and the epoch of the last minute, so that only the seconds
+    of a line have to be converted in the common case. Timestamps in an
+    unexpected layout are handed to strptime.
+    '''
+
+    def __init__(self, epoch=False):
+        '''
+        Initialize the decoder
+
+        @param epoch: Return seconds since the epoch instead of datetimes
+        @type epoch: C{bool}
+        '''
+        self.epoch = epoch
+
+        # The last timestamp decoded, its zone (the date for W3C
+        # timestamps) and the result
+        self._value = None
+        self._context = None
+        self._result = None
+
+        # The last minute decoded, and its seconds since the epoch
+        self._minute = None
+        self._minute_context = None
+        self._minute_epoch = None
+
+    def decode_clf(self, value, zone):
+        '''
+        Decode a timestamp from the Common Log Format
+
+        @param value: The timestamp, e.g. 10/Oct/2000:13:55:36
+        @type value: C{str}
+
+        @param zone: The offset from UTC, e.g. -0700
+        @type zone: C{str}
+
+        @return: The decoded timestamp
+        @rtype: L{datetime} or C{int}
+        '''
+        if value == self._value and zone == self._context:
+            return self._result
+
+        if len(value) != 20:
+            stamp = datetime.strptime(value, CLF_FORMAT)
+            return self._cache(value, zone, self._to_epoch(stamp, zone))
+
+        minute = value[:17]
+        if minute != self._minute or zone != self._minute_context:
+            # int() would accept spaces and signs in the fields
+            digits = value[0:2] + value[7:11] + value[12:14] + value[15:17]
+            if value[2] != '/' or value[6] != '/' or value[11] != ':' or \
+                    value[14] != ':' or not digits.isdigit():
+                raise ValueError('Invalid timestamp: %s' % value)
+
+            stamp = datetime(int(value[7:11]), self._month(value[3:6]),
+                             int(value[0:2]), int(value[12:14]),
+                             int(value[15:17]))
+            self._cache_minute(minute, zone, self._to_epoch(stamp, zone))
+
+        return self._cache(value, zone,
+                           self._minute_epoch + self._second(value))
+
+    def decode_w3c(self, date, clock):
+        '''
+        Decode a timestamp from the W3C Extended Log Format. These
+        timestamps are always in UTC.
+
+        @param date: The date, e.g. 2013-02-05
+        @type date: C{str}
+
+        @param clock: The time, e.g. 13:55:36
+        @type clock: C{str}
+
+        @return: The decoded timestamp
+        @rtype: L{datetime} or C{int}
+        '''
+        if clock == self._value and date == self._context:
+            return self._result
+
+        if len(date) != 10 or len(clock) != 8:
+            stamp = datetime.strptime('%s %s' % (date, clock), W3C_FORMAT)
+            return self._cache(clock, date, self._to_epoch(stamp, '+0000'))
+
+        minute = clock[:5]
+        if minute != self._minute or date != self._minute_context:
+            digits = date[0:4] + date[5:7] + date[8:10] + clock[0:2] + \
+                clock[3:5]
+            if date[4] != '-' or date[7] != '-' or clock[2] != ':' or \
+                    not digits.isdigit():
+                raise ValueError('Invalid timestamp: %s %s' % (date, clock))
+
+            stamp = datetime(int(date[0:4]), int(date[5:7]), int(date[8:10]),
+                             int(clock[0:2]), int(clock[3:5]))
+            self._cache_minute(minute, date, self._to_epoch(stamp, '+0000'))
+
+        return self._cache(clock, date,
+                           self._minute_epoch + self._second(clock))
+
+    def _cache(self, value, context, epoch):
+        '''Remember the result of decoding a timestamp and return it'''
+        self._value = value
+        self._context = context
+        self._result = epoch if self.epoch else datetime.fromtimestamp(epoch)
+        return self._result
+
+    def _cache_minute(self, minute, context, epoch):
+        '''Remember the seconds since the epoch of a minute'''
+        self._minute = minute
+        self._minute_context = context
+        self._minute_epoch = epoch
+
+    def _month(self, name):
+        '''Get the number of a month from its abbreviated name'''
+        try:
+            return MONTHS[name]
+        except KeyError:
+            raise ValueError('Invalid month: %s' % name)
+
+    def _second(self, value):
+        '''Get the seconds from the end of a timestamp'''
+        second = value[-2:]
+        if not second.isdigit() or int(second) > 61 or value[-3] != ':':
+            raise ValueError('Invalid timestamp: %s' % value)
+        return int(second)
+
+    def _to_epoch(self, stamp, zone):
+        '''
+        Convert a datetime in the given zone into seconds since the epoch.
+        If the zone cannot be understood, the datetime is taken to be in
+        local time.
+        '''
+        if len(zone) == 5 and zone[0] in '+-' and zone[1:].isdigit():
+            offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+            if zone[0] == '-':
+                offset = -offset
+
+            return calendar.timegm(stamp.timetuple()) - offset
+
+        return int(time.mktime(stamp.timetuple()))
@@ -3,25 +3,34 @@ Plugin to parse logs in W3C log format
 '''
 
 import re
-from datetime import datetime
 from base import Parser
 from base import Data
-
-DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+from timestamp import TimestampDecoder
+from common.compression import open_log
 
 
 class W3CLogParser(Parser):
-    def __init__(self, logpath):
+    def __init__(self, logpath, epoch=False, symbols=None):
         '''
         Initialize the parser plugin
 
         @param logpath: Path the log file which is about to be parsed
         @type conf: C{str}
+
+        @param epoch: Return timestamps as seconds since the epoch
+        @type epoch: C{bool}
+
+        @param symbols: A symbol table for interning strings, which can be
+            shared between parsers. Strings are not interned by default
+        @type symbols: L{SymbolTable}
         '''
+        self.timestamps = TimestampDecoder(epoch=epoch)
+        self.symbols = symbols
 
         fields = []
 
-        with open(logpath) as logfile:
+        # The log may be compressed
+        with open_log(logpath) as logfile:
             for line in logfile:
                 if line.startswith('#Fields'):
                     fields = line.strip().split(' ')[1:]
@@ -48,9 +57,8 @@ class W3CLogParser(Parser):
 
         fields = match.groupdict()
 
-        # Adjust the time information
-        timestamp = '%s %s' % (fields['date'], fields['time'])
-        timestamp = datetime.strptime(timestamp, DATE_FORMAT)
+        # Adjust the time information. W3C logs are always in UTC
+        timestamp = self.timestamps.decode_w3c(fields['date'], fields['time'])
 
         # Adjust other fields accordingly
         if 'size' not in fields:
@@ -71,11 +79,27 @@ class W3CLogParser(Parser):
         uri = uri.replace('//', '/').split('/')
         uri = '/'.join(uri[0:2])
 
+        status = fields['sc_status']
+        method = fields['cs_method']
+        referer = fields['sc_referer']
+        user = fields['cs_username']
+
+        # Share the strings with those of earlier lines
+        if self.symbols is not None:
+            intern = self.symbols.intern
+            uri = intern(uri)
+            method = intern(method)
+            status = intern(status)
+
+            if referer:
+                referer = intern(referer)
+
+            if user:
+                user = intern(user)
+
         return Data(uri=uri, timestamp=timestamp, size=fields['size'],
-                    status=fields['sc_status'],
-                    method=fields['cs_method'],
-                    referer=fields['sc_referer'],
-                    user=fields['cs_username'])
+                    status=status, method=method, referer=referer,
+                    user=user)
 
 if __name__ == '__main__':
     import sys
@@ -0,0 +1,61 @@
+'''
+Tests for the reading of compressed log files
+'''
+
+import bz2
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from monitor import archive
+from monitor.archive import read_blocks
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.chunk_size = archive.CHUNK_SIZE
+
+    def tearDown(self):
+        archive.CHUNK_SIZE = self.chunk_size
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with io.open(path, 'wb') as handle:
+            handle.write(data)
+        return path
+
+    def read(self, path, size=archive.BLOCK_SIZE):
+        blocks = list(read_blocks(path, size))
+        self.assertTrue(all(len(block) <= size for block in blocks))
+        return ''.join(blocks)
+
+    def test_gzip(self):
+        data = ''.join('line %d\n' % i for i in xrange(100000))
+        path = os.path.join(self.directory, 'access.log.gz')
+        with gzip.open(path, 'wb') as handle:
+            handle.write(data)
+        self.assertEqual(self.read(path, 4096), data)
+
+    def test_multiple_streams(self):
+        first = bz2.compress('first\n')
+        second = bz2.compress('second\n')
+        path = self.write('access.log.bz2', first + second + '\0' * 10)
+        self.assertEqual(self.read(path), 'first\nsecond\n')
+
+    def test_stream_at_chunk_boundary(self):
+        # The first stream ends exactly at the end of the first chunk
+        first = bz2.compress('first\n')
+        second = bz2.compress('second\n')
+        archive.CHUNK_SIZE = len(first)
+
+        path = self.write('access.log.bz2', first + second)
+        self.assertEqual(self.read(path), 'first\nsecond\n')
+
+        path = self.write('padded.log.bz2', first + '\0' * len(first))
+        self.assertEqual(self.read(path), 'first\n')
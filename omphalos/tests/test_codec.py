@@ -0,0 +1,124 @@
+'''
+Tests for the frames sent over TCP (and kept in spools)
+'''
+
+import unittest
+import zlib
+from datetime import datetime
+
+from common import codec, wire
+from common.base import Data, Delta
+
+
+def make_batch(count=100):
+    '''Make a batch of data, with a few unset referers and users'''
+    batch = []
+    for i in xrange(count):
+        batch.append(Data('/page/%d' % (i % 7),
+                          datetime(2014, 3, 1, 12, 0, i % 60, i * 1000),
+                          i * 1000 if i % 3 else 70000 * 70000,
+                          '200' if i % 4 else '404', 'GET',
+                          'http://example.com/' if i % 2 else None,
+                          'user%d' % i if i % 5 else None))
+    return batch
+
+
+def make_delta():
+    '''Make a delta, with URIs in two data sets'''
+    return Delta(datetime(2014, 3, 1, 12, 0, 0),
+                 datetime(2014, 3, 1, 12, 0, 10),
+                 5, 5000, {'hits': {'/a': 3, '/b': 2},
+                           'size': {'/a': 3000, '/b': 2000},
+                           'status': {'200': 4, '404': 1}})
+
+
+class CodecTest(unittest.TestCase):
+
+    def decode(self, frame):
+        '''Decode a single frame'''
+        reader = codec.FrameReader()
+        items = reader.feed(frame)
+        self.assertEqual(reader.buffer, '')
+        self.assertEqual(len(items), 1)
+        return items[0]
+
+    def test_batch_round_trip(self):
+        batch = make_batch()
+        for level in (0, 1, 9):
+            self.assertEqual(self.decode(codec.encode(batch, level)), batch)
+
+    def test_delta_round_trip(self):
+        delta = make_delta()
+        for level in (0, 6):
+            self.assertEqual(self.decode(codec.encode(delta, level)), delta)
+
+    def test_empty_delta(self):
+        delta = Delta(datetime(2014, 3, 1), datetime(2014, 3, 1, 0, 0, 10),
+                      0, 0, {})
+        self.assertEqual(self.decode(codec.encode(delta)), delta)
+
+    def test_split_stream(self):
+        batches = [make_batch(10), make_batch(20), make_batch(30)]
+        stream = ''.join(codec.encode(batch, 1) for batch in batches)
+
+        # Every way of splitting the stream in two
+        for split in xrange(len(stream) + 1):
+            reader = codec.FrameReader()
+            items = reader.feed(stream[:split]) + reader.feed(stream[split:])
+            self.assertEqual(items, batches)
+
+    def test_byte_at_a_time(self):
+        reader = codec.FrameReader()
+        items = []
+        for char in codec.encode(make_delta()):
+            items.extend(reader.feed(char))
+        self.assertEqual(items, [make_delta()])
+
+    def test_frame_too_large(self):
+        header = codec.HEADER.pack(codec.MAX_FRAME_SIZE + 1, codec.FLAG_WIRE)
+        self.assertRaises(ValueError, codec.FrameReader().feed, header)
+
+    def test_decompressed_too_large(self):
+        payload = zlib.compress('\0' * (codec.MAX_FRAME_SIZE + 1), 9)
+        self.assertRaises(ValueError, codec.decode_payload,
+                          codec.FLAG_WIRE | codec.FLAG_COMPRESSED, payload)
+
+    def test_invalid_compressed(self):
+        self.assertRaises(ValueError, codec.decode_payload,
+                          codec.FLAG_WIRE | codec.FLAG_COMPRESSED, 'garbage')
+
+    def test_marshalled_rows(self):
+        # Written by earlier versions, and not decoded
+        self.assertRaises(ValueError, codec.decode_payload, 0, '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+    def test_corrupt_payloads(self):
+        for flags, item in ((codec.FLAG_WIRE, make_batch()),
+                            (codec.FLAG_DELTA, make_delta())):
+            payload = codec.encode(item)[codec.HEADER.size:]
+            for end in xrange(len(payload)):
+                self.assertRaises(ValueError, codec.decode_payload, flags,
+                                  payload[:end])
+            self.assertRaises(ValueError, codec.decode_payload, flags,
+                              payload + '\0')
+
+    def test_invalid_delta_id(self):
+        payload = wire.encode_delta(make_delta()._replace(
+            counters={'status': {'200': 1}}))
+
+        # The column of the status ids follows the string, the column of
+        # the number of entries of every data set, and the empty columns
+        # of the hits and the size
+        offset = payload.index('200') + 3 + 1 + len(wire.DELTA_FIELDS) + 4
+        self.assertEqual(payload[offset:offset + 2], '\x01\x01')
+        for value in ('\x00', '\x02'):
+            self.assertRaises(ValueError, wire.decode_delta,
+                              payload[:offset + 1] + value +
+                              payload[offset + 2:])
+
+    def test_unknown_data_set(self):
+        delta = make_delta()._replace(counters={'agent': {'curl': 1}})
+        self.assertRaises(ValueError, codec.encode, delta)
@@ -0,0 +1,119 @@
+'''
+Tests for the monitors which follow log files
+'''
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from monitor.inotify import MonitorINotify
+from monitor.poll import Poll
+
+
+class Lines(object):
+    '''A parser which passes the lines through'''
+
+    def parse_lines(self, lines):
+        return lines
+
+
+class Recorder(object):
+    '''A transport which records the lines sent on it'''
+
+    def __init__(self):
+        self.lines = []
+
+    def send_batch(self, batch):
+        self.lines.extend(batch)
+
+
+def wait_for(condition, timeout=5):
+    '''Wait until a condition holds'''
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class MonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = os.path.join(self.directory, 'access.log')
+        self.checkpoint = os.path.join(self.directory, 'cursor')
+        open(self.log, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def append(self, path, *lines):
+        with open(path, 'a') as handle:
+            handle.write(''.join('%s\n' % line for line in lines))
+
+    def saved_offset(self):
+        with open(self.checkpoint) as handle:
+            return json.load(handle)[self.log][1]
+
+    def inotify(self, transport, **conf):
+        conf['checkpoint_file'] = self.checkpoint
+        return MonitorINotify(conf, transport, Lines(), self.log)
+
+    def poll(self, transport, **conf):
+        conf.update({'paths': [self.log], 'checkpoint_file': self.checkpoint,
+                     'min_interval': 0.01, 'max_interval': 0.05})
+        return Poll(conf, transport, Lines())
+
+    def check_exit(self, make):
+        transport = Recorder()
+        monitor = make(transport)
+        thread = threading.Thread(target=monitor.run)
+        thread.start()
+
+        self.append(self.log, 'a', 'b')
+        self.assertTrue(wait_for(lambda: len(transport.lines) == 2))
+
+        # The offsets are written out by the monitor as it stops
+        monitor.exit()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.saved_offset(), 4)
+
+    def test_inotify_exit(self):
+        self.check_exit(self.inotify)
+
+    def test_poll_exit(self):
+        self.check_exit(self.poll)
+
+    def check_rotation(self, make):
+        transport = Recorder()
+        monitor = make(transport)
+        thread = threading.Thread(target=monitor.run)
+        thread.start()
+
+        try:
+            self.append(self.log, 'a')
+            self.assertTrue(wait_for(lambda: len(transport.lines) == 1))
+
+            # The writer keeps writing to the rotated file for a while
+            rotated = self.log + '.1'
+            os.rename(self.log, rotated)
+            self.append(rotated, 'b')
+            self.assertTrue(wait_for(lambda: len(transport.lines) == 2))
+
+            self.append(self.log, 'c')
+            self.append(rotated, 'd')
+            self.assertTrue(wait_for(lambda: len(transport.lines) == 4))
+            self.assertEqual(sorted(transport.lines), ['a', 'b', 'c', 'd'])
+        finally:
+            monitor.exit()
+            thread.join(5)
+
+    def test_inotify_rotation(self):
+        self.check_rotation(self.inotify)
+
+    def test_poll_rotation(self):
+        self.check_rotation(self.poll)
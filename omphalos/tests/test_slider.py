@@ -0,0 +1,86 @@
+'''
+Tests for the sliding window collector
+'''
+
+import random
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta
+
+from collector.slider import Slider
+from common.base import Data, Delta
+
+START = datetime(2014, 3, 1, 12, 0, 0)
+
+
+def make_data(rng, second):
+    '''Make the data of a second, whose most frequent URI changes often'''
+    batch = []
+    for i in xrange(50):
+        if rng.random() < 0.3:
+            uri = '/hot/%d' % (second // 7)
+        else:
+            uri = '/page/%d' % rng.randint(0, 40)
+        timestamp = START + timedelta(seconds=second, microseconds=i * 1000)
+        batch.append(Data(uri, timestamp, 1, '200', 'GET', None, None))
+    return batch
+
+
+class SliderTest(unittest.TestCase):
+
+    def check_bounds(self, slider, true):
+        '''Check the counts of the window against the real counts'''
+        counter = slider.data['hits']
+        for uri in set(true).union(key for key, _ in counter.iteritems()):
+            if uri in counter:
+                count = counter[uri]
+                error = slider.get_error('hits', uri)
+                self.assertTrue(count - error <= true[uri] <= count,
+                                (uri, count, error, true[uri]))
+            else:
+                self.assertTrue(true[uri] <= counter.bound,
+                                (uri, counter.bound, true[uri]))
+
+    def test_top_bounds_under_expiry(self):
+        conf = {'bucket_size': 1, 'top_capacity': 8, 'event_time': True}
+        slider = Slider(conf, 5)
+        rng = random.Random(1)
+
+        records = []
+        for second in xrange(60):
+            batch = make_data(rng, second)
+            slider.add_batch(batch)
+            records.extend(batch)
+
+            # The window holds the records from the start of its oldest
+            # bucket
+            oldest = slider.timeseries[0].start
+            true = Counter(data.uri for data in records
+                           if data.timestamp >= oldest)
+            self.check_bounds(slider, true)
+            self.assertEqual(slider.get_summary().hits, sum(true.values()))
+
+        self.assertTrue(len(slider.timeseries) < 10)
+
+    def test_top_bounds_with_deltas(self):
+        conf = {'bucket_size': 1, 'top_capacity': 8, 'event_time': True}
+        slider = Slider(conf, 5)
+        rng = random.Random(2)
+
+        deltas = []
+        for second in xrange(60):
+            counts = Counter(data.uri for data in make_data(rng, second))
+            start = START + timedelta(seconds=second)
+            delta = Delta(start, start + timedelta(seconds=1),
+                          sum(counts.values()), 0, {'hits': dict(counts)})
+            slider.add_delta(delta)
+            deltas.append(delta)
+
+            oldest = slider.deltas[0].start
+            true = Counter()
+            for delta in deltas:
+                if delta.start >= oldest:
+                    true.update(delta.counters['hits'])
+            self.check_bounds(slider, true)
+
+        self.assertTrue(len(slider.deltas) < 10)
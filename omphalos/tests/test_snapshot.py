@@ -0,0 +1,38 @@
+'''
+Tests for the snapshots of a collector
+'''
+
+import unittest
+from datetime import datetime
+
+from collector.aggregate import Aggregate
+from collector.snapshot import Snapshotter
+from common.base import Data
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.collector = Aggregate({}, 60)
+        self.snapshotter = Snapshotter({'snapshot_interval': 60,
+                                        'snapshot_count': 3}, self.collector)
+        self.snapshotter.add_batch([
+            Data('/page/%d' % i, datetime.now(), 100, '200', 'GET', None,
+                 None)
+            for i in xrange(5) for _ in xrange(i + 1)])
+
+    def tearDown(self):
+        self.snapshotter.close()
+
+    def test_top(self):
+        snapshot = self.snapshotter.publish()
+        self.assertEqual(snapshot.get_top('hits', 2),
+                         [('/page/4', 5), ('/page/3', 4)])
+        self.assertEqual(snapshot.get_top('status', 3), [('200', 15)])
+
+    def test_more_than_captured(self):
+        snapshot = self.snapshotter.publish()
+        self.assertRaises(ValueError, snapshot.get_top, 'hits', 4)
+
+        # The collector has them
+        self.assertEqual(len(self.snapshotter.get_top('hits', 4)), 4)
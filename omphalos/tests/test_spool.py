@@ -0,0 +1,176 @@
+'''
+Tests for the spool transport
+'''
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zlib
+
+from common import codec
+from tests.test_codec import make_batch, make_delta
+from transport import spool
+from transport.spool import ENTRY, Spool
+
+
+class Recorder(object):
+    '''A transport which records the data handed over to it'''
+
+    def __init__(self, down=False):
+        self.items = []
+        self.down = down
+
+    def send_batch(self, batch):
+        if self.down:
+            raise IOError('The transport is down')
+        self.items.append(batch)
+
+    def send_delta(self, delta):
+        self.send_batch(delta)
+
+
+class Lagging(Recorder):
+    '''A transport which takes the data but does not deliver it'''
+
+    def stats(self):
+        return {'pending': sum(len(item) for item in self.items)}
+
+
+def wait_for(condition, timeout=5):
+    '''Wait until a condition holds, for at most a timeout'''
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class SpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.conf = {'spool_dir': self.directory, 'segment_size': 4096}
+
+        self.close_timeout = spool.CLOSE_TIMEOUT
+        spool.CLOSE_TIMEOUT = 0.2
+
+    def tearDown(self):
+        spool.CLOSE_TIMEOUT = self.close_timeout
+        shutil.rmtree(self.directory)
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.endswith(spool.SEGMENT_SUFFIX))
+
+    def fill(self, transport, batches):
+        '''
+        Spool the batches, and close the spool once the transport has taken
+        them (unless it is down)
+        '''
+        sp = Spool(self.conf, transport)
+        for batch in batches:
+            sp.send_batch(batch)
+
+        if not transport.down:
+            wait_for(lambda: len(transport.items) == len(batches))
+        sp.close()
+        return sp
+
+    def test_round_trip(self):
+        batches = [make_batch(20) for _ in xrange(20)]
+        transport = Recorder()
+        sp = self.fill(transport, batches)
+
+        self.assertEqual(transport.items, batches)
+        self.assertEqual(sp.stats()['lag'], 0)
+        self.assertEqual(len(self.segments()), 1)
+
+    def test_delta(self):
+        transport = Recorder()
+        sp = Spool(self.conf, transport)
+        sp.send_delta(make_delta())
+        self.assertTrue(wait_for(lambda: transport.items))
+        sp.close()
+        self.assertEqual(transport.items, [make_delta()])
+
+    def test_replay_after_restart(self):
+        batches = [make_batch(20) for _ in xrange(20)]
+        self.fill(Recorder(down=True), batches)
+        self.assertTrue(len(self.segments()) > 1)
+
+        transport = Recorder()
+        sp = Spool(self.conf, transport)
+        self.assertTrue(wait_for(lambda: len(transport.items) == 20))
+        sp.close()
+        self.assertEqual(transport.items, batches)
+        self.assertEqual(len(self.segments()), 1)
+
+    def test_not_delivered(self):
+        # The data handed over is replayed until it has been delivered
+        batches = [make_batch(20) for _ in xrange(20)]
+        transport = Lagging()
+        sp = self.fill(transport, batches)
+
+        self.assertEqual(transport.items, batches)
+        self.assertEqual(sp.stats()['delivered'], 0)
+        self.assertEqual(sp.cursor, (0, 0))
+
+        transport = Recorder()
+        sp = Spool(self.conf, transport)
+        self.assertTrue(wait_for(lambda: len(transport.items) == 20))
+        sp.close()
+        self.assertEqual(transport.items, batches)
+
+    def test_partly_written_entry(self):
+        batches = [make_batch(5), make_batch(6)]
+        self.fill(Recorder(down=True), batches)
+
+        with open(os.path.join(self.directory, self.segments()[-1]),
+                  'ab') as handle:
+            handle.write('\0\1\2')
+
+        transport = Recorder()
+        sp = Spool(self.conf, transport)
+        sp.send_batch(make_batch(7))
+        self.assertTrue(wait_for(lambda: len(transport.items) == 3))
+        sp.close()
+        self.assertEqual(transport.items, batches + [make_batch(7)])
+
+    def test_corrupt_entry(self):
+        # The rest of the file after an entry whose CRC does not match is
+        # skipped
+        self.fill(Recorder(down=True), [make_batch(5)])
+        path = os.path.join(self.directory, self.segments()[-1])
+        with open(path, 'r+b') as handle:
+            handle.seek(ENTRY.size + codec.HEADER.size)
+            handle.write('\xff')
+
+        transport = Recorder()
+        sp = Spool(self.conf, transport)
+        sp.send_batch(make_batch(7))
+        self.assertTrue(wait_for(lambda: transport.items))
+        sp.close()
+        self.assertEqual(transport.items, [make_batch(7)])
+
+    def test_undecodable_entry(self):
+        # An entry with a valid CRC which cannot be decoded is skipped
+        frame = codec.HEADER.pack(2, 0) + '[]'
+        self.fill(Recorder(down=True), [make_batch(5)])
+        path = os.path.join(self.directory, self.segments()[-1])
+        with open(path, 'r+b') as handle:
+            payload = handle.read()
+            handle.seek(0)
+            handle.write(ENTRY.pack(zlib.crc32(frame) & 0xffffffff) +
+                         frame + payload)
+
+        transport = Recorder()
+        sp = Spool(self.conf, transport)
+        self.assertTrue(wait_for(lambda: transport.items))
+        sp.close()
+        self.assertEqual(transport.items, [make_batch(5)])
+        self.assertEqual(sp.stats()['dropped'], ENTRY.size + len(frame))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+'''
+Tests for the decoding of the timestamps of log lines
+'''
+
+import unittest
+from datetime import datetime
+
+from parser.timestamp import TimestampDecoder
+
+
+class TimestampTest(unittest.TestCase):
+
+    def test_clf(self):
+        decoder = TimestampDecoder(epoch=True)
+        self.assertEqual(decoder.decode_clf('10/Oct/2000:13:55:36', '-0700'),
+                         971211336)
+        self.assertEqual(decoder.decode_clf('10/Oct/2000:13:55:37', '-0700'),
+                         971211337)
+
+    def test_w3c(self):
+        decoder = TimestampDecoder()
+        self.assertEqual(decoder.decode_w3c('2000-10-10', '20:55:36'),
+                         datetime.fromtimestamp(971211336))
+
+    def test_invalid_clf(self):
+        for value in ('1 /Oct/2000:13:55:36', '+1/Oct/2000:13:55:36',
+                      '10/Oct/ 200:13:55:36', '10/Oct/2000:-1:55:36',
+                      '10/Oct/2000:13: 5:36', '10/Oct/2000:13:55: 6',
+                      '10/Oct/2000 13:55:36', '10/Okt/2000:13:55:36'):
+            decoder = TimestampDecoder()
+            self.assertRaises(ValueError, decoder.decode_clf, value, '+0000')
+
+    def test_invalid_w3c(self):
+        for date, clock in (('2000-1 -10', '13:55:36'),
+                            ('+200-10-10', '13:55:36'),
+                            ('2000-10-10', ' 3:55:36'),
+                            ('2000-10-10', '13:-5:36'),
+                            ('2000/10/10', '13:55:36')):
+            decoder = TimestampDecoder()
+            self.assertRaises(ValueError, decoder.decode_w3c, date, clock)
@@ -0,0 +1,97 @@
+'''
+Tests for the wire format of batches of data
+'''
+
+import unittest
+
+from common import wire
+from common.base import Data
+from tests.test_codec import make_batch
+
+
+class WireTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        batch = make_batch()
+        self.assertEqual(wire.decode_batch(wire.encode_batch(batch)), batch)
+
+    def test_round_trip_epoch_timestamps(self):
+        batch = [data._replace(timestamp=1393675200.25 + i)
+                 for i, data in enumerate(make_batch(10))]
+        self.assertEqual(wire.decode_batch(wire.encode_batch(batch)), batch)
+
+    def test_round_trip_empty(self):
+        self.assertEqual(wire.decode_batch(wire.encode_batch([])), [])
+
+    def test_columns(self):
+        batch = make_batch()
+        columns = wire.decode_columns(wire.encode_batch(batch))
+        self.assertEqual(list(columns['uri']),
+                         [data.uri for data in batch])
+        self.assertEqual(list(columns['size']),
+                         [data.size for data in batch])
+
+    def test_column_widths(self):
+        # Every width packs to the same bytes on every platform
+        for value, width in ((0xff, 1), (0xffff, 2), (0xffffffff, 4),
+                             (0xffffffffffffffff, 8)):
+            parts = []
+            wire._pack_column([value], parts)
+            self.assertEqual(''.join(parts),
+                             chr(width) + '\xff' * width)
+
+        self.assertRaises(ValueError, wire._pack_column, [1 << 64], [])
+
+    def test_truncated(self):
+        payload = wire.encode_batch(make_batch())
+        for end in (0, wire.HEADER.size - 1, wire.HEADER.size,
+                    wire.HEADER.size + 1, len(payload) // 2,
+                    len(payload) - 1):
+            self.assertRaises(ValueError, wire.decode_batch, payload[:end])
+
+    def test_trailing_data(self):
+        for batch in ([], make_batch()):
+            self.assertRaises(ValueError, wire.decode_batch,
+                              wire.encode_batch(batch) + '\0')
+
+    def test_invalid_version(self):
+        payload = wire.encode_batch(make_batch())
+        self.assertRaises(ValueError, wire.decode_batch,
+                          chr(wire.VERSION + 1) + payload[1:])
+
+    def test_invalid_width(self):
+        payload = wire.encode_batch(make_batch())
+        offset = wire.HEADER.size
+        self.assertRaises(ValueError, wire.decode_batch,
+                          payload[:offset] + '\x03' + payload[offset + 1:])
+
+    def test_invalid_string_id(self):
+        batch = [Data('/', 1.0, 1, '200', 'GET', None, None)]
+        payload = wire.encode_batch(batch)
+
+        # The uri column follows the three strings: a byte for its width
+        # and a byte for the id
+        offset = payload.index('GET') + 3 + 1
+        self.assertEqual(payload[offset], '\x01')
+        self.assertRaises(ValueError, wire.decode_batch,
+                          payload[:offset] + '\x04' + payload[offset + 1:])
+
+    def test_string_past_the_end(self):
+        batch = [Data('/', 1.0, 1, '200', 'GET', None, None)]
+        payload = wire.encode_batch(batch)
+
+        # The length of the first string
+        offset = wire.HEADER.size + 1
+        self.assertRaises(ValueError, wire.decode_batch,
+                          payload[:offset] + '\xff' + payload[offset + 1:])
+
+    def test_count_past_the_end(self):
+        payload = wire.encode_batch(make_batch())
+        version, flags, _, strings, base = wire.HEADER.unpack_from(payload)
+        header = wire.HEADER.pack(version, flags, 0xffffffff, strings, base)
+        self.assertRaises(ValueError, wire.decode_batch,
+                          header + payload[wire.HEADER.size:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,6 +23,25 @@ class Transport(object):
         '''
         raise NotImplemented('Not implemented in plugin')
 
+    def send_batch(self, batch):
+        '''
+        Send a batch of data on the transport
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        for data in batch:
+            self.send(data)
+
+    def send_delta(self, delta):
+        '''
+        Send data which has been aggregated at the source on the transport
+
+        @param delta: The aggregated data
+        @type delta: L{Delta}
+        '''
+        raise NotImplemented('Not implemented in plugin')
+
     def recv(self):
         '''
         Get data from the transport
@@ -0,0 +1,162 @@
+'''
+A transport which aggregates data at the source, and sends only the
+aggregated data (deltas) to the next transport.
+
+The data is aggregated over intervals of 'delta_interval' seconds, going
+by its timestamps (aligned to the start of the day). An interval is sent
+once it has ended and a further 'delta_delay' seconds have passed, so that
+lines which are logged late are counted in it. Lines which are later still
+are sent in a delta of their own for the interval. The collector keeps a
+delta as a bucket of the interval (see L{Slider.add_delta}), so summaries
+and top entries are the same as with the records, at the granularity of
+the interval, for a fraction of the network traffic and the work.
+'''
+
+import threading
+from datetime import datetime, timedelta
+
+from base import Transport
+from collector.aggregate import Aggregate
+
+# The default interval over which data is aggregated, in seconds
+DELTA_INTERVAL = 10
+
+# The default time for which an interval is held after it ends, in seconds
+DELTA_DELAY = 2
+
+
+class DeltaTransport(Transport):
+    '''A transport which sends data aggregated over intervals'''
+    def __init__(self, conf, transport):
+        '''
+        Initialize the transport plugin
+
+        @param conf: A configuration dictionary to be used by the plugin.
+            This can have 'delta_interval' and 'delta_delay'
+        @type conf: C{dict}
+
+        @param transport: The transport to send the deltas on
+        @type transport: L{Transport}
+        '''
+        self.transport = transport
+        self.interval = conf.get('delta_interval', DELTA_INTERVAL)
+        self.size = timedelta(seconds=self.interval)
+        self.delay = timedelta(seconds=conf.get('delta_delay', DELTA_DELAY))
+
+        # The data being aggregated for every interval, by its start. The
+        # interval which was added to last is looked up first
+        self.intervals = {}
+        self.current = (None, None, None)
+        self.lock = threading.Lock()
+
+        # Counters of the records aggregated and the deltas sent
+        self.aggregated = 0
+        self.sent = 0
+
+        self.stopped = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_loop)
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def _align(self, timestamp):
+        '''Get the start of the interval a timestamp falls in'''
+        seconds = timestamp.hour * 3600 + timestamp.minute * 60 + \
+            timestamp.second
+        return timestamp.replace(microsecond=0) - \
+            timedelta(seconds=seconds % self.interval)
+
+    def send(self, data):
+        '''
+        Send data on the transport
+
+        @param data: The data that is being collected
+        @type data: L{Data}
+        '''
+        self.send_batch([data])
+
+    def send_batch(self, batch):
+        '''
+        Send a batch of data on the transport. It is added to the data of
+        the intervals it falls in
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        if not batch:
+            return
+
+        with self.lock:
+            start, end, aggregate = self.current
+
+            for data in batch:
+                timestamp = data.timestamp
+                if start is None or not start <= timestamp < end:
+                    start = self._align(timestamp)
+                    end = start + self.size
+
+                    aggregate = self.intervals.get(start)
+                    if aggregate is None:
+                        aggregate = self.intervals[start] = Aggregate({}, 0)
+
+                aggregate._count(data)
+
+            self.current = (start, end, aggregate)
+            self.aggregated += len(batch)
+
+    def send_delta(self, delta):
+        '''
+        Send data which has been aggregated at the source on the transport
+
+        @param delta: The aggregated data
+        @type delta: L{Delta}
+        '''
+        self.transport.send_delta(delta)
+
+    def flush(self, final=False):
+        '''
+        Send the data of the intervals which are over
+
+        @param final: Send the data of all the intervals instead
+        @type final: C{bool}
+        '''
+        with self.lock:
+            now = datetime.now()
+            due = [start for start in self.intervals
+                   if final or start + self.size + self.delay <= now]
+
+            deltas = []
+            for start in sorted(due):
+                aggregate = self.intervals.pop(start)
+                deltas.append(aggregate.get_delta(start, start + self.size))
+
+            if due:
+                self.current = (None, None, None)
+
+        for delta in deltas:
+            self.transport.send_delta(delta)
+            self.sent += 1
+
+    def _flush_loop(self):
+        '''Send the data of the intervals as they are over'''
+        while not self.stopped.wait(min(self.interval, 1)):
+            self.flush()
+
+    def close(self):
+        '''Send the data of all the intervals and stop the flushing thread'''
+        self.stopped.set()
+        self.flusher.join()
+        self.flush(final=True)
+
+    def stats(self):
+        '''
+        Get the statistics of the transport
+
+        @return: The number of records aggregated, of deltas sent and of
+            intervals being aggregated
+        @rtype: C{dict}
+        '''
+        return {
+            'aggregated': self.aggregated,
+            'sent': self.sent,
+            'intervals': len(self.intervals),
+        }
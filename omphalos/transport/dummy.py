@@ -27,3 +27,21 @@ class Dummy(Transport):
         @type data: L{Data}
         '''
         self.collector.add_data(data)
+
+    def send_batch(self, batch):
+        '''
+        Send a batch of data on the transport
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        self.collector.add_batch(batch)
+
+    def send_delta(self, delta):
+        '''
+        Send data which has been aggregated at the source on the transport
+
+        @param delta: The aggregated data
+        @type delta: L{Delta}
+        '''
+        self.collector.add_delta(delta)
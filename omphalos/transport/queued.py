@@ -0,0 +1,275 @@
+'''
+An in process transport which queues data for a collector. The data is
+handed over to the collector in batches by a separate thread, so that
+reading and parsing logs does not wait for a slow collector.
+
+The queue is bounded. When it is full, new data is handled as per the
+overflow policy:
+
+* block: Wait until there is space in the queue
+* drop-oldest: Drop the oldest data in the queue to make space
+* sample: Keep only one in 'sample_rate' new entries (and drop the oldest
+  data if there is still no space). Counts are then lower, by about the
+  sampling rate, while the collector is catching up
+'''
+
+import threading
+from collections import deque
+
+from base import Transport
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+OVERFLOW_SAMPLE = 'sample'
+
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_SAMPLE)
+
+# The default number of entries held in the queue
+QUEUE_SIZE = 100000
+
+# The default number of entries handed over to the collector at a time
+BATCH_SIZE = 5000
+
+# The default rate of sampling when the queue is full
+SAMPLE_RATE = 10
+
+
+class Queued(Transport):
+    '''A transport which queues data for a collector thread'''
+    def __init__(self, conf=None, collector=None):
+        '''
+        Initialize the transport plugin
+
+        @param conf: A configuration dictionary to be used by the plugin.
+            This can have 'queue_size', 'overflow' (the policy), 'batch_size'
+            and 'sample_rate'
+        @type conf: C{dict}
+
+        @param collector: A collector instance for sending data to. If not
+            given, the data has to be taken from the queue with recv()
+        @type collector: L{Collector}
+        '''
+        conf = conf if conf else {}
+
+        self.queue_size = conf.get('queue_size', QUEUE_SIZE)
+        self.batch_size = conf.get('batch_size', BATCH_SIZE)
+        self.sample_rate = conf.get('sample_rate', SAMPLE_RATE)
+        self.overflow = conf.get('overflow', OVERFLOW_BLOCK)
+
+        if self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Invalid overflow policy: %s' % self.overflow)
+
+        # The queue holds batches of data, and the number of entries in
+        # them is kept separately
+        self.queue = deque()
+        self.depth = 0
+        self.condition = threading.Condition()
+
+        # The entries which are being handed over to the collector
+        self.pending = 0
+
+        # Counters of the entries which are sent, delivered, dropped from
+        # the queue, left out by sampling and lost to errors in the
+        # collector
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.sampled = 0
+        self.failed = 0
+
+        self.skipped = 0
+        self.stopped = False
+
+        self.collector = collector
+        self.consumer = None
+
+        if collector is not None:
+            self.consumer = threading.Thread(target=self._consume)
+            self.consumer.daemon = True
+            self.consumer.start()
+
+    def send(self, data):
+        '''
+        Send data on the transport
+
+        @param data: The data that is being collected
+        @type data: L{Data}
+        '''
+        self.send_batch([data])
+
+    def send_batch(self, batch):
+        '''
+        Send a batch of data on the transport
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        if not batch:
+            return
+
+        with self.condition:
+            self.sent += len(batch)
+
+            if self.depth + len(batch) > self.queue_size:
+                batch = self._overflow(batch)
+
+            if batch:
+                self.queue.append(batch)
+                self.depth += len(batch)
+                self.condition.notify_all()
+
+    def _overflow(self, batch):
+        '''
+        Make space in the queue for a batch of data, as per the overflow
+        policy. Called with the lock held
+
+        @return: The data which is to be queued
+        @rtype: C{list} of L{Data}
+        '''
+        if self.overflow == OVERFLOW_BLOCK:
+            # Large batches are let in once the queue is empty
+            while self.depth and not self.stopped and \
+                    self.depth + len(batch) > self.queue_size:
+                self.condition.wait()
+            return batch
+
+        if self.overflow == OVERFLOW_SAMPLE:
+            start = (self.sample_rate - self.skipped) % self.sample_rate
+            sample = batch[start::self.sample_rate]
+
+            self.skipped = (self.skipped + len(batch)) % self.sample_rate
+            self.sampled += len(batch) - len(sample)
+            batch = sample
+
+        # Keep the latest entries of batches larger than the queue
+        if len(batch) > self.queue_size:
+            self.dropped += len(batch) - self.queue_size
+            batch = batch[len(batch) - self.queue_size:]
+
+        # Drop the oldest entries
+        excess = self.depth + len(batch) - self.queue_size
+        while excess > 0:
+            old = self.queue.popleft()
+            if len(old) > excess:
+                self.queue.appendleft(old[excess:])
+                count = excess
+            else:
+                count = len(old)
+
+            self.depth -= count
+            self.dropped += count
+            excess -= count
+
+        return batch
+
+    def recv(self):
+        '''
+        Get data from the transport, waiting for it if required
+
+        @return: The first entry available in the queue
+        @rtype: L{Data}
+        '''
+        batch = self.recv_batch(1)
+        return batch[0] if batch else None
+
+    def recv_batch(self, count=None, timeout=None):
+        '''
+        Get a batch of data from the transport, waiting for it if required
+
+        @param count: The maximum number of entries (all by default)
+        @type count: C{int}
+
+        @param timeout: The maximum time to wait for data, in seconds
+        @type timeout: C{float}
+
+        @return: The oldest entries in the queue, or an empty list if
+            there were none in time (or the transport was closed)
+        @rtype: C{list} of L{Data}
+        '''
+        count = count or self.queue_size
+
+        with self.condition:
+            if not self.queue and not self.stopped:
+                self.condition.wait(timeout)
+
+            batch = []
+            while self.queue and len(batch) < count:
+                old = self.queue.popleft()
+                space = count - len(batch)
+                if len(old) > space:
+                    self.queue.appendleft(old[space:])
+                    old = old[:space]
+
+                batch.extend(old)
+
+            self.depth -= len(batch)
+            self.pending += len(batch)
+            self.condition.notify_all()
+
+        return batch
+
+    def _consume(self):
+        '''Hand the data in the queue over to the collector'''
+        while True:
+            batch = self.recv_batch(self.batch_size)
+            if not batch:
+                if self.stopped:
+                    return
+                continue
+
+            # An error in the collector costs the batch, not the thread
+            try:
+                self.collector.add_batch(batch)
+            except Exception:
+                self._done(len(batch), failed=True)
+            else:
+                self._done(len(batch))
+
+    def _done(self, count, failed=False):
+        '''Mark entries taken from the queue as delivered (or failed)'''
+        with self.condition:
+            self.pending -= count
+            if failed:
+                self.failed += count
+            else:
+                self.delivered += count
+            self.condition.notify_all()
+
+    def flush(self):
+        '''Wait until all the queued data has been delivered'''
+        with self.condition:
+            while (self.depth or self.pending) and self.consumer and \
+                    self.consumer.is_alive():
+                self.condition.wait(0.1)
+
+    def close(self):
+        '''Deliver the queued data and stop the collector thread'''
+        self.flush()
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+        if self.consumer:
+            self.consumer.join()
+
+    def stats(self):
+        '''
+        Get the statistics of the queue
+
+        @return: The number of entries in the queue ('depth'), its size,
+            and the number of entries sent, delivered, dropped, left out by
+            sampling and failed (those of the batches which the collector
+            raised an error for)
+        @rtype: C{dict}
+        '''
+        with self.condition:
+            return {
+                'depth': self.depth,
+                'queue_size': self.queue_size,
+                'sent': self.sent,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'sampled': self.sampled,
+                'failed': self.failed,
+            }
@@ -0,0 +1,573 @@
+'''
+A transport which spools data to disk before sending it on, so that
+following logs goes on at the speed of appending to a file however slow
+(or unreachable) the next transport is.
+
+Batches of data are encoded (see L{common.codec}) and appended to files in
+a directory, each up to 'segment_size' bytes. Every entry is prefixed with
+a CRC32 of its frame, so that a partly written entry (e.g. after a crash)
+is detected. The files are fsync'd every 'fsync_interval' seconds.
+
+A separate thread replays the entries, in order, to the next transport,
+retrying while it fails. An entry counts as delivered once the next
+transport no longer has it pending (see the 'pending' count of its
+stats()), or as soon as it is handed over to a transport which does not
+tell. Delivered goes no further than the next transport: a L{TCPSender}
+is done with data once it has written it to its socket, and nothing tells
+whether the collector received it. Data lost in the network or in a
+failing collector after that is not replayed. How far the entries have
+been delivered is kept in a cursor file, and files are deleted once they
+have been delivered in full. Entries delivered after the cursor was last
+saved are handed over again after a restart. If the files take more than
+'max_bytes', the oldest are dropped.
+'''
+
+import errno
+import io
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+from base import Transport
+from common.base import Delta
+from common.codec import HEADER, decode_payload, encode
+
+# The CRC32 of the frame of an entry
+ENTRY = struct.Struct('!I')
+
+SEGMENT_SUFFIX = '.spool'
+CURSOR_FILE = 'cursor'
+
+# The default size of a file, and of all the files together
+SEGMENT_SIZE = 16 * 1024 * 1024
+MAX_BYTES = 1024 * 1024 * 1024
+
+# The default time between fsyncs of the data, in seconds. The data is
+# fsync'd with every batch if this is 0
+FSYNC_INTERVAL = 1.0
+
+# The time between saves of the cursor, in seconds
+CURSOR_INTERVAL = 1.0
+
+# The default number of records which may wait to be sent by the next
+# transport (if it tells, with stats()) before replaying is held up
+MAX_IN_FLIGHT = 10000
+
+# The limits of the time between attempts to hand data over, in seconds
+MIN_RETRY_INTERVAL = 0.5
+MAX_RETRY_INTERVAL = 30
+
+# The time between checks of the delivery of the data handed over, while
+# there is nothing else to do, in seconds
+ACK_INTERVAL = 0.1
+
+# The maximum time for which closing waits for the data handed over to be
+# delivered, in seconds
+CLOSE_TIMEOUT = 10
+
+
+class Spool(Transport):
+    '''A transport which spools data to disk for another transport'''
+    def __init__(self, conf, transport):
+        '''
+        Initialize the transport plugin, and replay the data which is on
+        disk from an earlier run
+
+        @param conf: A configuration dictionary to be used by the plugin.
+            This has the 'spool_dir' to keep the files in, and can have
+            'segment_size', 'max_bytes', 'fsync_interval', 'compress' (the
+            zlib compression level) and 'max_in_flight'
+        @type conf: C{dict}
+
+        @param transport: The transport to hand the data over to. Use a
+            L{Dummy} transport for handing it over to a collector
+        @type transport: L{Transport}
+        '''
+        self.transport = transport
+        self.directory = conf['spool_dir']
+        self.segment_size = conf.get('segment_size', SEGMENT_SIZE)
+        self.max_bytes = conf.get('max_bytes', MAX_BYTES)
+        self.fsync_interval = conf.get('fsync_interval', FSYNC_INTERVAL)
+        self.level = conf.get('compress', 0)
+        self.max_in_flight = conf.get('max_in_flight', MAX_IN_FLIGHT)
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+
+        # The files, oldest first, with their sizes. The cursor is the
+        # file and the offset up to which the data has been handed over,
+        # and is always in the oldest file
+        self.segments = deque()
+        self.size = 0
+        self._load()
+
+        self.handle = None
+        self.synced_at = time.time()
+        self.saved_at = time.time()
+        self._roll()
+
+        # The positions in the files up to which the data has been handed
+        # over, with the number of records handed over until then, oldest
+        # first. The cursor is moved to them as the data is delivered.
+        # These are used by the replaying thread only, until it stops
+        self.in_flight = deque()
+
+        # Counters of the records appended, replayed (handed over) and
+        # delivered, and of the bytes dropped to keep within 'max_bytes'
+        self.appended = 0
+        self.replayed = 0
+        self.delivered = 0
+        self.dropped = 0
+
+        self.replayer = threading.Thread(target=self._replay_loop)
+        self.replayer.daemon = True
+        self.replayer.start()
+
+    def _path(self, seq):
+        '''Get the path of a file, given its sequence number'''
+        return os.path.join(self.directory, '%012d%s' % (seq, SEGMENT_SUFFIX))
+
+    def _load(self):
+        '''Find the files and the cursor left by an earlier run'''
+        seqs = sorted(int(name[:-len(SEGMENT_SUFFIX)])
+                      for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+        cursor = (0, 0)
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        if os.path.exists(cursor_path):
+            with open(cursor_path) as handle:
+                cursor = tuple(json.load(handle))
+
+        for seq in seqs:
+            if seq < cursor[0]:
+                # Handed over in full before the last run stopped
+                os.remove(self._path(seq))
+                continue
+
+            size = os.path.getsize(self._path(seq))
+            self.segments.append([seq, size])
+            self.size += size
+
+        self.next_seq = seqs[-1] + 1 if seqs else 0
+
+        if self.segments and self.segments[0][0] == cursor[0]:
+            self.cursor = cursor
+        else:
+            self.cursor = (self.segments[0][0] if self.segments
+                           else self.next_seq, 0)
+
+    def _roll(self):
+        '''Start a new file. Called with the lock held'''
+        if self.handle:
+            os.fsync(self.handle.fileno())
+            self.handle.close()
+
+        seq = self.next_seq
+        self.next_seq += 1
+
+        self.handle = io.open(self._path(seq), 'ab', buffering=0)
+        self.segments.append([seq, 0])
+
+        # Drop the oldest files to stay within the limit
+        while self.size > self.max_bytes and len(self.segments) > 1:
+            old, size = self.segments.popleft()
+            self.size -= size
+
+            if self.cursor[0] == old:
+                self.dropped += size - self.cursor[1]
+                self.cursor = (self.segments[0][0], 0)
+                self._save_cursor()
+
+            os.remove(self._path(old))
+
+    def send(self, data):
+        '''
+        Send data on the transport
+
+        @param data: The data that is being collected
+        @type data: L{Data}
+        '''
+        self.send_batch([data])
+
+    def send_batch(self, batch):
+        '''
+        Send a batch of data on the transport. It is appended to the spool,
+        and handed over to the next transport later
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        if batch:
+            self._append(batch, len(batch))
+
+    def send_delta(self, delta):
+        '''
+        Send data which has been aggregated at the source on the transport.
+        It is appended to the spool, and handed over to the next transport
+        later
+
+        @param delta: The aggregated data
+        @type delta: L{Delta}
+        '''
+        self._append(delta, delta.hits)
+
+    def _append(self, item, count):
+        '''
+        Append a batch of data, or a delta, to the spool
+
+        @param item: The data
+        @type item: C{list} of L{Data}, or L{Delta}
+
+        @param count: The number of records in the data
+        @type count: C{int}
+        '''
+        frame = encode(item, self.level)
+        entry = ENTRY.pack(zlib.crc32(frame) & 0xffffffff) + frame
+
+        with self.condition:
+            self.handle.write(entry)
+            self.segments[-1][1] += len(entry)
+            self.size += len(entry)
+            self.appended += count
+
+            if not self.fsync_interval:
+                os.fsync(self.handle.fileno())
+            else:
+                self._sync()
+
+            if self.segments[-1][1] >= self.segment_size:
+                self._roll()
+
+            self.condition.notify()
+
+    def _sync(self):
+        '''fsync the data if it is time to. Called with the lock held'''
+        now = time.time()
+        if now - self.synced_at >= self.fsync_interval:
+            os.fsync(self.handle.fileno())
+            self.synced_at = now
+
+    def _save_cursor(self):
+        '''Save the cursor, replacing the file atomically'''
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + '.tmp', 'w') as handle:
+            json.dump(list(self.cursor), handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        os.rename(path + '.tmp', path)
+        self.saved_at = time.time()
+
+    def _next(self, position):
+        '''
+        Wait for data to be replayed
+
+        @param position: The file (sequence number) and the offset up to
+            which the data has been handed over, None to start from the
+            cursor
+        @type position: C{tuple}
+
+        @return: The file and the offsets between which there is data to
+            be replayed, and whether the file is complete. An empty tuple
+            if there is none yet, but data handed over is to be checked
+            on, and None if the spool is closed
+        @rtype: C{tuple}
+        '''
+        with self.condition:
+            while not self.stopped.is_set():
+                # The data handed over may not be delivered yet
+                seq, offset = self.cursor
+                if position and position[0] >= seq:
+                    seq, offset = position
+
+                index = seq - self.segments[0][0]
+                if index < 0 or index >= len(self.segments):
+                    # The file was dropped in the meantime
+                    seq, offset = self.cursor
+                    index = 0
+
+                end = self.segments[index][1]
+                complete = index < len(self.segments) - 1
+
+                if offset < end or complete:
+                    return seq, offset, end, complete
+
+                if self.in_flight:
+                    self.condition.wait(ACK_INTERVAL)
+                else:
+                    self.condition.wait(self.fsync_interval or None)
+
+                if self.fsync_interval:
+                    self._sync()
+
+                if self.in_flight:
+                    return ()
+
+    def _replay_loop(self):
+        '''Hand the spooled data over to the next transport, in order'''
+        handle = None
+        handle_seq = None
+        position = None
+
+        while True:
+            self._acknowledge()
+
+            work = self._next(position)
+            if work is None:
+                break
+            if not work:
+                continue
+
+            seq, offset, end, complete = work
+            position = (seq, offset)
+            if offset >= end:
+                # The file has been handed over in full
+                self._handed_over(seq, offset, True)
+                position = (seq + 1, 0)
+                continue
+
+            if handle_seq != seq:
+                if handle:
+                    handle.close()
+                try:
+                    handle = io.open(self._path(seq), 'rb')
+                except IOError as exp:
+                    if exp.errno != errno.ENOENT:
+                        raise
+                    # Dropped to stay within the limit
+                    handle = handle_seq = None
+                    continue
+                handle_seq = seq
+
+            handle.seek(offset)
+            while offset < end and not self.stopped.is_set():
+                batch, size = self._read_entry(handle, end - offset)
+                if not size:
+                    # A partly written entry. Skip the rest of the file
+                    offset = end
+                    self._handed_over(seq, offset, False)
+                    break
+
+                if batch is None:
+                    # An entry which cannot be decoded (e.g. one written
+                    # by an earlier version). Skip it
+                    offset += size
+                    self.dropped += size
+                    self._handed_over(seq, offset, False)
+                    continue
+
+                if not self._hand_over(batch):
+                    break
+
+                offset += size
+                self.replayed += batch.hits if isinstance(batch, Delta) \
+                    else len(batch)
+                self._handed_over(seq, offset, False)
+
+            position = (seq, offset)
+            if offset >= end and complete:
+                self._handed_over(seq, offset, True)
+                position = (seq + 1, 0)
+
+        if handle:
+            handle.close()
+
+    def _read_entry(self, handle, available):
+        '''
+        Read an entry from a file
+
+        @param handle: The file
+        @type handle: C{file}
+
+        @param available: The amount of data in the file after the entry
+        @type available: C{int}
+
+        @return: The data (or the delta) in the entry and the size of the
+            entry, None and the size if the entry cannot be decoded, or None
+            and 0 if the entry is not complete
+        @rtype: C{tuple}
+        '''
+        head_size = ENTRY.size + HEADER.size
+        if available < head_size:
+            return None, 0
+
+        head = handle.read(head_size)
+        if len(head) < head_size:
+            return None, 0
+
+        crc, = ENTRY.unpack_from(head)
+        length, flags = HEADER.unpack_from(head, ENTRY.size)
+        if length > available - head_size:
+            return None, 0
+
+        payload = handle.read(length)
+        frame = head[ENTRY.size:] + payload
+        if len(payload) < length or \
+                zlib.crc32(frame) & 0xffffffff != crc:
+            return None, 0
+
+        try:
+            return decode_payload(flags, payload), head_size + length
+        except ValueError:
+            return None, head_size + length
+
+    def _hand_over(self, batch):
+        '''
+        Send a batch (or a delta) to the next transport, retrying while it
+        fails
+
+        @return: Whether the batch was handed over (not if the spool was
+            closed first)
+        @rtype: C{bool}
+        '''
+        retry_interval = MIN_RETRY_INTERVAL
+
+        while not self.stopped.is_set():
+            # Do not run ahead of a transport which is falling behind
+            if self._pending() > self.max_in_flight:
+                self._acknowledge()
+                self.stopped.wait(0.01)
+                continue
+
+            try:
+                if isinstance(batch, Delta):
+                    self.transport.send_delta(batch)
+                else:
+                    self.transport.send_batch(batch)
+                return True
+            except Exception:
+                self.stopped.wait(retry_interval)
+                retry_interval = min(retry_interval * 2, MAX_RETRY_INTERVAL)
+
+        return False
+
+    def _pending(self):
+        '''
+        Get the number of records handed over which the next transport is
+        yet to deliver
+
+        @return: The number of records, 0 if the transport does not tell
+        @rtype: C{int}
+        '''
+        stats = getattr(self.transport, 'stats', None)
+        return stats().get('pending', 0) if stats else 0
+
+    def _handed_over(self, seq, offset, complete):
+        '''
+        Record that the data up to a position has been handed over, and
+        move the cursor past the data which has been delivered
+
+        @param seq: The file the data is in
+        @type seq: C{int}
+
+        @param offset: The offset up to which the data has been handed over
+        @type offset: C{int}
+
+        @param complete: Whether the file has been handed over in full
+        @type complete: C{bool}
+        '''
+        self.in_flight.append((seq, offset, complete, self.replayed))
+        self._acknowledge()
+
+    def _acknowledge(self):
+        '''
+        Move the cursor past the data which the next transport has
+        delivered, i.e. the records handed over which are no longer pending
+        there. This says nothing of whether the collector received them
+        '''
+        if not self.in_flight:
+            return
+
+        self.delivered = self.replayed - self._pending()
+        while self.in_flight and self.in_flight[0][3] <= self.delivered:
+            seq, offset, complete, _ = self.in_flight.popleft()
+            self._advance(seq, offset, complete)
+
+    def _advance(self, seq, offset, complete):
+        '''
+        Move the cursor past data which has been delivered
+
+        @param seq: The file the data is in
+        @type seq: C{int}
+
+        @param offset: The offset up to which the data has been delivered
+        @type offset: C{int}
+
+        @param complete: Whether the file has been delivered in full
+        @type complete: C{bool}
+        '''
+        with self.condition:
+            if self.cursor[0] != seq:
+                # The file was dropped in the meantime
+                return
+
+            if not complete:
+                self.cursor = (seq, offset)
+                if time.time() - self.saved_at >= CURSOR_INTERVAL:
+                    self._save_cursor()
+                return
+
+            # Save the cursor before deleting the file
+            _, size = self.segments.popleft()
+            self.size -= size
+            self.cursor = (self.segments[0][0], 0)
+            self._save_cursor()
+
+        os.remove(self._path(seq))
+
+    def close(self):
+        '''
+        Stop replaying, wait (for up to CLOSE_TIMEOUT seconds) for the data
+        handed over to be delivered, and write out the data and the cursor.
+        The data which is yet to be delivered is replayed on the next run.
+        The next transport is to be closed after the spool
+        '''
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify_all()
+
+        self.replayer.join()
+
+        flush = getattr(self.transport, 'flush', None)
+        if flush and self.in_flight:
+            flush()
+
+        deadline = time.time() + CLOSE_TIMEOUT
+        self._acknowledge()
+        while self.in_flight and time.time() < deadline:
+            time.sleep(ACK_INTERVAL)
+            self._acknowledge()
+
+        with self.condition:
+            os.fsync(self.handle.fileno())
+            self.handle.close()
+            self._save_cursor()
+
+    def stats(self):
+        '''
+        Get the statistics of the spool
+
+        @return: The number of records appended, replayed (handed over)
+            and delivered, the bytes on disk and yet to be delivered
+            ('lag'), and the bytes dropped
+        @rtype: C{dict}
+        '''
+        with self.condition:
+            lag = self.size - self.cursor[1]
+            return {
+                'appended': self.appended,
+                'replayed': self.replayed,
+                'delivered': self.delivered,
+                'bytes': self.size,
+                'segments': len(self.segments),
+                'lag': lag,
+                'dropped': self.dropped,
+            }
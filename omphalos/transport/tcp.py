@@ -0,0 +1,430 @@
+'''
+A transport which sends data to a remote collector over TCP.
+
+The sender buffers data and ships it in batches, as length prefixed frames
+(see L{common.codec}), optionally compressed. A batch is sent once it has
+'flush_size' records, or once its oldest record is 'flush_interval'
+seconds old. The sending is done on a separate thread over a persistent
+connection, which is re-established (with a backoff) if it breaks. A frame
+which could not be written in full when the connection broke is sent again.
+A frame counts as sent once it has been written to the socket, i.e. handed
+over to the local kernel: the receiver does not acknowledge anything, so
+frames still in the socket buffers when the connection breaks (or when the
+receiver fails) are lost.
+
+The receiver accepts connections from any number of senders and hands the
+data over to a local collector. It listens on the loopback interface unless
+given another 'host' (e.g. '0.0.0.0' for every interface). A connection
+which sends anything but valid frames is closed, without affecting the
+others.
+'''
+
+import errno
+import select
+import socket
+import threading
+import time
+from collections import deque
+
+from base import Transport
+from common.base import Delta
+from common.codec import FrameReader, encode
+
+# The default address and port of the receiver
+HOST = 'localhost'
+PORT = 9514
+
+# The default number of records sent in a frame
+FLUSH_SIZE = 1000
+
+# The default time for which data is buffered before sending, in seconds
+FLUSH_INTERVAL = 1.0
+
+# The default number of records held while the receiver is unreachable.
+# The oldest data is dropped beyond this
+MAX_PENDING = 1000000
+
+# The limits of the time between attempts to connect, in seconds
+MIN_RETRY_INTERVAL = 0.5
+MAX_RETRY_INTERVAL = 30
+
+# The time after which connecting or sending is given up, in seconds
+SOCKET_TIMEOUT = 10
+
+# The amount of data read from a connection at a time
+RECV_SIZE = 256 * 1024
+
+
+class TCPSender(Transport):
+    '''A transport which sends data to a L{TCPReceiver}'''
+    def __init__(self, conf):
+        '''
+        Initialize the transport plugin
+
+        @param conf: A configuration dictionary to be used by the plugin.
+            This has the 'host' and the 'port' of the receiver, and can
+            have 'flush_size', 'flush_interval', 'compress' (the zlib
+            compression level) and 'max_pending'
+        @type conf: C{dict}
+        '''
+        self.address = (conf.get('host', 'localhost'), conf.get('port', PORT))
+        self.flush_size = conf.get('flush_size', FLUSH_SIZE)
+        self.flush_interval = conf.get('flush_interval', FLUSH_INTERVAL)
+        self.level = conf.get('compress', 0)
+        self.max_pending = conf.get('max_pending', MAX_PENDING)
+
+        # The data being buffered, and the batches which are ready to be
+        # sent. These are shared with the sending thread
+        self.buffer = []
+        self.buffered_at = None
+        self.batches = deque()
+        self.condition = threading.Condition()
+        self.stopped = False
+
+        # The frames yet to be sent, with the number of records in them.
+        # These are used by the sending thread only
+        self.frames = deque()
+        self.pending = 0
+        self.sock = None
+        self.retry_at = 0
+        self.retry_interval = MIN_RETRY_INTERVAL
+
+        # Counters of the records which are sent and dropped
+        self.sent = 0
+        self.dropped = 0
+
+        self.writer = threading.Thread(target=self._write_loop)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def send(self, data):
+        '''
+        Send data on the transport
+
+        @param data: The data that is being collected
+        @type data: L{Data}
+        '''
+        self.send_batch([data])
+
+    def send_batch(self, batch):
+        '''
+        Send a batch of data on the transport
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        if not batch:
+            return
+
+        with self.condition:
+            if not self.buffer:
+                self.buffered_at = time.time()
+            self.buffer.extend(batch)
+
+            if len(self.buffer) >= self.flush_size:
+                self._seal()
+                self.condition.notify()
+
+    def send_delta(self, delta):
+        '''
+        Send data which has been aggregated at the source on the transport
+
+        @param delta: The aggregated data
+        @type delta: L{Delta}
+        '''
+        with self.condition:
+            self.batches.append(delta)
+            self.condition.notify()
+
+    def _seal(self):
+        '''Mark the buffered data as ready to be sent'''
+        buf = self.buffer
+        for start in xrange(0, len(buf), self.flush_size):
+            self.batches.append(buf[start:start + self.flush_size])
+
+        self.buffer = []
+        self.buffered_at = None
+
+    def _wait_time(self):
+        '''
+        Get the time until the sending thread has something to do
+
+        @return: The time in seconds, None if there is nothing to wait for
+        @rtype: C{float}
+        '''
+        if self.batches or self.stopped:
+            return 0
+
+        times = []
+        if self.buffer:
+            times.append(self.buffered_at + self.flush_interval)
+        if self.frames:
+            times.append(self.retry_at)
+
+        return min(times) - time.time() if times else None
+
+    def _write_loop(self):
+        '''Send the data as it is ready'''
+        while True:
+            with self.condition:
+                wait = self._wait_time()
+                while wait is None or wait > 0:
+                    self.condition.wait(wait)
+                    wait = self._wait_time()
+
+                if self.buffer and (self.stopped or time.time() >=
+                                    self.buffered_at + self.flush_interval):
+                    self._seal()
+
+                # A delta stands for the records aggregated in it. The
+                # records stay pending from the moment they are taken
+                batches = [(batch, batch.hits if isinstance(batch, Delta)
+                            else len(batch)) for batch in self.batches]
+                self.batches.clear()
+                self.pending += sum(count for _, count in batches)
+                stopped = self.stopped
+
+            for batch, count in batches:
+                self.frames.append((encode(batch, self.level), count))
+
+            # Drop the oldest data if the receiver has been unreachable
+            while self.pending > self.max_pending:
+                _, count = self.frames.popleft()
+                self.pending -= count
+                self.dropped += count
+
+            if stopped:
+                # Make one last attempt to send the data
+                self.retry_at = 0
+                self._write()
+                self._disconnect()
+                return
+
+            self._write()
+
+    def _write(self):
+        '''Send the frames which are ready'''
+        if self.sock and self.frames:
+            # The receiver never sends anything. A connection which is
+            # readable has been closed by it, and the data written to it
+            # now would be lost
+            if select.select([self.sock], [], [], 0)[0]:
+                self._disconnect()
+
+        while self.frames:
+            if not self.sock and not self._connect():
+                return
+
+            frame, count = self.frames[0]
+            try:
+                self.sock.sendall(frame)
+            except socket.error:
+                self._disconnect()
+                self._backoff()
+                continue
+
+            self.frames.popleft()
+            self.pending -= count
+            self.sent += count
+
+    def _connect(self):
+        '''
+        Connect to the receiver, unless it is too soon to try again
+
+        @return: Whether there is a connection
+        @rtype: C{bool}
+        '''
+        if time.time() < self.retry_at:
+            return False
+
+        try:
+            sock = socket.create_connection(self.address, SOCKET_TIMEOUT)
+        except socket.error:
+            self._backoff()
+            return False
+
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.retry_interval = MIN_RETRY_INTERVAL
+        return True
+
+    def _backoff(self):
+        '''Wait longer before every attempt to connect which fails'''
+        self.retry_at = time.time() + self.retry_interval
+        self.retry_interval = min(self.retry_interval * 2, MAX_RETRY_INTERVAL)
+
+    def _disconnect(self):
+        '''Close the connection to the receiver'''
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def flush(self):
+        '''Send the buffered data without waiting any longer'''
+        with self.condition:
+            if self.buffer:
+                self._seal()
+                self.condition.notify()
+
+    def close(self):
+        '''Send the buffered data and stop the sending thread'''
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        self.writer.join()
+
+    def stats(self):
+        '''
+        Get the statistics of the transport
+
+        @return: The number of records sent (written to the socket),
+            waiting to be sent ('pending') and dropped
+        @rtype: C{dict}
+        '''
+        with self.condition:
+            buffered = len(self.buffer) + sum(
+                b.hits if isinstance(b, Delta) else len(b)
+                for b in self.batches)
+
+        return {
+            'sent': self.sent,
+            'pending': self.pending + buffered,
+            'dropped': self.dropped,
+        }
+
+
+class TCPReceiver(object):
+    '''Receives data from L{TCPSender}s and adds it to a collector'''
+    def __init__(self, conf, collector):
+        '''
+        Initialize the receiver, and start listening for connections
+
+        @param conf: A configuration dictionary. This can have the 'host'
+            (the loopback interface by default) and the 'port' to listen on
+        @type conf: C{dict}
+
+        @param collector: A collector instance for adding the data to
+        @type collector: L{Collector}
+        '''
+        self.collector = collector
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((conf.get('host', HOST), conf.get('port', PORT)))
+        self.server.listen(socket.SOMAXCONN)
+        self.server.setblocking(0)
+        self.address = self.server.getsockname()
+
+        # The connections, with the frames being read from them
+        self.clients = {}
+
+        # Counters of the records and the frames received, of the
+        # connections closed for sending invalid frames, and of the records
+        # which the collector failed to add
+        self.received = 0
+        self.frames = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def _accept(self):
+        '''Accept the pending connections'''
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except socket.error as exp:
+                if exp.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+
+            sock.setblocking(0)
+            self.clients[sock] = FrameReader()
+
+    def _read(self, sock):
+        '''Read the data available on a connection'''
+        try:
+            chunk = sock.recv(RECV_SIZE)
+        except socket.error as exp:
+            if exp.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            chunk = ''
+
+        if not chunk:
+            self._close(sock)
+            return
+
+        try:
+            batches = self.clients[sock].feed(chunk)
+        except Exception:
+            # The sender is not speaking our protocol
+            self.rejected += 1
+            self._close(sock)
+            return
+
+        for batch in batches:
+            delta = isinstance(batch, Delta)
+            count = batch.hits if delta else len(batch)
+            self.received += count
+            self.frames += 1
+
+            # An error in the collector costs the frame, not the receiver
+            try:
+                if delta:
+                    self.collector.add_delta(batch)
+                else:
+                    self.collector.add_batch(batch)
+            except Exception:
+                self.failed += count
+
+    def stats(self):
+        '''
+        Get the statistics of the receiver
+
+        @return: The number of records and frames received, of connections
+            closed for sending invalid frames ('rejected') and of records
+            which the collector failed to add
+        @rtype: C{dict}
+        '''
+        return {
+            'received': self.received,
+            'frames': self.frames,
+            'rejected': self.rejected,
+            'failed': self.failed,
+        }
+
+    def _close(self, sock):
+        '''Close a connection'''
+        del self.clients[sock]
+        sock.close()
+
+    def exit(self):
+        '''Indicate that the receiver must exit'''
+        self._exit = True
+
+    def check_exit(self):
+        '''Used for checking if the the receiver must exit'''
+        return getattr(self, '_exit', False)
+
+    def run(self):
+        '''
+        Receive data until asked to exit
+        '''
+        try:
+            while not self.check_exit():
+                socks = [self.server] + self.clients.keys()
+                try:
+                    readable = select.select(socks, [], [], 0.5)[0]
+                except select.error as exp:
+                    if exp.args[0] == errno.EINTR:
+                        continue
+                    raise
+
+                for sock in readable:
+                    if sock is self.server:
+                        self._accept()
+                    else:
+                        self._read(sock)
+        finally:
+            for sock in self.clients.keys():
+                self._close(sock)
+            self.server.close()
@@ -0,0 +1,414 @@
+'''
+A lossy transport which sends data to a remote collector over UDP.
+
+Sending never blocks: data which cannot be sent right away is dropped.
+As many records as fit are packed in every datagram, so that it is not
+fragmented on a network with the given 'mtu'. Every datagram has a header
+with a magic number, the version of the format, the id of the sender, a
+sequence number and the number of records in it. The receiver uses the
+sequence numbers to account for the datagrams which are lost.
+'''
+
+import errno
+import random
+import select
+import socket
+import struct
+import threading
+from collections import deque
+
+from base import Transport
+from common import wire
+from common.codec import FLAG_WIRE
+
+# The header of a datagram: the magic number, the version, the flags of
+# the payload (see L{common.codec}), the sender id, the sequence number
+# and the number of records
+HEADER = struct.Struct('!HBBIIH')
+
+MAGIC = 0x4f4d
+VERSION = 1
+
+# The default address and port of the receiver
+HOST = 'localhost'
+PORT = 9515
+
+# The default maximum size of the packets on the network, and the space
+# taken by the IP and the UDP headers in every packet
+MTU = 1500
+IP_UDP_OVERHEAD = 28
+
+# The largest possible datagram
+MAX_DATAGRAM = 65535
+
+# The default time for which data is buffered before sending, in seconds
+FLUSH_INTERVAL = 0.5
+
+# The default size of the receive buffer of the socket
+RECV_BUFFER = 4 * 1024 * 1024
+
+# The maximum number of datagrams read before handing the data over
+DRAIN_COUNT = 1024
+
+SOFT_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+class UDPSender(Transport):
+    '''A transport which sends data to a L{UDPReceiver}'''
+    def __init__(self, conf):
+        '''
+        Initialize the transport plugin
+
+        @param conf: A configuration dictionary to be used by the plugin.
+            This has the 'host' and the 'port' of the receiver, and can have
+            the 'mtu' of the network and the 'flush_interval'
+        @type conf: C{dict}
+        '''
+        host = conf.get('host', 'localhost')
+        self.address = (socket.gethostbyname(host), conf.get('port', PORT))
+        self.payload_size = conf.get('mtu', MTU) - IP_UDP_OVERHEAD - \
+            HEADER.size
+        self.flush_interval = conf.get('flush_interval', FLUSH_INTERVAL)
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(0)
+
+        # A new id for every sender, so that the sequence numbers of a
+        # sender which restarts are not mixed up with the old ones
+        self.sender_id = random.getrandbits(32)
+        self.seq = 0
+
+        # The number of records expected to fit in a datagram, learnt from
+        # the datagrams sent
+        self.estimate = 16
+
+        self.buffer = []
+        self.lock = threading.Lock()
+
+        # Counters of the records and the datagrams sent, and of the
+        # records which could not be sent
+        self.sent = 0
+        self.datagrams = 0
+        self.dropped = 0
+
+        self.stopped = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_loop)
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def send(self, data):
+        '''
+        Send data on the transport
+
+        @param data: The data that is being collected
+        @type data: L{Data}
+        '''
+        self.send_batch([data])
+
+    def send_batch(self, batch):
+        '''
+        Send a batch of data on the transport. The data is sent in full
+        datagrams, and the rest is sent with later data or on a flush
+
+        @param batch: The data that is being collected
+        @type batch: C{list} of L{Data}
+        '''
+        with self.lock:
+            self.buffer.extend(batch)
+            if len(self.buffer) >= self.estimate:
+                self._send(False)
+
+    def flush(self):
+        '''Send the buffered data'''
+        with self.lock:
+            if self.buffer:
+                self._send(True)
+
+    def _flush_loop(self):
+        '''Send the buffered data every 'flush_interval' seconds'''
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def _send(self, final):
+        '''
+        Pack the buffered data into datagrams and send them. Called with
+        the lock held
+
+        @param final: Whether a datagram which is not full is sent as well
+        @type final: C{bool}
+        '''
+        rows = self.buffer
+        dumps = wire.encode_batch
+        limit = self.payload_size
+
+        start = 0
+        while start < len(rows):
+            count = min(self.estimate, len(rows) - start)
+            if count < self.estimate and not final:
+                break
+
+            payload = dumps(rows[start:start + count])
+            while len(payload) > limit and count > 1:
+                count = max(min(count - 1, count * limit / len(payload)), 1)
+                payload = dumps(rows[start:start + count])
+
+            if len(payload) > limit:
+                # A record which does not fit in a datagram by itself
+                self.dropped += 1
+                start += 1
+                continue
+
+            self._sendto(FLAG_WIRE, count, payload)
+            start += count
+
+            # Fill the next datagrams as much as this one
+            self.estimate = min(max(count * limit / len(payload), 1),
+                                0xffff)
+
+        self.buffer = self.buffer[start:]
+
+    def _sendto(self, flags, count, payload):
+        '''Send a datagram, dropping it if it cannot be sent right away'''
+        header = HEADER.pack(MAGIC, VERSION, flags, self.sender_id,
+                             self.seq, count)
+        self.seq = (self.seq + 1) & 0xffffffff
+
+        try:
+            self.sock.sendto(header + payload, self.address)
+        except socket.error:
+            # The receiver accounts for it as a lost datagram
+            self.dropped += count
+            return
+
+        self.sent += count
+        self.datagrams += 1
+
+    def close(self):
+        '''Send the buffered data and stop the flushing thread'''
+        self.stopped.set()
+        self.flusher.join()
+        self.flush()
+        self.sock.close()
+
+    def stats(self):
+        '''
+        Get the statistics of the transport
+
+        @return: The number of records and datagrams sent, and the number
+            of records dropped
+        @rtype: C{dict}
+        '''
+        return {
+            'sent': self.sent,
+            'datagrams': self.datagrams,
+            'dropped': self.dropped,
+        }
+
+
+class UDPReceiver(Transport):
+    '''Receives data from L{UDPSender}s'''
+    def __init__(self, conf, collector=None):
+        '''
+        Initialize the receiver, and bind it to its port
+
+        @param conf: A configuration dictionary. This can have the 'host'
+            (the loopback interface by default) and the 'port' to listen
+            on, and the size of the receive buffer of the socket
+            ('recv_buffer')
+        @type conf: C{dict}
+
+        @param collector: A collector instance for adding the data to, when
+            the receiver is run. Otherwise the data is taken with recv()
+        @type collector: L{Collector}
+        '''
+        self.collector = collector
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                             conf.get('recv_buffer', RECV_BUFFER))
+        self.sock.bind((conf.get('host', HOST), conf.get('port', PORT)))
+        self.sock.setblocking(0)
+        self.address = self.sock.getsockname()
+
+        # The data received and not yet taken with recv()
+        self.pending = deque()
+
+        # The highest sequence number seen from every sender, and the
+        # number of datagrams received, lost and received out of order
+        self.senders = {}
+
+        # Counters of the records and the datagrams received, of the
+        # datagrams which are not valid, and of the records which the
+        # collector failed to add
+        self.received = 0
+        self.datagrams = 0
+        self.invalid = 0
+        self.failed = 0
+
+    def _account(self, sender_id, seq):
+        '''Account for a datagram with a sequence number from a sender'''
+        sender = self.senders.get(sender_id)
+        if sender is None:
+            self.senders[sender_id] = [seq, 1, 0, 0]
+            return
+
+        sender[1] += 1
+        gap = (seq - sender[0]) & 0xffffffff
+        if gap == 0:
+            return
+
+        if gap < 0x80000000:
+            # The datagrams in between are missing
+            sender[0] = seq
+            sender[2] += gap - 1
+        else:
+            # A datagram which was counted as lost arrived late
+            sender[2] -= 1
+            sender[3] += 1
+
+    def _decode(self, datagram):
+        '''
+        Decode a datagram
+
+        @return: The data in the datagram, None if it is not valid
+        @rtype: C{list} of L{Data}
+        '''
+        if len(datagram) < HEADER.size:
+            return None
+
+        magic, version, flags, sender_id, seq, count = \
+            HEADER.unpack_from(datagram)
+        if magic != MAGIC or version != VERSION:
+            return None
+
+        if not flags & FLAG_WIRE:
+            return None
+
+        # Anything could arrive on the port
+        try:
+            batch = wire.decode_batch(datagram[HEADER.size:])
+        except Exception:
+            return None
+
+        if len(batch) != count:
+            return None
+
+        self._account(sender_id, seq)
+        return batch
+
+    def _drain(self):
+        '''
+        Read the datagrams which have arrived
+
+        @return: The data in them
+        @rtype: C{list} of L{Data}
+        '''
+        batch = []
+        for _ in xrange(DRAIN_COUNT):
+            try:
+                datagram = self.sock.recv(MAX_DATAGRAM)
+            except socket.error as exp:
+                if exp.errno in SOFT_ERRORS:
+                    break
+                raise
+
+            data = self._decode(datagram)
+            if data is None:
+                self.invalid += 1
+                continue
+
+            batch.extend(data)
+            self.datagrams += 1
+
+        self.received += len(batch)
+        return batch
+
+    def _wait(self, timeout):
+        '''Wait for datagrams to arrive, for at most a timeout'''
+        try:
+            select.select([self.sock], [], [], timeout)
+        except select.error as exp:
+            if exp.args[0] != errno.EINTR:
+                raise
+
+    def recv(self):
+        '''
+        Get data from the transport, waiting for it if required
+
+        @return: The first entry available
+        @rtype: L{Data}
+        '''
+        while not self.pending:
+            self._wait(None)
+            self.pending.extend(self._drain())
+
+        return self.pending.popleft()
+
+    def recv_batch(self, timeout=None):
+        '''
+        Get the data which has arrived, waiting for it if required
+
+        @param timeout: The maximum time to wait for data, in seconds
+        @type timeout: C{float}
+
+        @return: The data, or an empty list if there was none in time
+        @rtype: C{list} of L{Data}
+        '''
+        if not self.pending:
+            self._wait(timeout)
+            self.pending.extend(self._drain())
+
+        batch = list(self.pending)
+        self.pending.clear()
+        return batch
+
+    def exit(self):
+        '''Indicate that the receiver must exit'''
+        self._exit = True
+
+    def check_exit(self):
+        '''Used for checking if the the receiver must exit'''
+        return getattr(self, '_exit', False)
+
+    def run(self):
+        '''
+        Receive data and add it to the collector, until asked to exit
+        '''
+        try:
+            while not self.check_exit():
+                batch = self.recv_batch(0.5)
+                if not batch:
+                    continue
+
+                # An error in the collector costs the batch, not the
+                # receiver
+                try:
+                    self.collector.add_batch(batch)
+                except Exception:
+                    self.failed += len(batch)
+        finally:
+            self.sock.close()
+
+    def stats(self):
+        '''
+        Get the statistics of the receiver
+
+        @return: The number of records and datagrams received, the number
+            of datagrams which are lost, received out of order and not
+            valid, the rate of loss, and the number of records which the
+            collector failed to add
+        @rtype: C{dict}
+        '''
+        lost = sum(sender[2] for sender in self.senders.values())
+        reordered = sum(sender[3] for sender in self.senders.values())
+        expected = self.datagrams + lost
+
+        return {
+            'received': self.received,
+            'datagrams': self.datagrams,
+            'lost': lost,
+            'reordered': reordered,
+            'invalid': self.invalid,
+            'loss_rate': float(lost) / expected if expected else 0.0,
+            'failed': self.failed,
+        }